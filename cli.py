@@ -0,0 +1,403 @@
+"""
+Консольный интерфейс для массовых операций с телефонным справочником.
+
+Модуль не импортирует PyQt и загружает тяжёлые зависимости только для выбранной команды,
+поэтому подходит для запуска из скриптов и cron.
+
+Примеры:
+    python cli.py generate 100000
+    python cli.py partition-entries 8 && python cli.py generate 10000000 --workers 8
+    python cli.py export entries.csv
+    python cli.py find-phone "+7 912" --prefix
+    python cli.py find-name "Кузнецев Иван" --matches
+    python cli.py find-duplicates --remove --yes
+    python cli.py merge-duplicates --similar --yes
+    python cli.py stats streets --limit 10 --distribution
+    python cli.py snapshot save large
+"""
+import sys
+import time
+import argparse
+from typing import Optional
+
+from loguru import logger
+
+from database.connection import Connection
+
+
+class ProgressReporter:
+    """Вывод прогресса и скорости обработки в stderr не чаще, чем раз в interval секунд"""
+
+    def __init__(self, action: str, total: Optional[int] = None, interval: float = 0.5):
+        self.action = action
+        self.total = total
+        self.interval = interval
+        self.started = time.perf_counter()
+        self.last_report = 0.0
+        self.done = 0
+
+    def _write(self, end: str) -> None:
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0
+        progress = f"{self.done}/{self.total}" if self.total else str(self.done)
+        sys.stderr.write(f"\r{self.action}: {progress} за {elapsed:.1f} с ({rate:,.0f} строк/с){end}")
+        sys.stderr.flush()
+
+    def update(self, done: int, total: Optional[int] = None) -> None:
+        self.done = done
+        self.total = total or self.total
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self._write("")
+
+    def finish(self, done: Optional[int] = None) -> None:
+        if done is not None:
+            self.done = done
+        self._write("\n")
+
+
+def _connect(apply_migrations: bool = True) -> Connection:
+    from database.migrations import migrate
+    from database.storage import create_connection
+
+    connection = create_connection()
+    connection.connect()
+    if apply_migrations:
+        migrate(connection)
+    return connection
+
+
+def command_migrate(args) -> int:
+    connection = _connect()
+    if args.verify:
+        from database.migrations import verify_plans
+
+        issues = verify_plans(connection, args.min_rows)
+        for issue in issues:
+            print(f"{issue.query}: {issue.message} (~{issue.estimated_rows:.0f} строк)")
+        return 1 if issues else 0
+    return 0
+
+
+def command_generate(args) -> int:
+    from modules.generate import fill_database
+
+    connection = _connect()
+    reporter = ProgressReporter("Генерация", args.count)
+    reporter.finish(fill_database(args.count, connection, args.chunk_size, reporter.update, args.workers))
+    return 0
+
+
+def command_partition(args) -> int:
+    from database.partitions import partition_entries
+
+    partition_entries(_connect(), args.partitions)
+    return 0
+
+
+def command_reset(args) -> int:
+    from modules.reset import reset_database
+
+    if not args.yes:
+        print("Для сброса базы данных укажите --yes", file=sys.stderr)
+        return 2
+    reset_database(_connect())
+    return 0
+
+
+def command_merge_duplicates(args) -> int:
+    from database.migrations import find_duplicate_values, migrate
+    from modules.merge import merge_duplicate_values
+
+    connection = _connect(apply_migrations=False)
+    with connection.cursor() as cursor:
+        duplicates = find_duplicate_values(cursor)
+    if not duplicates:
+        print("Повторяющихся значений нет")
+    elif not args.yes:
+        for table_name, values in duplicates.items():
+            print(f"{table_name}: {', '.join(values)}")
+        print("Для объединения значений укажите --yes", file=sys.stderr)
+        return 2
+    else:
+        for table_name, removed in merge_duplicate_values(connection, list(duplicates)).items():
+            print(f"{table_name}: удалено повторяющихся значений {removed}")
+    migrate(connection)
+    if args.similar:
+        return _merge_similar_values(connection, args.yes)
+    return 0
+
+
+def _merge_similar_values(connection: Connection, confirmed: bool) -> int:
+    from database.migrations import LOOKUP_TABLES
+    from modules.merge import find_similar_values, merge_values
+
+    similar = {table_name: find_similar_values(connection, table_name) for table_name in LOOKUP_TABLES}
+    similar = {table_name: merges for table_name, merges in similar.items() if merges}
+    if not similar:
+        print("Похожих значений нет")
+        return 0
+    if not confirmed:
+        for table_name, merges in similar.items():
+            print(f"{table_name}: похожих значений {sum(map(len, merges.values()))} в {len(merges)} группах")
+        print("Для объединения значений укажите --yes", file=sys.stderr)
+        return 2
+    for table_name, merges in similar.items():
+        reporter = ProgressReporter(f"Объединение {table_name}", sum(map(len, merges.values())))
+        moved, removed = merge_values(connection, table_name, merges, reporter.update)
+        reporter.finish()
+        print(f"{table_name}: объединено значений {removed}, перенесено записей {moved}")
+    return 0
+
+
+def command_import(args) -> int:
+    from modules.transfer import import_entries
+
+    connection = _connect()
+    reporter = ProgressReporter("Импорт")
+    report = import_entries(args.path, connection, args.chunk_size, reporter.update, args.start_line)
+    reporter.finish(report.processed)
+    for error in report.errors:
+        print(f"Строка {error.line}: {error.message}", file=sys.stderr)
+    print(f"Импортировано записей: {report.imported}, строк с ошибками: {report.error_count}")
+    if report.failure:
+        print(f"Импорт остановлен ошибкой базы данных: {report.failure}\n"
+              f"Продолжить: python cli.py import {args.path} --start-line {report.resume_line}", file=sys.stderr)
+        return 2
+    return 1 if report.error_count else 0
+
+
+def command_export(args) -> int:
+    from modules.transfer import export_entries
+
+    connection = _connect()
+    reporter = ProgressReporter("Экспорт")
+    reporter.finish(export_entries(args.path, connection, reporter.update))
+    return 0
+
+
+def command_find_phone(args) -> int:
+    from database.storage import create_entry_table
+
+    entries = create_entry_table(_connect())
+    if args.prefix:
+        found = entries.find_by_phone_prefix(args.phone, args.limit)
+    else:
+        found = entries.find_by_phone(args.phone)
+    for entry in found:
+        print(f"{entry['entry_id']}\t{entry['phone']}")
+    return 0 if found else 1
+
+
+def command_find_name(args) -> int:
+    from database.storage import create_entry_table
+    from modules.duplicates import get_entry_labels
+
+    connection = _connect()
+    entries = create_entry_table(connection)
+    if args.matches:
+        for word, matches in zip(args.text.split(), entries.match_values(args.text)):
+            for match in matches:
+                print(f"{word}\t{match.table_name}\t{match.value}\t{match.distance}")
+    found = entries.find_similar(args.text, args.limit)
+    labels = get_entry_labels(connection, [entry["entry_id"] for entry in found])
+    for entry in found:
+        print(f"{entry['entry_id']}\t" + "\t".join(map(str, labels[entry["entry_id"]])))
+    return 0 if found else 1
+
+
+def command_find_duplicates(args) -> int:
+    from modules.duplicates import find_duplicates, remove_duplicates
+
+    connection = _connect()
+    reporter = None if args.exact_only else ProgressReporter("Поиск похожих записей")
+    groups = find_duplicates(connection, near=reporter is not None, progress=reporter and reporter.update)
+    if reporter:
+        reporter.finish()
+    for group in groups:
+        print(f"{group.description}: {', '.join(map(str, group.entry_ids))}")
+    print(f"Найдено групп: {len(groups)}")
+    if args.remove:
+        if not args.yes:
+            print("Для удаления повторов укажите --yes", file=sys.stderr)
+            return 2
+        print(f"Удалено записей: {remove_duplicates(connection, groups)}")
+    return 0
+
+
+def command_stats(args) -> int:
+    from modules.statistics import STATISTICS, count_distribution, count_totals, rebuild_counters, top_counts
+
+    connection = _connect()
+    if args.rebuild:
+        rebuild_counters(connection)
+    title = STATISTICS[args.kind][0]
+    groups, entries = count_totals(connection, args.kind)
+    print(f"Значений: {groups}, записей: {entries}")
+    print(f"\n{title}:")
+    for row in top_counts(connection, args.kind, args.limit):
+        print(f"{row.entry_count}\t{row.label}")
+    if args.distribution:
+        print("\nЗаписей\tЗначений")
+        for row in count_distribution(connection, args.kind):
+            print(f"{row.entry_count}\t{row.groups}")
+    return 0
+
+
+def command_snapshot(args) -> int:
+    from modules import snapshot
+
+    if args.action == "list":
+        for manifest in snapshot.list_snapshots():
+            print(f"{manifest['name']}\t{manifest['created_at']}\t{manifest['tables']['entries']['rows']} записей")
+        return 0
+    if not args.name:
+        print("Не указано имя снимка", file=sys.stderr)
+        return 2
+    if args.action == "delete":
+        snapshot.delete_snapshot(args.name)
+        return 0
+    connection = _connect()
+    started = time.perf_counter()
+    if args.action == "save":
+        manifest = snapshot.save_snapshot(args.name, connection)
+    else:
+        manifest = snapshot.restore_snapshot(args.name, connection)
+    print(f"{manifest['tables']['entries']['rows']} записей за {time.perf_counter() - started:.1f} с")
+    return 0
+
+
+def command_bench(args) -> int:
+    from database.storage import create_entry_table
+
+    entries = create_entry_table(_connect())
+    for column in entries.columns:
+        for descending in (False, True):
+            started = time.perf_counter()
+            rows, pages, after = 0, 0, None
+            while pages < args.pages:
+                page, after = entries.get_page(column, descending, args.page_size, after)
+                rows += len(page)
+                pages += 1
+                if after is None:
+                    break
+            elapsed = time.perf_counter() - started
+            direction = "DESC" if descending else "ASC"
+            print(f"ORDER BY {column} {direction}: {elapsed / pages * 1000:.1f} мс/страница, "
+                  f"{rows / elapsed if elapsed else 0:,.0f} строк/с")
+    return 0
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Массовые операции с телефонным справочником")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Подробный вывод журнала")
+    parser.add_argument("--sql-stats", action="store_true", help="Вывести статистику SQL запросов после выполнения")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Применить миграции схемы")
+    migrate_parser.add_argument("--verify", action="store_true", help="Проверить планы основных запросов")
+    migrate_parser.add_argument("--min-rows", type=int, default=10_000,
+                                help="Порог строк, начиная с которого план считается медленным")
+    migrate_parser.set_defaults(handler=command_migrate)
+
+    generate_parser = commands.add_parser("generate", help="Заполнить базу случайными записями")
+    generate_parser.add_argument("count", type=int)
+    generate_parser.add_argument("--chunk-size", type=int, default=10_000)
+    generate_parser.add_argument("--workers", type=int, default=1,
+                                 help="Подключений для параллельной загрузки в секции таблицы записей")
+    generate_parser.set_defaults(handler=command_generate)
+
+    partition_parser = commands.add_parser("partition-entries",
+                                           help="Разделить таблицу записей на секции по хешу entry_id")
+    partition_parser.add_argument("partitions", type=int, help="Количество секций, 1 - таблица без секций")
+    partition_parser.set_defaults(handler=command_partition)
+
+    reset_parser = commands.add_parser("reset", help="Очистить все таблицы")
+    reset_parser.add_argument("--yes", action="store_true", help="Подтвердить сброс")
+    reset_parser.set_defaults(handler=command_reset)
+
+    merge_parser = commands.add_parser("merge-duplicates",
+                                       help="Объединить повторяющиеся значения родительских таблиц")
+    merge_parser.add_argument("--yes", action="store_true", help="Подтвердить объединение")
+    merge_parser.add_argument("--similar", action="store_true",
+                              help="Также объединить значения, отличающиеся регистром, «ё», пробелами и знаками")
+    merge_parser.set_defaults(handler=command_merge_duplicates)
+
+    import_parser = commands.add_parser("import", help="Импорт записей из CSV или XLSX")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--chunk-size", type=int, default=10_000)
+    import_parser.add_argument("--start-line", type=int, default=0,
+                               help="Начать со строки файла (после остановки импорта ошибкой)")
+    import_parser.set_defaults(handler=command_import)
+
+    export_parser = commands.add_parser("export", help="Экспорт записей в CSV или XLSX")
+    export_parser.add_argument("path")
+    export_parser.set_defaults(handler=command_export)
+
+    find_phone_parser = commands.add_parser("find-phone", help="Найти записи по номеру телефона")
+    find_phone_parser.add_argument("phone")
+    find_phone_parser.add_argument("--prefix", action="store_true", help="Искать номера, начинающиеся с phone")
+    find_phone_parser.add_argument("--limit", type=int, default=100)
+    find_phone_parser.set_defaults(handler=command_find_phone)
+
+    find_name_parser = commands.add_parser("find-name",
+                                           help="Найти записи по похожим именам, фамилиям, отчествам и улицам")
+    find_name_parser.add_argument("text")
+    find_name_parser.add_argument("--limit", type=int, default=100)
+    find_name_parser.add_argument("--matches", action="store_true", help="Вывести найденные похожие значения")
+    find_name_parser.set_defaults(handler=command_find_name)
+
+    duplicates_parser = commands.add_parser("find-duplicates", help="Найти повторяющиеся записи")
+    duplicates_parser.add_argument("--exact-only", action="store_true", help="Не искать похожие записи")
+    duplicates_parser.add_argument("--remove", action="store_true",
+                                   help="Оставить в каждой группе запись с наименьшим ID, остальные удалить")
+    duplicates_parser.add_argument("--yes", action="store_true", help="Подтвердить удаление")
+    duplicates_parser.set_defaults(handler=command_find_duplicates)
+
+    stats_parser = commands.add_parser("stats", help="Количество записей по улицам, фамилиям и домам")
+    stats_parser.add_argument("kind", choices=["streets", "surnames", "buildings"])
+    stats_parser.add_argument("--limit", type=int, default=20)
+    stats_parser.add_argument("--distribution", action="store_true",
+                              help="Показать, сколько значений имеют каждое количество записей")
+    stats_parser.add_argument("--rebuild", action="store_true", help="Пересчитать счётчики по таблице записей")
+    stats_parser.set_defaults(handler=command_stats)
+
+    snapshot_parser = commands.add_parser("snapshot", help="Снимки базы данных")
+    snapshot_parser.add_argument("action", choices=["save", "restore", "list", "delete"])
+    snapshot_parser.add_argument("name", nargs="?")
+    snapshot_parser.set_defaults(handler=command_snapshot)
+
+    bench_parser = commands.add_parser("bench", help="Замер скорости постраничной выборки с сортировкой")
+    bench_parser.add_argument("--pages", type=int, default=5)
+    bench_parser.add_argument("--page-size", type=int, default=500)
+    bench_parser.set_defaults(handler=command_bench)
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = create_parser().parse_args(argv)
+    logger.remove()
+    logger.add(sys.stderr, level="DEBUG" if args.verbose else "WARNING")
+    try:
+        return args.handler(args)
+    except ValueError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if args.sql_stats:
+            print_sql_stats()
+
+
+def print_sql_stats(top: int = 10) -> None:
+    from database.tracing import tracer
+
+    for stats in tracer.summary(top):
+        latency = stats["latency_us"]
+        print(f"{latency['count']:>7} × p50 {latency['p50'] / 1000:.2f} мс, p95 {latency['p95'] / 1000:.2f} мс, "
+              f"всего {latency['total'] / 1000:.1f} мс, строк {stats['rows']['total']:.0f}: {stats['shape'][:120]}",
+              file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
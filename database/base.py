@@ -1,13 +1,18 @@
 import contextlib
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Tuple, Dict, Sequence, Iterable
 
 from loguru import logger
 
 from database.connection import Connection
+from database.tracing import span
 from psycopg import errors as psycopg_errors
 
 
 class Base:
+    update_chunk_size = 10_000
+    # Функция приведения к нижнему регистру в условии поиска подстроки
+    lower_function = "lower"
+
     def __init__(self, table_name: str, columns: List[str], connection: Connection, primary_key: str):
         self.table_name = table_name
         self.connection = connection
@@ -16,34 +21,174 @@ class Base:
 
         self.columns_info = None
 
+    def _sort_expression(self, column: str) -> str:
+        """
+        Выражение ORDER BY для колонки: текстовые колонки сравниваются по русской сортировке
+
+        Args:
+            column: Имя колонки таблицы
+        """
+        if column == self.primary_key:
+            return column
+        collation = self.connection.get_sort_collation()
+        return f'{column} COLLATE "{collation}"' if collation else column
+
+    def _order_clause(self, order_by: Optional[str], descending: bool) -> str:
+        if order_by is None:
+            return ""
+        if order_by not in self.columns:
+            raise ValueError(f"Неизвестная колонка для сортировки: {order_by}")
+        direction = "DESC" if descending else "ASC"
+        order = f"{self._sort_expression(order_by)} {direction}"
+        if order_by != self.primary_key:
+            order += f", {self._sort_expression(self.primary_key)} {direction}"
+        return f" ORDER BY {order}"
+
+    @staticmethod
+    def _page_clause(limit: Optional[int], offset: int) -> Tuple[str, List[int]]:
+        if limit is None:
+            return (" OFFSET %s", [offset]) if offset else ("", [])
+        return " LIMIT %s OFFSET %s", [limit, offset]
+
+    def _keyset_condition(self, order_by: Optional[str], descending: bool,
+                          after: Optional[Sequence[Any]]) -> Tuple[str, List[Any]]:
+        """
+        Условие выборки записей, следующих в порядке сортировки за записью after.
+
+        В отличие от OFFSET, предыдущие страницы не перебираются заново: чтение продолжается
+        по индексу с позиции after, поэтому стоимость страницы не зависит от её номера.
+
+        Args:
+            order_by: Колонка сортировки
+            descending: Сортировка по убыванию
+            after: Ключ последней загруженной записи (значение колонки сортировки, первичный ключ)
+        """
+        if after is None:
+            return "", []
+        operator = "<" if descending else ">"
+        primary_key = self._sort_expression(self.primary_key)
+        if order_by is None or order_by == self.primary_key:
+            return f"{primary_key} {operator} %s", [after[1]]
+        key = self._sort_expression(order_by)
+        # Первое условие следует из второго, но позволяет начать чтение индекса колонки с нужной позиции
+        return f"{key} {operator}= %s AND ({key}, {primary_key}) {operator} (%s, %s)", [after[0], after[0], after[1]]
+
+    def _search_expressions(self) -> List[str]:
+        """Текстовые выражения, в которых ищется строка фильтра"""
+        return [f"CAST({column} AS text)" for column in self.columns]
+
+    def _search_condition(self, search: str) -> Tuple[str, List[Any]]:
+        """Условие поиска подстроки без учёта регистра хотя бы в одном из выражений поиска"""
+        pattern = "%" + search.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        expressions = self._search_expressions()
+        condition = " OR ".join(f"{self.lower_function}({expression}) LIKE %s ESCAPE '\\'" for expression in expressions)
+        return condition, [pattern] * len(expressions)
+
+    def _fuzzy_condition(self, search: str) -> Tuple[str, List[Any]]:
+        """Условие нечёткого поиска; таблицы без фонетических ключей ищут подстроку"""
+        return self._search_condition(search)
+
+    def _match_any(self, expression: str) -> str:
+        """Условие совпадения выражения с одним из значений параметра, переданного через _any_param"""
+        return f"{expression} = ANY(%s)"
+
     @staticmethod
-    def _log_query(query: str, params: Optional[List[Any]] = None) -> None:
+    def _any_param(values: Iterable[Any]) -> Any:
+        return list(values)
+
+    def _where_clause(self, order_by: Optional[str], descending: bool, after: Optional[Sequence[Any]],
+                      search: Optional[str], fuzzy: bool = False) -> Tuple[str, List[Any]]:
         """
-        Логирование SQL запроса с параметрами
+        Условие WHERE для фильтра по подстроке (без учёта регистра) и постраничной выборки по ключу
 
         Args:
-            query: SQL запрос
-            params: Параметры запроса
-        """
-        if params:
-            try:
-                formatted_query = query % tuple(repr(p) for p in params)
-            except:
-                formatted_query = f"{query} [params: {params}]"
-        else:
-            formatted_query = query
-        logger.debug(f"SQL запрос:\n{formatted_query.strip()}")
-
-    def get_all(self) -> List[dict]:
+            search: Строка фильтра, запись подходит, если строка входит хотя бы в одно из выражений поиска
+            fuzzy: Нечёткий поиск по похожим значениям вместо поиска подстроки
+        """
+        conditions, params = [], []
+        if search:
+            condition, search_params = self._fuzzy_condition(search) if fuzzy else self._search_condition(search)
+            conditions.append(condition)
+            params += search_params
+        keyset, keyset_params = self._keyset_condition(order_by, descending, after)
+        if keyset:
+            conditions.append(keyset)
+            params += keyset_params
+        if not conditions:
+            return "", []
+        return " WHERE " + " AND ".join(f"({condition})" for condition in conditions), params
+
+    def _select_query(self, order_by: Optional[str] = None, descending: bool = False,
+                      limit: Optional[int] = None, offset: int = 0,
+                      after: Optional[Sequence[Any]] = None, search: Optional[str] = None,
+                      fuzzy: bool = False) -> Tuple[str, List[Any]]:
+        """Запрос выборки; при заданной сортировке последней колонкой выбирается ключ сортировки"""
+        order_clause = self._order_clause(order_by, descending)
+        where, params = self._where_clause(order_by, descending, after, search, fuzzy)
+        page_clause, page_params = self._page_clause(limit, offset)
+        sort_key = f", {self._sort_expression(order_by)}" if order_by else ""
+        query = f"SELECT {', '.join(self.columns)}{sort_key} FROM {self.table_name}{where}{order_clause}{page_clause}"
+        return query, params + page_params
+
+    def _materialize(self, rows: List[tuple]) -> List[dict]:
+        return [{column: row[i].strip() if isinstance(row[i], str) else row[i]
+                 for i, column in enumerate(self.columns)} for row in rows]
+
+    def get_all(self, order_by: Optional[str] = None, descending: bool = False,
+                limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+        """
+        Получение записей таблицы с сортировкой и постраничной выборкой на стороне БД
+
+        Args:
+            order_by: Колонка для сортировки, None - без сортировки
+            descending: Сортировка по убыванию
+            limit: Максимальное количество записей, None - все записи
+            offset: Количество пропускаемых записей
+        """
         logger.info(f"Получение записей из таблицы {self.table_name}")
-        with self.exception_handler(), self.connection.cursor() as cur:
-            query = f"SELECT {', '.join(self.columns)} FROM {self.table_name}"
-            self._log_query(query)
-            cur.execute(query)
+        query, params = self._select_query(order_by, descending, limit, offset)
+        with self.exception_handler(), self.connection.cursor() as cur, span(f"{self.table_name}.get_all"):
+            cur.execute(query, params)
             result = cur.fetchall()
             logger.debug(f"Получено записей: {len(result)}")
-            return [{column: row[i].strip() if isinstance(row[i], str) else row[i]
-                     for i, column in enumerate(self.columns)} for row in result]
+            return self._materialize(result)
+
+    def get_page(self, order_by: Optional[str] = None, descending: bool = False, limit: int = 500,
+                 after: Optional[Sequence[Any]] = None, search: Optional[str] = None,
+                 fuzzy: bool = False) -> Tuple[List[dict], Optional[tuple]]:
+        """
+        Получение страницы записей, следующих за записью after, в заданном порядке сортировки
+
+        Args:
+            order_by: Колонка для сортировки, None - по первичному ключу
+            descending: Сортировка по убыванию
+            limit: Количество записей на странице
+            after: Ключ последней записи предыдущей страницы, None - первая страница
+            search: Строка фильтра, None - без фильтрации
+            fuzzy: Нечёткий поиск по похожим значениям вместо поиска подстроки
+
+        Returns:
+            Записи страницы и ключ её последней записи для запроса следующей страницы,
+            None вместо ключа, если записей больше нет
+        """
+        order_by = order_by or self.primary_key
+        query, params = self._select_query(order_by, descending, limit, after=after, search=search, fuzzy=fuzzy)
+        with self.exception_handler(), self.connection.cursor() as cur, span(f"{self.table_name}.get_page"):
+            cur.execute(query, params)
+            result = cur.fetchall()
+        logger.debug(f"Получено записей страницы {self.table_name}: {len(result)}")
+        next_after = None
+        if len(result) == limit:
+            next_after = (result[-1][-1], result[-1][self.columns.index(self.primary_key)])
+        return self._materialize(result), next_after
+
+    def get_by_ids(self, target_ids: Iterable[Any]) -> List[dict]:
+        """Получение записей по списку первичных ключей, отсутствующие записи пропускаются"""
+        query = (f"SELECT {', '.join(self.columns)} FROM {self.table_name} "
+                 f"WHERE {self._match_any(self.primary_key)} ORDER BY {self.primary_key}")
+        with self.exception_handler(), self.connection.cursor() as cur, span(f"{self.table_name}.get_by_ids"):
+            cur.execute(query, (self._any_param(target_ids),))
+            return self._materialize(cur.fetchall())
 
     def update(self, data: dict, target_id: str) -> tuple:
         logger.info(f"Обновление записи с ID {target_id} и данными {data}")
@@ -59,18 +204,36 @@ class Base:
         """
         
         with self.exception_handler(), self.connection.cursor() as cur:
-            self._log_query(query, values + [target_id])
             cur.execute(query, values + [target_id])
             result = cur.fetchone()
             logger.debug(f"Обновлено записей: {cur.rowcount}")
             return result
 
+    def update_many(self, data: dict, target_ids: Sequence[Any]) -> int:
+        """
+        Записывает одни и те же значения data во все строки target_ids одной транзакцией.
+
+        Строки обновляются запросами по update_chunk_size ID, каждый запрос - один UPDATE по списку ID.
+
+        :return: Количество обновлённых строк.
+        """
+        logger.info(f"Обновление {len(target_ids)} записей таблицы {self.table_name} данными {data}")
+        set_expr = ", ".join(f"{column} = %s" for column in data)
+        query = f"UPDATE {self.table_name} SET {set_expr} WHERE {self._match_any(self.primary_key)}"
+        updated = 0
+        with self.exception_handler(), self.connection.cursor() as cur, span(f"{self.table_name}.update_many"):
+            for start in range(0, len(target_ids), self.update_chunk_size):
+                chunk = target_ids[start:start + self.update_chunk_size]
+                cur.execute(query, list(data.values()) + [self._any_param(chunk)])
+                updated += cur.rowcount
+        logger.debug(f"Обновлено записей: {updated}")
+        return updated
+
     def delete(self, target_ids: List[str]):
+        logger.info(f"Удаление записей из таблицы {self.table_name}: {len(target_ids)}")
         target_ids = [[target_id] for target_id in target_ids]
-        logger.info(f"Удаление записей с ID {target_ids}")
         with self.exception_handler(), self.connection.cursor() as cur:
             query = f"DELETE FROM {self.table_name} WHERE {self.primary_key} = %s"
-            self._log_query(query, [target_ids])
             cur.executemany(query, target_ids)
             rows_affected = cur.rowcount
             logger.debug(f"Удалено записей: {rows_affected}")
@@ -82,7 +245,7 @@ class Base:
         :param data_list: Список словарей, где ключи - имена колонок, значения - данные для вставки.
         :return: Список созданных записей в виде словарей.
         """
-        logger.info(f"Создание новых записей с данными {data_list}")
+        logger.info(f"Создание новых записей в таблице {self.table_name}: {len(data_list)}")
         if not data_list:
             logger.warning("Передан пустой список данных для создания записей.")
             return []
@@ -103,6 +266,45 @@ class Base:
             return result_dicts
 
 
+    def get_or_create_ids(self, column: str, values: List[str]) -> Dict[str, Any]:
+        """
+        Возвращает ID записей для каждого значения колонки, создавая недостающие записи.
+
+        Колонка должна иметь ограничение уникальности. Вставка и выборка выполняются одним запросом,
+        независимо от количества значений.
+
+        :param column: Колонка со значениями (например, name для таблицы names).
+        :param values: Значения, для которых нужно получить ID, допускаются повторы.
+        :return: Словарь значение -> ID записи.
+        """
+        logger.info(f"Получение ID для {len(values)} значений колонки {column} таблицы {self.table_name}")
+        query = f"""
+            WITH input AS (SELECT DISTINCT unnest(%s::text[]) AS value),
+            inserted AS (
+                INSERT INTO {self.table_name} ({column})
+                SELECT value FROM input
+                ON CONFLICT ({column}) DO NOTHING
+                RETURNING {self.primary_key}, {column}
+            )
+            SELECT {self.primary_key}, {column} FROM inserted
+            UNION ALL
+            SELECT t.{self.primary_key}, t.{column} FROM {self.table_name} t JOIN input ON t.{column} = input.value
+        """
+        with self.exception_handler(), self.connection.cursor() as cur:
+            cur.execute(query, (list(values),))
+            return {value.strip(): value_id for value_id, value in cur.fetchall()}
+
+    def get_unused_value(self, column: str, value: str) -> str:
+        """Подбирает значение колонки вида «value», «value 2», ... которого ещё нет в таблице"""
+        with self.exception_handler(), self.connection.cursor(False) as cur:
+            cur.execute(f"SELECT {column} FROM {self.table_name} WHERE {column} LIKE %s", (f"{value}%",))
+            taken = {row[0].strip() for row in cur.fetchall()}
+        candidate, index = value, 1
+        while candidate in taken:
+            index += 1
+            candidate = f"{value} {index}"
+        return candidate
+
     @contextlib.contextmanager
     def exception_handler(self):
         """Расширенный обработчик исключений для операций с БД"""
@@ -117,6 +319,9 @@ class Base:
         except psycopg_errors.NotNullViolation as e:
             logger.error(f"Попытка записи NULL в NOT NULL поле: {e.diag.message_detail if hasattr(e.diag, 'message_detail') else str(e)}")
             raise ValueError("Обязательное поле не может быть пустым") from e
+        except psycopg_errors.CheckViolation as e:
+            logger.error(f"Нарушение ограничения {e.diag.constraint_name}: {str(e)}")
+            raise ValueError("Значение не соответствует формату колонки") from e
         except psycopg_errors.NumericValueOutOfRange as e:
             logger.error(f"Значение вне допустимого диапазона: {str(e)}")
             raise ValueError("Значение вне допустимого диапазона") from e
@@ -0,0 +1,469 @@
+"""
+Локальный кеш справочника для быстрого запуска.
+
+Последнее загруженное состояние таблиц хранится на диске по колонкам: целые числа - массивами int64,
+строки - массивом смещений и общим блоком UTF-8. Файлы открываются через mmap, поэтому снимок
+доступен сразу после запуска, без чтения файлов целиком и без обращения к базе данных.
+
+Синхронизация загружает только строки, изменённые после сохранённой границы (версия строки - номер
+записавшей её транзакции), и журнал удалений. Изменения хранятся поверх снимка в delta.json и
+переписываются в колонки, когда их становится больше COMPACT_RATIO от размера снимка.
+
+Каждый кеш записывает свою границу в cache_clients. При объединении изменений журнал удалений
+очищается до самой старой границы кешей, синхронизированных за последние CLIENT_RETENTION_DAYS дней;
+кеш с более старой границей после очистки загружается заново.
+"""
+import os
+import re
+import json
+import mmap
+import heapq
+import shutil
+import threading
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Iterator, Iterable, Sequence, Tuple, Set, Any, Callable
+
+from loguru import logger
+from psycopg.pq import TransactionStatus
+
+from database.base import Base
+from database.connection import Connection
+from database.migrations import LOOKUP_TABLES, SYNC_TABLES
+from database.storage import is_sqlite
+from database.tracing import span
+
+CACHE_DIR = Path(os.getenv("CACHE_DIR", "cache"))
+CACHE_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+DELTA_FILE = "delta.json"
+COMPACT_RATIO = 0.1
+WRITE_CHUNK_ROWS = 10_000
+CLIENT_RETENTION_DAYS = 30
+INTEGER, TEXT = "int8", "text"
+
+CACHE_TABLES: Dict[str, Dict[str, str]] = {
+    **{table_name: {id_column: INTEGER, data_column: TEXT}
+       for table_name, (id_column, data_column) in LOOKUP_TABLES.items()},
+    "entries": {
+        "entry_id": INTEGER, "name_id": INTEGER, "surname_id": INTEGER, "patronymic_id": INTEGER,
+        "street_id": INTEGER, "building": TEXT, "apartment": INTEGER, "phone": TEXT,
+    },
+}
+
+
+class TextColumn:
+    """Строковая колонка: значение i - байты data[offsets[i]:offsets[i + 1]] в UTF-8"""
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self.offsets = offsets
+        self.data = data
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+
+class TableSnapshot:
+    """Колонки таблицы из снимка, отображённые в память. Строки упорядочены по первичному ключу"""
+
+    def __init__(self, path: Path, columns: Dict[str, str], rows: int):
+        self.rows = rows
+        self._maps: List[mmap.mmap] = []
+        self._views: List[memoryview] = []
+        self.columns = []
+        for column, column_type in columns.items():
+            if column_type == INTEGER:
+                self.columns.append(self._map(path / f"{column}.i64"))
+            else:
+                offsets = self._map(path / f"{column}.offsets")
+                self.columns.append(TextColumn(offsets, self._map(path / f"{column}.utf8", "B")))
+        self.ids = self.columns[0]
+
+    def _map(self, path: Path, item_format: str = "q") -> memoryview:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                view = memoryview(b"").cast(item_format)
+            else:
+                file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(file_map)
+                view = memoryview(file_map).cast(item_format)
+        self._views.append(view)
+        return view
+
+    def row(self, index: int) -> tuple:
+        return tuple(column[index] for column in self.columns)
+
+    def close(self) -> None:
+        self.columns = []
+        self.ids = None
+        for view in self._views:
+            view.release()
+        for file_map in self._maps:
+            file_map.close()
+        self._views, self._maps = [], []
+
+
+class TableWriter:
+    """Запись строк таблицы в файлы колонок частями по WRITE_CHUNK_ROWS строк"""
+
+    def __init__(self, path: Path, columns: Dict[str, str]):
+        path.mkdir(parents=True)
+        self.columns = list(columns.items())
+        self.files = {}
+        self.buffers = {}
+        self.positions = {}
+        for column, column_type in self.columns:
+            if column_type == INTEGER:
+                self.files[column] = open(path / f"{column}.i64", "wb")
+                self.buffers[column] = array("q")
+            else:
+                self.files[column] = (open(path / f"{column}.offsets", "wb"), open(path / f"{column}.utf8", "wb"))
+                self.buffers[column] = (array("q", [0]), [])
+                self.positions[column] = 0
+        self.rows = 0
+
+    def write(self, row: Sequence[Any]) -> None:
+        for (column, column_type), value in zip(self.columns, row):
+            if column_type == INTEGER:
+                self.buffers[column].append(value)
+            else:
+                offsets, parts = self.buffers[column]
+                encoded = value.encode()
+                parts.append(encoded)
+                self.positions[column] += len(encoded)
+                offsets.append(self.positions[column])
+        self.rows += 1
+        if self.rows % WRITE_CHUNK_ROWS == 0:
+            self.flush()
+
+    def flush(self) -> None:
+        for column, column_type in self.columns:
+            if column_type == INTEGER:
+                self.buffers[column].tofile(self.files[column])
+                self.buffers[column] = array("q")
+            else:
+                offsets_file, data_file = self.files[column]
+                offsets, parts = self.buffers[column]
+                offsets.tofile(offsets_file)
+                data_file.write(b"".join(parts))
+                self.buffers[column] = (array("q"), [])
+
+    def close(self) -> int:
+        self.flush()
+        for column_files in self.files.values():
+            for file in column_files if isinstance(column_files, tuple) else (column_files,):
+                file.close()
+        return self.rows
+
+
+class LocalCache:
+    """
+    Снимок таблиц справочника на диске с синхронизацией изменений.
+
+    :param connection: Подключение к базе данных PostgreSQL.
+    :param directory: Каталог снимка.
+    """
+
+    def __init__(self, connection: Connection, directory: Path = CACHE_DIR):
+        self.connection = connection
+        self.directory = Path(directory)
+        self.manifest: Optional[dict] = None
+        self.snapshots: Dict[str, TableSnapshot] = {}
+        self.changed: Dict[str, Dict[int, tuple]] = {}
+        self.deleted: Dict[str, Set[int]] = {}
+        self.watermark: Optional[int] = None
+        self.client_id = str(uuid.uuid4())
+        self.synced = False
+        # Синхронизации выполняются по одной, а чтение снимка не пересекается с его заменой
+        self.sync_lock = threading.Lock()
+        self.lock = threading.RLock()
+
+    def load(self) -> bool:
+        """
+        Открывает сохранённый снимок без обращения к базе данных.
+
+        :return: True, если снимок есть и прочитан.
+        """
+        with self.lock:
+            return self._load()
+
+    def _load(self) -> bool:
+        if self.manifest is not None:
+            return True
+        manifest_path = self.directory / MANIFEST_FILE
+        if not manifest_path.exists():
+            return False
+        try:
+            with open(manifest_path, encoding="utf-8") as file:
+                manifest = json.load(file)
+            if manifest["format"] != CACHE_FORMAT:
+                return False
+            self.snapshots = {table_name: TableSnapshot(self.directory / table_name, CACHE_TABLES[table_name],
+                                                        manifest["tables"][table_name]["rows"])
+                              for table_name in CACHE_TABLES}
+            self.changed = {table_name: {} for table_name in CACHE_TABLES}
+            self.deleted = {table_name: set() for table_name in CACHE_TABLES}
+            self.watermark = manifest["watermark"]
+            delta_path = self.directory / DELTA_FILE
+            if delta_path.exists():
+                with open(delta_path, encoding="utf-8") as file:
+                    delta = json.load(file)
+                if delta["base_watermark"] == manifest["watermark"]:
+                    for table_name, rows in delta["changed"].items():
+                        self.changed[table_name] = {row[0]: tuple(row) for row in rows}
+                    for table_name, row_ids in delta["deleted"].items():
+                        self.deleted[table_name] = set(row_ids)
+                    self.watermark = delta["watermark"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Локальный кеш {self.directory} повреждён и будет загружен заново: {e}")
+            self.close()
+            return False
+        self.manifest = manifest
+        self.client_id = manifest.get("client_id") or self.client_id
+        logger.info(f"Открыт локальный кеш от {manifest['created_at']}: "
+                    f"{manifest['tables']['entries']['rows']} записей в снимке")
+        return True
+
+    def close(self) -> None:
+        for snapshot in self.snapshots.values():
+            snapshot.close()
+        self.snapshots = {}
+        self.manifest = None
+
+    def sync(self, connection: Optional[Connection] = None) -> int:
+        """
+        Загружает изменения после последней синхронизации.
+
+        Читаются строки с версией не меньше сохранённой границы и журнал удалений. Граница - самая
+        старая транзакция, незавершённая на момент чтения, поэтому изменения транзакций, которые
+        завершатся позже, попадут в следующую синхронизацию. Если снимка нет, база другая, таблицы
+        очищались через TRUNCATE или журнал удалений очищен после границы кеша, снимок загружается полностью.
+
+        :param connection: Подключение для синхронизации, по умолчанию - подключение кеша.
+        :return: Количество изменённых и удалённых строк, при полной загрузке - количество строк снимка.
+        """
+        connection = connection or self.connection
+        with self.sync_lock:
+            self.load()
+            if connection.connection.info.transaction_status == TransactionStatus.INTRANS:
+                # Чтения приложения не завершают транзакцию, а уровень изоляции задаётся только в начале новой
+                connection.connection.rollback()
+            with span("cache.sync"), connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cursor.execute("SELECT database_id::text, epoch, pg_snapshot_xmin(pg_current_snapshot())::text::bigint, "
+                               "deleted_rows_horizon FROM sync_state")
+                database_id, epoch, watermark, horizon = cursor.fetchone()
+                if (self.manifest is None or self.watermark < horizon
+                        or (self.manifest["database_id"], self.manifest["epoch"]) != (database_id, epoch)):
+                    changes = self._download(cursor, database_id, epoch, watermark)
+                    compacted = True
+                else:
+                    changes, compacted = self._fetch_changes(cursor, watermark)
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO cache_clients (client_id, watermark) VALUES (%s, %s) "
+                               "ON CONFLICT (client_id) DO UPDATE SET watermark = excluded.watermark, synced_at = now()",
+                               (self.client_id, self.watermark))
+                if compacted:
+                    prune_deleted_rows(cursor)
+            self.synced = True
+        logger.info(f"Локальный кеш синхронизирован, изменений: {changes}")
+        return changes
+
+    def refresh(self) -> int:
+        """
+        Загружает изменения, если кеш уже синхронизировался после запуска.
+
+        До первой синхронизации используется сохранённый снимок: её выполняет start_sync, не блокируя интерфейс.
+        """
+        return self.sync() if self.synced else 0
+
+    def start_sync(self, finished: Callable[[int], None]) -> threading.Thread:
+        """
+        Синхронизирует кеш в отдельном потоке через отдельное подключение.
+
+        :param finished: Вызывается в потоке синхронизации с количеством изменений, если синхронизация удалась.
+        """
+        def run() -> None:
+            connection = Connection()
+            try:
+                connection.connect()
+                changes = self.sync(connection)
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации локального кеша: {e}")
+                return
+            finally:
+                if connection.connection is not None:
+                    connection.connection.close()
+            finished(changes)
+
+        thread = threading.Thread(target=run, name="cache-sync", daemon=True)
+        thread.start()
+        return thread
+
+    def _download(self, cursor, database_id: str, epoch: int, watermark: int) -> int:
+        logger.info("Полная загрузка локального кеша")
+        tables = {}
+
+        def table_rows(table_name: str, columns: Dict[str, str]) -> Iterator[tuple]:
+            query = f"SELECT {', '.join(columns)} FROM {table_name} ORDER BY {SYNC_TABLES[table_name]}"
+            with cursor.copy(f"COPY ({query}) TO STDOUT") as copy:
+                copy.set_types(list(columns.values()))
+                yield from copy.rows()
+
+        self._write_snapshot({table_name: table_rows(table_name, columns)
+                              for table_name, columns in CACHE_TABLES.items()},
+                             {"database_id": database_id, "epoch": epoch, "watermark": watermark,
+                              "client_id": self.client_id}, tables)
+        return sum(table["rows"] for table in tables.values())
+
+    def _write_snapshot(self, rows: Dict[str, Iterable[Sequence[Any]]], state: dict, tables: dict) -> None:
+        """Записывает снимок во временный каталог и заменяет им текущий"""
+        temp_path = self.directory.with_name(f".{self.directory.name}.tmp")
+        shutil.rmtree(temp_path, ignore_errors=True)
+        temp_path.mkdir(parents=True)
+        for table_name, columns in CACHE_TABLES.items():
+            writer = TableWriter(temp_path / table_name, columns)
+            for row in rows[table_name]:
+                writer.write(row)
+            tables[table_name] = {"rows": writer.close()}
+        manifest = {"format": CACHE_FORMAT, "created_at": datetime.now().isoformat(timespec="seconds"),
+                    **state, "tables": tables}
+        with open(temp_path / MANIFEST_FILE, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+        with self.lock:
+            self.close()
+            shutil.rmtree(self.directory, ignore_errors=True)
+            temp_path.rename(self.directory)
+            self.load()
+
+    def _fetch_changes(self, cursor, watermark: int) -> Tuple[int, bool]:
+        """Загружает изменения и применяет их к кешу; возвращает количество изменений и признак объединения со снимком"""
+        fetched = {}
+        for table_name, columns in CACHE_TABLES.items():
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name} WHERE row_version >= %s",
+                           (self.watermark,))
+            rows = cursor.fetchall()
+            cursor.execute("SELECT row_id FROM deleted_rows WHERE table_name = %s AND row_version >= %s",
+                           (table_name, self.watermark))
+            fetched[table_name] = (rows, [row_id for (row_id,) in cursor.fetchall()])
+        with self.lock:
+            changes = 0
+            for table_name, (rows, deleted_ids) in fetched.items():
+                changed, deleted = self.changed[table_name], self.deleted[table_name]
+                for row in rows:
+                    changed[row[0]] = tuple(row)
+                    deleted.discard(row[0])
+                for row_id in deleted_ids:
+                    changed.pop(row_id, None)
+                    deleted.add(row_id)
+                changes += len(rows) + len(deleted_ids)
+            self.watermark = watermark
+            overlay = sum(len(self.changed[table_name]) + len(self.deleted[table_name]) for table_name in CACHE_TABLES)
+            compact = overlay > COMPACT_RATIO * max(sum(snapshot.rows for snapshot in self.snapshots.values()), 1)
+            if compact:
+                self._compact()
+            else:
+                self._save_delta()
+        return changes, compact
+
+    def _save_delta(self) -> None:
+        delta = {
+            "base_watermark": self.manifest["watermark"],
+            "watermark": self.watermark,
+            "changed": {table_name: list(rows.values()) for table_name, rows in self.changed.items()},
+            "deleted": {table_name: sorted(row_ids) for table_name, row_ids in self.deleted.items()},
+        }
+        temp_path = self.directory / f".{DELTA_FILE}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(delta, file, ensure_ascii=False)
+        os.replace(temp_path, self.directory / DELTA_FILE)
+
+    def _compact(self) -> None:
+        """Переписывает снимок вместе с накопленными изменениями"""
+        logger.info("Объединение изменений локального кеша со снимком")
+        with span("cache.compact"), self.lock:
+            state = {key: self.manifest[key] for key in ("database_id", "epoch")}
+            state.update(watermark=self.watermark, client_id=self.client_id)
+            self._write_snapshot({table_name: self.rows(table_name) for table_name in CACHE_TABLES}, state, {})
+
+    def rows(self, table_name: str, after: Optional[int] = None, descending: bool = False) -> Iterator[tuple]:
+        """
+        Строки таблицы из кеша в порядке первичного ключа.
+
+        :param after: Первичный ключ, после которого начинается выборка.
+        :param descending: Порядок по убыванию первичного ключа.
+        """
+        snapshot = self.snapshots[table_name]
+        changed, deleted = self.changed[table_name], self.deleted[table_name]
+        ids = snapshot.ids
+        if descending:
+            end = bisect_left(ids, after) if after is not None else len(ids)
+            positions = range(end - 1, -1, -1)
+            overlay = sorted((row_id for row_id in changed if after is None or row_id < after), reverse=True)
+        else:
+            start = bisect_right(ids, after) if after is not None else 0
+            positions = range(start, len(ids))
+            overlay = sorted(row_id for row_id in changed if after is None or row_id > after)
+        base = ((ids[index], index) for index in positions if ids[index] not in changed and ids[index] not in deleted)
+        merged = heapq.merge(base, ((row_id, None) for row_id in overlay),
+                             key=lambda item: item[0], reverse=descending)
+        for row_id, index in merged:
+            yield changed[row_id] if index is None else snapshot.row(index)
+
+    def read_all(self, table: Base) -> List[dict]:
+        """
+        Записи таблицы из кеша без обращения к базе данных.
+
+        Изменения загружаются не при каждом чтении, а один раз перед загрузкой таблицы через refresh.
+        """
+        with self.lock:
+            rows = list(self.rows(table.table_name))
+        return table._materialize(rows)
+
+    def read_page(self, table: Base, limit: int, after: Optional[Sequence[Any]] = None,
+                  descending: bool = False) -> Tuple[List[dict], Optional[tuple]]:
+        """Страница записей из кеша в порядке первичного ключа, в форме результата Base.get_page"""
+        with self.lock:
+            rows = list(islice(self.rows(table.table_name, after[1] if after else None, descending), limit))
+        next_after = (rows[-1][0], rows[-1][0]) if len(rows) == limit else None
+        return table._materialize(rows), next_after
+
+
+def prune_deleted_rows(cursor, retention_days: int = CLIENT_RETENTION_DAYS) -> int:
+    """
+    Удаляет из журнала удалений строки старше границ всех кешей, синхронизированных за retention_days дней.
+
+    Граница очистки сохраняется в sync_state.deleted_rows_horizon: кеш с более старой границей,
+    в том числе не синхронизировавшийся дольше retention_days, при следующей синхронизации загружается заново.
+
+    :return: Количество удалённых строк журнала.
+    """
+    cursor.execute("DELETE FROM cache_clients WHERE synced_at < now() - %s * interval '1 day'", (retention_days,))
+    cursor.execute("""
+        UPDATE sync_state SET deleted_rows_horizon = greatest(deleted_rows_horizon, horizon)
+        FROM (SELECT min(watermark) AS horizon FROM cache_clients) clients
+        WHERE horizon IS NOT NULL
+        RETURNING deleted_rows_horizon
+    """)
+    row = cursor.fetchone()
+    if row is None:
+        return 0
+    cursor.execute("DELETE FROM deleted_rows WHERE row_version < %s", (row[0],))
+    logger.info(f"Из журнала удалений удалено строк: {cursor.rowcount}")
+    return cursor.rowcount
+
+
+def create_local_cache(connection: Connection) -> Optional[LocalCache]:
+    """
+    Локальный кеш для подключения к PostgreSQL; база SQLite уже локальная и в кеше не нуждается.
+
+    Снимок каждой базы хранится в отдельном каталоге CACHE_DIR, чтобы кеши разных серверов и баз не смешивались.
+    """
+    if is_sqlite(connection):
+        return None
+    name = re.sub(r"[^\w.-]+", "_", f"{connection.host or 'localhost'}-{connection.port or 5432}-{connection.database}")
+    return LocalCache(connection, CACHE_DIR / name.strip("_"))
@@ -0,0 +1,146 @@
+"""
+Поток изменений, сделанных другими клиентами.
+
+Триггеры базы данных (миграция 6) на каждую команду отправляют через NOTIFY событие
+{"table", "op", "ids"}. ChangeListener слушает канал в отдельном потоке на собственном подключении
+и складывает события в ChangeBuffer, где они объединяются по таблицам: серия изменений, например
+импорт, превращается в один набор ID на таблицу. Интерфейс периодически забирает накопленное
+через ChangeBuffer.drain и перечитывает только изменённые строки.
+"""
+import json
+import threading
+from typing import Dict, Optional, Iterable, Set
+
+import psycopg
+from loguru import logger
+
+from database.connection import Connection
+from database.migrations import CHANGES_CHANNEL, SYNC_TABLES
+from database.storage import is_sqlite
+
+CHANGE_BUFFER_MAX_IDS = 5_000
+LISTEN_TIMEOUT = 1.0
+RECONNECT_DELAY = 5.0
+
+
+class TableChanges:
+    """
+    Изменения таблицы, накопленные с прошлого ChangeBuffer.drain.
+
+    ids - первичные ключи вставленных, изменённых и удалённых строк: что именно произошло, выясняется
+    повторным чтением строк. reload - изменений слишком много или таблица очищена, её нужно перечитать целиком.
+    """
+
+    def __init__(self):
+        self.ids: Set[int] = set()
+        self.reload = False
+
+    def add(self, ids: Optional[Iterable[int]]) -> None:
+        if self.reload:
+            return
+        if ids is None:
+            self.reload = True
+            self.ids.clear()
+            return
+        self.ids.update(ids)
+        if len(self.ids) > CHANGE_BUFFER_MAX_IDS:
+            self.reload = True
+            self.ids.clear()
+
+
+class ChangeBuffer:
+    """Потокобезопасный буфер событий об изменениях, объединяющий их по таблицам"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changes: Dict[str, TableChanges] = {}
+
+    def add(self, table_name: str, operation: str, ids: Optional[Iterable[int]]) -> None:
+        with self.lock:
+            changes = self.changes.setdefault(table_name, TableChanges())
+            changes.add(None if operation == "T" else ids)
+
+    def reload_all(self) -> None:
+        with self.lock:
+            for table_name in SYNC_TABLES:
+                self.changes.setdefault(table_name, TableChanges()).add(None)
+
+    def drain(self) -> Dict[str, TableChanges]:
+        """Возвращает накопленные изменения и очищает буфер"""
+        with self.lock:
+            changes, self.changes = self.changes, {}
+        return changes
+
+
+class ChangeListener:
+    """
+    Слушает уведомления об изменениях в отдельном потоке.
+
+    События собственного подключения приложения пропускаются: свои изменения интерфейс уже показал.
+    После обрыва связи подключение восстанавливается, а все таблицы помечаются для перечитывания,
+    так как уведомления за время обрыва потеряны.
+
+    :param connection: Подключение приложения к базе данных PostgreSQL.
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.buffer = ChangeBuffer()
+        self.listening = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="change-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _own_pid(self) -> Optional[int]:
+        return self.connection.connection.info.backend_pid if self.connection.connection else None
+
+    def _run(self) -> None:
+        connected_before = False
+        while not self._stopped.is_set():
+            try:
+                with psycopg.connect(host=self.connection.host, port=self.connection.port,
+                                     user=self.connection.user, password=self.connection.password,
+                                     dbname=self.connection.database, autocommit=True) as listen_connection:
+                    listen_connection.execute(f"LISTEN {CHANGES_CHANNEL}")
+                    if connected_before:
+                        self.buffer.reload_all()
+                    connected_before = True
+                    self.listening.set()
+                    logger.info("Получение изменений других клиентов запущено")
+                    while not self._stopped.is_set():
+                        for notify in listen_connection.notifies(timeout=LISTEN_TIMEOUT):
+                            self._handle(notify)
+            except psycopg.Error as e:
+                self.listening.clear()
+                logger.warning(f"Соединение для получения изменений потеряно: {e}")
+                self._stopped.wait(RECONNECT_DELAY)
+        self.listening.clear()
+
+    def _handle(self, notify: psycopg.Notify) -> None:
+        if notify.pid == self._own_pid():
+            return
+        try:
+            event = json.loads(notify.payload)
+            self.buffer.add(event["table"], event["op"], event["ids"])
+        except (ValueError, KeyError) as e:
+            logger.error(f"Некорректное уведомление об изменении {notify.payload!r}: {e}")
+
+
+def create_change_listener(connection: Connection) -> Optional[ChangeListener]:
+    """Получение изменений других клиентов; у встроенной базы SQLite других клиентов нет"""
+    if is_sqlite(connection):
+        return None
+    return ChangeListener(connection)
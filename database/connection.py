@@ -1,10 +1,15 @@
 import os
 import contextlib
+from typing import Optional
 
 import psycopg
 from loguru import logger
 from dotenv import load_dotenv
 
+from database.tracing import TracedCursor, tracer, spans
+
+RUSSIAN_COLLATIONS = ["ru-RU-x-icu", "ru-x-icu", "ru_RU.utf8", "ru_RU.UTF-8", "ru_RU"]
+
 
 class Connection:
     def __init__(self):
@@ -14,7 +19,11 @@ class Connection:
         self.user = os.getenv("DB_USER")
         self.password = os.getenv("DB_PASSWORD")
         self.database = os.getenv("DB_NAME")
+        self.sort_collation = os.getenv("DB_SORT_COLLATION")
         self.connection = None
+        self._resolved_collation = None
+        tracer.configure_from_env()
+        spans.configure_from_env()
 
     def connect(self):
         logger.info("Подключение к базе данных...")
@@ -24,7 +33,8 @@ class Connection:
                 port=self.port,
                 user=self.user,
                 password=self.password,
-                dbname=self.database
+                dbname=self.database,
+                cursor_factory=TracedCursor
             )
             logger.success("Подключение к базе данных успешно выполнено")
         except Exception as exception:
@@ -32,6 +42,25 @@ class Connection:
             raise
         return True
 
+    def get_sort_collation(self) -> Optional[str]:
+        """
+        Возвращает имя русской сортировки (collation), доступной на сервере.
+
+        Результат кешируется на время жизни подключения. Если ни одна из известных
+        сортировок не найдена, возвращается None и используется сортировка базы по умолчанию.
+        """
+        if self._resolved_collation is not None:
+            return self._resolved_collation or None
+        candidates = [self.sort_collation] if self.sort_collation else []
+        candidates += RUSSIAN_COLLATIONS
+        with self.cursor(False) as cursor:
+            cursor.execute("SELECT collname FROM pg_collation WHERE collname = ANY(%s)", (candidates,))
+            available = {row[0] for row in cursor.fetchall()}
+        self._resolved_collation = next((name for name in candidates if name in available), "")
+        if not self._resolved_collation:
+            logger.warning(f"Русская сортировка не найдена среди {candidates}, используется сортировка по умолчанию")
+        return self._resolved_collation or None
+
     @contextlib.contextmanager
     def cursor(self, commit=True) -> psycopg.Cursor:
         if not self.connection:
@@ -1,12 +1,30 @@
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional, Iterable, Sequence
 
 from loguru import logger
 
 from database.base import Base
 from database.connection import Connection
+from database.migrations import LOOKUP_TABLES
+from database.phone import PhoneIndex, normalize_phone, normalize_phone_prefix
+from database.phonetic import CANDIDATE_PREFIX_LENGTH, edit_distance, max_distance, normalize_name, phonetic_key
+from database.tracing import span
+from schema.search import ValueMatch
+
+LABEL_SORT_COLUMNS = {
+    "name_id": "n.name",
+    "surname_id": "s.surname",
+    "patronymic_id": "p.patronymic",
+    "street_id": "st.street",
+}
 
 
 class Entry(Base):
+    # Диапазон и порядок номеров побайтовые, как в индексе entries_phone_pattern_idx (text_pattern_ops)
+    phone_range_condition = "e.phone ~>=~ %s AND e.phone ~<~ %s"
+    phone_order = "e.phone USING ~<~"
+    # Диапазон начала ключа побайтовый, как в индексах ключей нечёткого поиска (text_pattern_ops)
+    key_range_condition = "{column} ~>=~ %s AND {column} ~<~ %s"
+
     def __init__(self, connection: Connection):
         super().__init__("entries", [
             "entry_id", "name_id", "surname_id", "patronymic_id",
@@ -20,28 +38,57 @@ class Entry(Base):
         parsed = [(list(item.values())[0], list(item.values())[1]) for item in json_data]
         return sorted(parsed, key=lambda x: x[0])
 
-    def get_all(self) -> List[Dict[str, List[Tuple[int, str]]]]:
-        logger.info(f"Получение всех записей из таблицы {self.table_name} со связями")
-        with self.connection.cursor(False) as cursor:
-            cursor.execute("""
-                SELECT 
-                    e.entry_id, 
-                    n.name_id, 
-                    s.surname_id, 
-                    p.patronymic_id, 
-                    st.street_id, 
-                    e.building, 
-                    e.apartment, 
-                    e.phone
-                FROM entries e
-                LEFT JOIN names n ON e.name_id = n.name_id
-                LEFT JOIN surnames s ON e.surname_id = s.surname_id
-                LEFT JOIN patronymics p ON e.patronymic_id = p.patronymic_id
-                LEFT JOIN streets st ON e.street_id = st.street_id
-            """)
-            result = cursor.fetchall()
+    def _sort_expression(self, column: str) -> str:
+        """Связанные колонки сортируются по значению из родительской таблицы, а не по ID"""
+        collation = self.connection.get_sort_collation()
+        collate = f' COLLATE "{collation}"' if collation else ""
+        if column in LABEL_SORT_COLUMNS:
+            return LABEL_SORT_COLUMNS[column] + collate
+        if column == "building":
+            return f"e.building{collate}"
+        return f"e.{column}"
+
+    def _search_expressions(self) -> List[str]:
+        """Поиск выполняется по отображаемым значениям: для связанных колонок - по значению из родительской таблицы"""
+        return ["CAST(e.entry_id AS text)", "n.name", "s.surname", "p.patronymic", "st.street",
+                "e.building", "CAST(e.apartment AS text)", "e.phone"]
+
+    def _select_query(self, order_by: Optional[str] = None, descending: bool = False,
+                      limit: Optional[int] = None, offset: int = 0,
+                      after: Optional[Sequence[Any]] = None, search: Optional[str] = None,
+                      fuzzy: bool = False) -> Tuple[str, List[Any]]:
+        """
+        Запрос выборки записей со связями. Внешние ключи объявлены NOT NULL, поэтому используются
+        внутренние соединения: так планировщик может читать записи в порядке индекса родительской таблицы.
+        """
+        order_clause = self._order_clause(order_by, descending)
+        where, params = self._where_clause(order_by, descending, after, search, fuzzy)
+        page_clause, page_params = self._page_clause(limit, offset)
+        sort_key = f", {self._sort_expression(order_by)}" if order_by else ""
+        query = f"""
+            SELECT 
+                e.entry_id, 
+                n.name_id, 
+                s.surname_id, 
+                p.patronymic_id, 
+                st.street_id, 
+                e.building, 
+                e.apartment, 
+                e.phone{sort_key}
+            FROM entries e
+            JOIN names n ON e.name_id = n.name_id
+            JOIN surnames s ON e.surname_id = s.surname_id
+            JOIN patronymics p ON e.patronymic_id = p.patronymic_id
+            JOIN streets st ON e.street_id = st.street_id
+            {where}
+            {order_clause}{page_clause}
+        """
+        return query, params + page_params
+
+    def _materialize(self, rows: List[tuple]) -> List[Dict[str, Any]]:
+        with span("entries.materialize"):
             clean = []
-            for row in result:
+            for row in rows:
                 values = []
                 for row_value in row:
                     if isinstance(row_value, str):
@@ -53,7 +100,7 @@ class Entry(Base):
                         values.append(row_value)
                 clean.append(values)
 
-            result = [{
+            return [{
                 "entry_id": row[0],
                 "name_id": row[1],
                 "surname_id": row[2],
@@ -63,7 +110,16 @@ class Entry(Base):
                 "apartment": row[6],
                 "phone": row[7]
             } for row in clean]
-            return result
+
+    def get_all(self, order_by: Optional[str] = None, descending: bool = False,
+                limit: Optional[int] = None, offset: int = 0) -> List[Dict[str, List[Tuple[int, str]]]]:
+        logger.info(f"Получение всех записей из таблицы {self.table_name} со связями")
+        query, params = self._select_query(order_by, descending, limit, offset)
+        with self.connection.cursor(False) as cursor:
+            with span("entries.query"):
+                cursor.execute(query, params)
+                result = cursor.fetchall()
+        return self._materialize(result)
 
     def get_default_entry_data(self) -> dict:
         with self.connection.cursor(False) as cursor:
@@ -88,10 +144,185 @@ class Entry(Base):
             "phone": result[6]
         }
 
+    @staticmethod
+    def _normalize(data: dict) -> dict:
+        """Номер телефона записывается в базу только в формате E.164"""
+        if "phone" in data:
+            return {**data, "phone": normalize_phone(data["phone"])}
+        return data
+
+    @staticmethod
+    def _normalize_rows(rows: Iterable[Sequence[Any]]) -> Iterable[tuple]:
+        """Строки bulk_insert с номером телефона (последняя колонка) в формате E.164"""
+        return ((*row[:-1], normalize_phone(row[-1])) for row in rows)
+
+    def create(self, data_list: List[dict]) -> List[dict]:
+        return super().create([self._normalize(data) for data in data_list])
+
+    def update(self, data: dict, target_id: str) -> tuple:
+        return super().update(self._normalize(data), target_id)
+
+    def update_many(self, data: dict, target_ids: Sequence[Any]) -> int:
+        return super().update_many(self._normalize(data), target_ids)
+
+    def _phone_prefix_query(self, prefix: str, limit: int) -> Tuple[str, List[Any]]:
+        query = (f"SELECT {', '.join(f'e.{column}' for column in self.columns)} FROM entries e "
+                 f"WHERE {self.phone_range_condition} ORDER BY {self.phone_order}, e.entry_id LIMIT %s")
+        return query, self._prefix_range(prefix) + [limit]
+
+    def find_by_phone(self, phone: str) -> List[Dict[str, Any]]:
+        """
+        Записи с номером телефона phone.
+
+        :param phone: Номер в любой записи, приводится к E.164.
+        :raises ValueError: Номер нельзя привести к E.164.
+        """
+        query = (f"SELECT {', '.join(f'e.{column}' for column in self.columns)} FROM entries e "
+                 f"WHERE e.phone = %s ORDER BY e.entry_id")
+        with self.exception_handler(), self.connection.cursor(False) as cursor, span("entries.find_by_phone"):
+            cursor.execute(query, (normalize_phone(phone),))
+            return self._materialize(cursor.fetchall())
+
+    def find_by_phone_prefix(self, prefix: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Записи, номер телефона которых начинается с prefix, в порядке номера.
+
+        Запрос читает диапазон индекса entries_phone_pattern_idx, поэтому его стоимость
+        зависит от limit, а не от размера справочника.
+
+        :param prefix: Начало номера: с «+» и кодом страны или с 8 для российских номеров.
+        :param limit: Максимальное количество записей.
+        """
+        query, params = self._phone_prefix_query(normalize_phone_prefix(prefix), limit)
+        with self.exception_handler(), self.connection.cursor(False) as cursor, span("entries.find_by_phone_prefix"):
+            cursor.execute(query, params)
+            return self._materialize(cursor.fetchall())
+
+    @staticmethod
+    def _prefix_range(prefix: str) -> List[str]:
+        # Верхняя граница диапазона - префикс с увеличенным последним символом
+        return [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+
+    def _match_query(self, normalized: str, key: str, limit: int) -> Tuple[str, List[Any]]:
+        """Кандидаты в похожие значения из всех родительских таблиц по началу или концу значения или по началу ключа"""
+        queries, params = [], []
+        for table_name, (id_column, data_column) in LOOKUP_TABLES.items():
+            conditions = " OR ".join(f"({self.key_range_condition.format(column=f'{data_column}_{suffix}')})"
+                                     for suffix in ("normalized", "reversed", "phonetic"))
+            queries.append(f"SELECT '{table_name}', {id_column}, {data_column}, {data_column}_normalized, "
+                           f"{data_column}_phonetic FROM {table_name} WHERE ({conditions}) "
+                           f"AND (length({data_column}_normalized) BETWEEN %s AND %s OR {data_column}_phonetic = %s)")
+            params += self._prefix_range(normalized[:CANDIDATE_PREFIX_LENGTH])
+            params += self._prefix_range(normalized[::-1][:CANDIDATE_PREFIX_LENGTH])
+            params += self._prefix_range(key[:CANDIDATE_PREFIX_LENGTH] or normalized[:CANDIDATE_PREFIX_LENGTH])
+            params += [len(normalized) - limit, len(normalized) + limit, key]
+        return " UNION ALL ".join(queries), params
+
+    def _match_word(self, cursor, word: str) -> List[ValueMatch]:
+        """
+        Значения родительских таблиц, похожие на слово word, в порядке расстояния редактирования.
+
+        Кандидаты читаются по индексам начала и конца нормализованного значения и начала фонетического
+        ключа родительских таблиц, таблица записей не читается. Подходят кандидаты с допустимым количеством
+        опечаток (см. max_distance) и кандидаты с тем же фонетическим ключом.
+        """
+        normalized, key = normalize_name(word), phonetic_key(word)
+        if not normalized:
+            return []
+        limit = max_distance(normalized)
+        cursor.execute(*self._match_query(normalized, key, limit))
+        matches = []
+        for table_name, value_id, value, value_normalized, value_key in cursor.fetchall():
+            distance = edit_distance(normalized, value_normalized, limit)
+            if distance <= limit or value_key == key:
+                matches.append(ValueMatch(table_name=table_name, value_id=value_id, value=value.strip(),
+                                          distance=distance, same_sound=value_key == key))
+        return sorted(matches, key=lambda match: (match.distance, not match.same_sound, match.value))
+
+    def match_values(self, text: str) -> List[List[ValueMatch]]:
+        """
+        Похожие значения имён, фамилий, отчеств и улиц для каждого слова строки text.
+
+        :return: Для каждого слова - совпавшие значения в порядке расстояния редактирования.
+        """
+        with self.exception_handler(), self.connection.cursor(False) as cursor, span("entries.match_values"):
+            return [self._match_word(cursor, word) for word in text.split()]
+
+    def _fuzzy_terms(self, text: str) -> List[List[Tuple[int, str, List[Any]]]]:
+        """
+        Условия на записи для каждого слова строки text: (расстояние, условие, параметры)
+        по возрастанию расстояния. Условия используют индексы внешних ключей записей.
+        """
+        terms = []
+        for matches in self.match_values(text):
+            by_distance: Dict[int, Dict[str, List[int]]] = {}
+            for match in matches:
+                id_column = LOOKUP_TABLES[match.table_name][0]
+                by_distance.setdefault(match.distance, {}).setdefault(id_column, []).append(match.value_id)
+            terms.append([
+                (distance, " OR ".join(self._match_any(f"e.{id_column}") for id_column in ids),
+                 [self._any_param(values) for values in ids.values()])
+                for distance, ids in sorted(by_distance.items())
+            ])
+        return terms
+
+    def _fuzzy_condition(self, search: str) -> Tuple[str, List[Any]]:
+        """Каждое слово строки поиска похоже на имя, фамилию, отчество или улицу записи"""
+        return self._terms_condition(self._fuzzy_terms(search))
+
+    @staticmethod
+    def _terms_condition(terms: List[List[Tuple[int, str, List[Any]]]]) -> Tuple[str, List[Any]]:
+        conditions, params = [], []
+        for word_terms in terms:
+            if not word_terms:
+                return "1 = 0", []
+            conditions.append(" OR ".join(f"({condition})" for _, condition, _ in word_terms))
+            params += [param for _, _, term_params in word_terms for param in term_params]
+        return " AND ".join(f"({condition})" for condition in conditions) or "1 = 1", params
+
+    def find_similar(self, text: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Записи, имя, фамилия, отчество или улица которых похожи на слова строки text.
+
+        Записи упорядочены по сумме расстояний редактирования совпавших значений, затем по ID.
+        Похожие значения ищутся в родительских таблицах, а записи выбираются по их ID через индексы
+        внешних ключей, поэтому время поиска почти не зависит от количества записей.
+        """
+        terms = self._fuzzy_terms(text)
+        if not terms or not all(terms):
+            return []
+        ranks, rank_params = [], []
+        for word_terms in terms:
+            ranks.append("CASE " + " ".join(f"WHEN {condition} THEN {distance}" for distance, condition, _ in word_terms)
+                         + " END")
+            rank_params += [param for _, _, term_params in word_terms for param in term_params]
+        condition, params = self._terms_condition(terms)
+        query = (f"SELECT {', '.join(f'e.{column}' for column in self.columns)} FROM entries e "
+                 f"WHERE {condition} ORDER BY {' + '.join(ranks)}, e.entry_id LIMIT %s")
+        with self.exception_handler(), self.connection.cursor(False) as cursor, span("entries.find_similar"):
+            cursor.execute(query, params + rank_params + [limit])
+            return self._materialize(cursor.fetchall())
+
+    def _stream_rows(self, cursor, query: str, types: List[str]) -> Iterable[tuple]:
+        """Строки запроса потоком через COPY, без загрузки всего результата в память"""
+        with cursor.copy(f"COPY ({query}) TO STDOUT") as copy:
+            copy.set_types(types)
+            yield from copy.rows()
+
+    def load_phone_index(self) -> PhoneIndex:
+        """
+        Загружает номера телефонов всех записей в PhoneIndex для поиска без обращения к базе данных.
+        """
+        query = f"SELECT e.phone, e.entry_id FROM entries e ORDER BY length(e.phone), {self.phone_order}, e.entry_id"
+        with self.exception_handler(), self.connection.cursor(False) as cursor, span("entries.load_phone_index"):
+            index = PhoneIndex(self._stream_rows(cursor, query, ["text", "int8"]))
+        logger.debug(f"Загружено номеров в индекс: {len(index)}")
+        return index
+
     def duplicate(self, entry_ids: List[str]) -> List[Dict]:
         logger.info(f"Дублирование записей с ID {entry_ids}")
         with self.connection.cursor() as cursor:
-            query = """
+            query = f"""
                 INSERT INTO entries (name_id, surname_id, patronymic_id, street_id, building, apartment, phone)
                 SELECT 
                     name_id, 
@@ -102,10 +333,11 @@ class Entry(Base):
                     apartment, 
                     phone
                 FROM entries
-                WHERE entry_id = ANY(%s)
+                WHERE {self._match_any("entry_id")}
+                ORDER BY entry_id
                 RETURNING entry_id, name_id, surname_id, patronymic_id, street_id, building, apartment, phone
             """
-            cursor.execute(query, (entry_ids,))
+            cursor.execute(query, (self._any_param(entry_ids),))
             results = cursor.fetchall()
             logger.success(f"Дублирование записей успешно выполнено")
             result_dicts = [
@@ -123,3 +355,19 @@ class Entry(Base):
             ]
             return result_dicts
 
+    def bulk_insert(self, rows: Iterable[Sequence[Any]]) -> int:
+        """
+        Загружает записи через COPY одной транзакцией, номера телефонов приводятся к E.164.
+
+        :param rows: Значения колонок записи без entry_id, в порядке self.columns.
+        :return: Количество загруженных записей.
+        """
+        columns = [column for column in self.columns if column != self.primary_key]
+        count = 0
+        with self.exception_handler(), self.connection.cursor() as cursor, \
+                cursor.copy(f"COPY {self.table_name} ({', '.join(columns)}) FROM STDIN") as copy:
+            for row in self._normalize_rows(rows):
+                copy.write_row(row)
+                count += 1
+        logger.debug(f"Загружено записей через COPY: {count}")
+        return count
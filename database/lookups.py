@@ -0,0 +1,28 @@
+from typing import Dict, List
+
+from database.connection import Connection
+from database.migrations import LOOKUP_TABLES
+from database.storage import create_table
+
+
+class LabelResolver:
+    """
+    Кеш соответствия значений родительских таблиц их ID.
+
+    Неизвестные значения запрашиваются пачкой через Base.get_or_create_ids,
+    поэтому на каждую пачку записей приходится не больше одного запроса на таблицу.
+    """
+
+    def __init__(self, connection: Connection):
+        self.tables = {
+            data_column: create_table(table_name, [id_column, data_column], connection, id_column)
+            for table_name, (id_column, data_column) in LOOKUP_TABLES.items()
+        }
+        self.cache = {data_column: {} for data_column in self.tables}
+
+    def resolve(self, data_column: str, values: List[str]) -> Dict[str, int]:
+        known = self.cache[data_column]
+        unknown = {value for value in values if value not in known}
+        if unknown:
+            known.update(self.tables[data_column].get_or_create_ids(data_column, list(unknown)))
+        return known
@@ -0,0 +1,599 @@
+from typing import List, Callable, Dict, Tuple, Union, Any
+
+import psycopg
+from loguru import logger
+
+from database.connection import Connection
+from database.phone import E164_PATTERN
+from database.phonetic import normalize_name_sql, phonetic_key_sql
+from schema.plan import PlanIssue
+
+LOOKUP_TABLES: Dict[str, Tuple[str, str]] = {
+    "names": ("name_id", "name"),
+    "surnames": ("surname_id", "surname"),
+    "patronymics": ("patronymic_id", "patronymic"),
+    "streets": ("street_id", "street"),
+}
+
+MIGRATIONS_LOCK_ID = 7_412_001
+
+MigrationStep = Union[str, Callable[[psycopg.Cursor, Connection], None]]
+
+
+def _create_tables(cursor: psycopg.Cursor, connection: Connection) -> None:
+    for table_name, (id_column, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                {id_column} serial PRIMARY KEY,
+                {data_column} text NOT NULL
+            )
+        """)
+    foreign_keys = ",\n".join(
+        f"{id_column} integer NOT NULL REFERENCES {table_name} ({id_column})"
+        for table_name, (id_column, _) in LOOKUP_TABLES.items()
+    )
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS entries (
+            entry_id serial PRIMARY KEY,
+            {foreign_keys},
+            building text NOT NULL DEFAULT '',
+            apartment integer NOT NULL DEFAULT 0,
+            phone text NOT NULL
+        )
+    """)
+
+
+def _create_foreign_key_indexes(cursor: psycopg.Cursor, connection: Connection) -> None:
+    for id_column, _ in LOOKUP_TABLES.values():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS entries_{id_column}_idx ON entries ({id_column})")
+    cursor.execute("CREATE INDEX IF NOT EXISTS entries_phone_idx ON entries (phone)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS entries_apartment_idx ON entries (apartment)")
+
+
+def _create_sort_indexes(cursor: psycopg.Cursor, connection: Connection) -> None:
+    collation = connection.get_sort_collation()
+    collate = f' COLLATE "{collation}"' if collation else ""
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_{data_column}_sort_idx "
+                       f"ON {table_name} ({data_column}{collate})")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS entries_building_sort_idx ON entries (building{collate})")
+
+
+def find_duplicate_values(cursor: psycopg.Cursor, limit: int = 5) -> Dict[str, List[str]]:
+    """
+    Ищет повторяющиеся значения в родительских таблицах.
+
+    :param cursor: Курсор, в транзакции которого выполняется поиск.
+    :param limit: Максимальное количество примеров значений для каждой таблицы.
+    :return: Словарь имя таблицы -> примеры повторяющихся значений, таблицы без повторов не включаются.
+    """
+    duplicates = {}
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"""
+            SELECT {data_column} FROM {table_name}
+            GROUP BY {data_column} HAVING count(*) > 1
+            ORDER BY {data_column} LIMIT %s
+        """, (limit,))
+        values = [row[0] for row in cursor.fetchall()]
+        if values:
+            duplicates[table_name] = values
+    return duplicates
+
+
+def _make_lookup_values_unique(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Ограничения уникальности значений родительских таблиц.
+
+    Повторяющиеся значения не объединяются автоматически: это изменяет записи справочника,
+    поэтому миграция прерывается, а объединение выполняется отдельной командой.
+    """
+    duplicates = find_duplicate_values(cursor)
+    if duplicates:
+        details = "; ".join(f"{table_name}: {', '.join(map(repr, values))}" for table_name, values in duplicates.items())
+        raise ValueError(f"В родительских таблицах есть повторяющиеся значения ({details}). "
+                         f"Объедините их командой «python cli.py merge-duplicates --yes» и повторите запуск")
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (f"{table_name}_{data_column}_key",))
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table_name} "
+                           f"ADD CONSTRAINT {table_name}_{data_column}_key UNIQUE ({data_column})")
+
+
+def _create_search_indexes(cursor: psycopg.Cursor, connection: Connection) -> None:
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_{data_column}_search_idx "
+                       f"ON {table_name} (lower({data_column}) text_pattern_ops)")
+
+
+SYNC_TABLES: Dict[str, str] = {
+    **{table_name: id_column for table_name, (id_column, _) in LOOKUP_TABLES.items()},
+    "entries": "entry_id",
+}
+
+
+def _create_row_versions(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Версии строк для синхронизации локального кеша.
+
+    Версия строки - номер транзакции (xid8), которая её записала. Удалённые строки сохраняются
+    в deleted_rows, а TRUNCATE увеличивает эпоху в sync_state: после него кеш загружается заново.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            singleton boolean PRIMARY KEY DEFAULT true CHECK (singleton),
+            database_id uuid NOT NULL DEFAULT gen_random_uuid(),
+            epoch bigint NOT NULL DEFAULT 1
+        )
+    """)
+    cursor.execute("INSERT INTO sync_state DEFAULT VALUES ON CONFLICT DO NOTHING")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deleted_rows (
+            table_name text NOT NULL,
+            row_id integer NOT NULL,
+            row_version bigint NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS deleted_rows_version_idx ON deleted_rows (table_name, row_version)")
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION set_row_version() RETURNS trigger AS $$
+        BEGIN
+            NEW.row_version := pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION record_deleted_row() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO deleted_rows (table_name, row_id, row_version)
+            VALUES (TG_TABLE_NAME, (to_jsonb(OLD) ->> TG_ARGV[0])::integer, pg_current_xact_id()::text::bigint);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION bump_sync_epoch() RETURNS trigger AS $$
+        BEGIN
+            UPDATE sync_state SET epoch = epoch + 1;
+            DELETE FROM deleted_rows WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table_name, id_column in SYNC_TABLES.items():
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS row_version bigint NOT NULL DEFAULT 0")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_row_version_idx ON {table_name} (row_version)")
+        cursor.execute(f"""
+            CREATE TRIGGER {table_name}_row_version BEFORE INSERT OR UPDATE ON {table_name}
+            FOR EACH ROW EXECUTE FUNCTION set_row_version()
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table_name}_deleted AFTER DELETE ON {table_name}
+            FOR EACH ROW EXECUTE FUNCTION record_deleted_row('{id_column}')
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table_name}_truncated AFTER TRUNCATE ON {table_name}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_sync_epoch()
+        """)
+
+
+CHANGES_CHANNEL = "phone_table_changes"
+CHANGE_EVENT_MAX_IDS = 500
+# Параметр сеанса: если он равен on, уведомления об изменениях этого сеанса не отправляются
+SUPPRESS_NOTIFY_SETTING = "phone_table.suppress_notify"
+
+
+def _notify_row_changes_function(guard: str = "") -> str:
+    """Функция триггеров уведомлений; guard - проверка в начале функции, после которой она может завершиться"""
+    return f"""
+        CREATE OR REPLACE FUNCTION notify_row_changes() RETURNS trigger AS $$
+        DECLARE
+            ids jsonb;
+        BEGIN
+            {guard}
+            IF TG_OP = 'INSERT' OR TG_OP = 'UPDATE' THEN
+                SELECT jsonb_agg(id) INTO ids
+                FROM (SELECT to_jsonb(r) -> TG_ARGV[0] AS id FROM new_rows r LIMIT {CHANGE_EVENT_MAX_IDS + 1}) s;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT jsonb_agg(id) INTO ids
+                FROM (SELECT to_jsonb(r) -> TG_ARGV[0] AS id FROM old_rows r LIMIT {CHANGE_EVENT_MAX_IDS + 1}) s;
+            END IF;
+            IF TG_OP <> 'TRUNCATE' AND ids IS NULL THEN
+                RETURN NULL;
+            END IF;
+            IF jsonb_array_length(ids) > {CHANGE_EVENT_MAX_IDS} THEN
+                ids := NULL;
+            END IF;
+            PERFORM pg_notify('{CHANGES_CHANNEL}', jsonb_build_object(
+                'table', TG_TABLE_NAME, 'op', left(TG_OP, 1), 'ids', ids
+            )::text);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """
+
+
+def _create_change_notifications(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Уведомления об изменениях для других клиентов через NOTIFY.
+
+    Уведомление отправляется на каждую команду, а не на строку: {"table", "op", "ids"}, где op - I, U, D или T
+    (TRUNCATE). Если команда изменила больше CHANGE_EVENT_MAX_IDS строк, ids = null и таблица перечитывается
+    целиком: размер уведомления ограничен 8000 байтами.
+    """
+    cursor.execute(_notify_row_changes_function())
+    for table_name, id_column in SYNC_TABLES.items():
+        for operation, transition in [("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")]:
+            cursor.execute(f"""
+                CREATE TRIGGER {table_name}_notify_{operation.lower()} AFTER {operation} ON {table_name}
+                REFERENCING {transition} TABLE AS {transition.lower()}_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_row_changes('{id_column}')
+            """)
+        cursor.execute(f"""
+            CREATE TRIGGER {table_name}_notify_truncate AFTER TRUNCATE ON {table_name}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_row_changes('{id_column}')
+        """)
+
+
+def _normalize_phones(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Номера телефонов в формате E.164 (см. database/phone.py) и индекс поиска по началу номера.
+
+    Функция normalize_phone повторяет правила приложения и возвращает NULL для номеров, которые нельзя
+    привести однозначно: такие номера остаются как есть, а ограничение формата проверяется только
+    для новых значений, пока они не будут исправлены. В базах, созданных до миграций, колонка phone
+    может быть числовой или varchar ограниченной длины: её тип меняется на text с приведением номеров.
+    """
+    cursor.execute(r"""
+        CREATE OR REPLACE FUNCTION normalize_phone(phone text) RETURNS text AS $$
+            SELECT CASE
+                WHEN btrim(phone) LIKE '+%' THEN
+                    CASE WHEN digits ~ '^[1-9][0-9]{7,14}$' THEN '+' || digits END
+                WHEN digits ~ '^[78][0-9]{10}$' THEN '+7' || substr(digits, 2)
+                WHEN digits ~ '^[0-9]{10}$' THEN '+7' || digits
+            END
+            FROM (SELECT regexp_replace(phone, '\D', '', 'g') AS digits) d
+        $$ LANGUAGE sql IMMUTABLE STRICT
+    """)
+    cursor.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'entries' AND column_name = 'phone'
+    """)
+    phone_type = cursor.fetchone()[0]
+    if phone_type != "text":
+        logger.info(f"Тип колонки entries.phone меняется с {phone_type} на text")
+        cursor.execute("ALTER TABLE entries ALTER COLUMN phone TYPE text "
+                       "USING coalesce(normalize_phone(phone::text), phone::text)")
+    cursor.execute("""
+        UPDATE entries SET phone = normalize_phone(phone)
+        WHERE normalize_phone(phone) IS NOT NULL AND normalize_phone(phone) <> phone
+    """)
+    logger.info(f"Номеров телефонов приведено к E.164: {cursor.rowcount}")
+    cursor.execute(f"ALTER TABLE entries ADD CONSTRAINT entries_phone_e164 CHECK (phone ~ '{E164_PATTERN}') NOT VALID")
+    cursor.execute(f"SELECT count(*) FROM entries WHERE phone !~ '{E164_PATTERN}'")
+    invalid = cursor.fetchone()[0]
+    if invalid:
+        logger.warning(f"Номеров телефонов, которые не удалось привести к E.164: {invalid}")
+    else:
+        cursor.execute("ALTER TABLE entries VALIDATE CONSTRAINT entries_phone_e164")
+    cursor.execute("CREATE INDEX IF NOT EXISTS entries_phone_pattern_idx ON entries (phone text_pattern_ops)")
+
+
+ENTRY_COUNTERS: Dict[str, List[str]] = {
+    "street_counts": ["street_id"],
+    "surname_counts": ["surname_id"],
+    "building_counts": ["street_id", "building"],
+}
+
+
+def _counter_delta_query(key: str, sources: List[Tuple[str, int]]) -> str:
+    """Изменение количества записей по ключу key для строк переходных таблиц sources (таблица, знак)"""
+    rows = " UNION ALL ".join(f"SELECT {key}, {sign} AS delta FROM {table}" for table, sign in sources)
+    return f"SELECT {key}, sum(delta) FROM ({rows}) d GROUP BY {key} HAVING sum(delta) <> 0 ORDER BY {key}"
+
+
+def _create_entry_counters(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Количество записей по улицам, фамилиям и домам для статистики.
+
+    Счётчики обновляются триггерами на команду, а не на строку: изменения команды группируются по ключу,
+    и каждый счётчик обновляется один раз, поэтому массовая загрузка не создаёт очередь обновлений одних
+    и тех же строк. Ключи обновляются по порядку, чтобы параллельные команды не блокировали друг друга
+    взаимно. Счётчики с нулевым значением удаляются.
+    """
+    column_types = {"street_id": "integer", "surname_id": "integer", "building": "text"}
+    for table_name, key_columns in ENTRY_COUNTERS.items():
+        columns = ", ".join(f"{column} {column_types[column]} NOT NULL" for column in key_columns)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                {columns},
+                entry_count bigint NOT NULL,
+                PRIMARY KEY ({', '.join(key_columns)})
+            )
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_entry_count_idx "
+                       f"ON {table_name} (entry_count DESC, {', '.join(key_columns)})")
+
+    branches = []
+    for operation, sources in [("INSERT", [("new_rows", 1)]), ("UPDATE", [("new_rows", 1), ("old_rows", -1)]),
+                               ("DELETE", [("old_rows", -1)])]:
+        statements = []
+        for table_name, key_columns in ENTRY_COUNTERS.items():
+            key = ", ".join(key_columns)
+            statements.append(f"""
+                INSERT INTO {table_name} ({key}, entry_count) {_counter_delta_query(key, sources)}
+                ON CONFLICT ({key}) DO UPDATE SET entry_count = {table_name}.entry_count + excluded.entry_count;""")
+            if operation != "INSERT":
+                statements.append(f"DELETE FROM {table_name} WHERE entry_count = 0;")
+        branches.append(f"IF TG_OP = '{operation}' THEN {''.join(statements)} END IF;")
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION update_entry_counters() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                TRUNCATE {', '.join(ENTRY_COUNTERS)};
+            END IF;
+            {' '.join(branches)}
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("""
+        CREATE TRIGGER entries_counters_insert AFTER INSERT ON entries
+        REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION update_entry_counters()
+    """)
+    cursor.execute("""
+        CREATE TRIGGER entries_counters_update AFTER UPDATE ON entries
+        REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_entry_counters()
+    """)
+    cursor.execute("""
+        CREATE TRIGGER entries_counters_delete AFTER DELETE ON entries
+        REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION update_entry_counters()
+    """)
+    cursor.execute("""
+        CREATE TRIGGER entries_counters_truncate AFTER TRUNCATE ON entries
+        FOR EACH STATEMENT EXECUTE FUNCTION update_entry_counters()
+    """)
+    rebuild_entry_counters(cursor)
+
+
+def rebuild_entry_counters(cursor: psycopg.Cursor) -> None:
+    """Пересчитывает счётчики ENTRY_COUNTERS по таблице записей"""
+    for table_name, key_columns in ENTRY_COUNTERS.items():
+        key = ", ".join(key_columns)
+        cursor.execute(f"DELETE FROM {table_name}")
+        cursor.execute(f"INSERT INTO {table_name} ({key}, entry_count) "
+                       f"SELECT {key}, count(*) FROM entries GROUP BY {key}")
+
+
+def _record_deletes_by_root_table(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Журнал удалений записывает имя таблицы из второго аргумента триггера.
+
+    Строчные триггеры секционированной таблицы выполняются на секциях, и TG_TABLE_NAME содержит имя секции,
+    а кеш читает удаления по имени основной таблицы (см. database/partitions.py).
+    """
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION record_deleted_row() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO deleted_rows (table_name, row_id, row_version)
+            VALUES (coalesce(TG_ARGV[1], TG_TABLE_NAME), (to_jsonb(OLD) ->> TG_ARGV[0])::integer,
+                    pg_current_xact_id()::text::bigint);
+            RETURN OLD;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table_name, id_column in SYNC_TABLES.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_deleted ON {table_name}")
+        cursor.execute(f"""
+            CREATE TRIGGER {table_name}_deleted AFTER DELETE ON {table_name}
+            FOR EACH ROW EXECUTE FUNCTION record_deleted_row('{id_column}', '{table_name}')
+        """)
+
+
+def _create_phonetic_keys(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Нормализованные значения и фонетические ключи родительских таблиц для нечёткого поиска.
+
+    Функции строятся из правил database/phonetic.py, колонки вычисляются при записи значения,
+    индексы text_pattern_ops позволяют искать кандидатов по началу ключа.
+    """
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION normalize_name(value text) RETURNS text AS $$
+            SELECT {normalize_name_sql("value")}
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    """)
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION phonetic_key(value text) RETURNS text AS $$
+            SELECT {phonetic_key_sql("normalize_name(value)")}
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    """)
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        for suffix, function in (("normalized", "normalize_name"), ("phonetic", "phonetic_key")):
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {data_column}_{suffix} text "
+                           f"GENERATED ALWAYS AS ({function}({data_column})) STORED")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_{data_column}_{suffix}_idx "
+                           f"ON {table_name} ({data_column}_{suffix} text_pattern_ops)")
+
+
+def _create_cache_clients(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Границы синхронизации локальных кешей для очистки журнала удалений.
+
+    Строки deleted_rows с версией меньше deleted_rows_horizon удалены, поэтому кеш с более старой
+    границей загружается заново (см. database/cache.py).
+    """
+    cursor.execute("ALTER TABLE sync_state ADD COLUMN IF NOT EXISTS deleted_rows_horizon bigint NOT NULL DEFAULT 0")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_clients (
+            client_id uuid PRIMARY KEY,
+            watermark bigint NOT NULL,
+            synced_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def _suppress_notifications_by_setting(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Уведомления об изменениях не отправляются из сеансов, в которых SUPPRESS_NOTIFY_SETTING = on.
+
+    Параметр устанавливают подключения массовой загрузки (см. database/partitions.py): загрузка
+    сообщает о себе одним уведомлением, а не уведомлением на каждую команду.
+    """
+    cursor.execute(_notify_row_changes_function(
+        f"IF current_setting('{SUPPRESS_NOTIFY_SETTING}', true) = 'on' THEN RETURN NULL; END IF;"))
+
+
+def _create_reversed_names(cursor: psycopg.Cursor, connection: Connection) -> None:
+    """
+    Нормализованные значения родительских таблиц в обратном порядке для нечёткого поиска.
+
+    Индекс по началу перевёрнутого значения - поиск по концу значения: он находит кандидатов
+    с опечаткой в первых буквах, которых не находят индексы начала значения и ключа.
+    """
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION reversed_name(value text) RETURNS text AS $$
+            SELECT reverse(normalize_name(value))
+        $$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+    """)
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS {data_column}_reversed text "
+                       f"GENERATED ALWAYS AS (reversed_name({data_column})) STORED")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_{data_column}_reversed_idx "
+                       f"ON {table_name} ({data_column}_reversed text_pattern_ops)")
+
+
+MIGRATIONS: List[Tuple[int, str, List[MigrationStep]]] = [
+    (1, "Базовые таблицы справочника", [_create_tables]),
+    (2, "Индексы внешних ключей и сортировки", [_create_foreign_key_indexes, _create_sort_indexes]),
+    (3, "Уникальные значения в родительских таблицах", [_make_lookup_values_unique]),
+    (4, "Индексы поиска по значениям родительских таблиц", [_create_search_indexes]),
+    (5, "Версии строк и журнал удалений для синхронизации кеша", [_create_row_versions]),
+    (6, "Уведомления об изменениях строк для других клиентов", [_create_change_notifications]),
+    (7, "Номера телефонов в формате E.164 и индекс поиска по началу номера", [_normalize_phones]),
+    (8, "Счётчики записей по улицам, фамилиям и домам", [_create_entry_counters]),
+    (9, "Имя основной таблицы в журнале удалений для секционирования", [_record_deletes_by_root_table]),
+    (10, "Фонетические ключи значений родительских таблиц для нечёткого поиска", [_create_phonetic_keys]),
+    (11, "Границы синхронизации локальных кешей для очистки журнала удалений", [_create_cache_clients]),
+    (12, "Отключение уведомлений об изменениях для сеансов массовой загрузки", [_suppress_notifications_by_setting]),
+    (13, "Значения родительских таблиц в обратном порядке для поиска опечаток в первых буквах", [_create_reversed_names]),
+]
+
+
+def get_schema_version(connection: Connection) -> int:
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version integer PRIMARY KEY,
+                description text NOT NULL,
+                applied_at timestamptz NOT NULL DEFAULT now()
+            )
+        """)
+        cursor.execute("SELECT coalesce(max(version), 0) FROM schema_migrations")
+        return cursor.fetchone()[0]
+
+
+def migrate(connection: Connection) -> int:
+    """
+    Применяет к базе данных все ещё не применённые миграции.
+
+    Каждая миграция выполняется в отдельной транзакции под advisory-блокировкой,
+    поэтому одновременный запуск нескольких клиентов безопасен.
+
+    :param connection: Подключение к базе данных.
+    :return: Версия схемы после применения миграций.
+    """
+    from database.sqlite import SQLiteConnection, migrate_sqlite
+
+    if isinstance(connection, SQLiteConnection):
+        return migrate_sqlite(connection)
+    version = get_schema_version(connection)
+    pending = [migration for migration in MIGRATIONS if migration[0] > version]
+    if not pending:
+        logger.debug(f"Схема базы данных актуальна, версия {version}")
+        return version
+
+    for migration_version, description, steps in pending:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATIONS_LOCK_ID,))
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (migration_version,))
+            if cursor.fetchone() is not None:
+                continue
+            logger.info(f"Применение миграции {migration_version}: {description}")
+            for step in steps:
+                if callable(step):
+                    step(cursor, connection)
+                else:
+                    cursor.execute(step)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (migration_version, description))
+        version = migration_version
+    logger.success(f"Схема базы данных обновлена до версии {version}")
+    return version
+
+
+def _main_queries(connection: Connection) -> Dict[str, Tuple[str, List[Any]]]:
+    from database.entry import Entry
+
+    entry = Entry(connection)
+    queries = {
+        f"entries ORDER BY {column}": entry._select_query(column, False, 500, 0)
+        for column in entry.columns
+    }
+    for table_name, (id_column, data_column) in LOOKUP_TABLES.items():
+        queries[f"entries WHERE {id_column}"] = (f"SELECT 1 FROM entries WHERE {id_column} = %s", [1])
+        queries[f"{table_name} WHERE {data_column}"] = (
+            f"SELECT {id_column} FROM {table_name} WHERE {data_column} = ANY(%s)", [["Иван"]]
+        )
+    queries["entries WHERE phone"] = ("SELECT entry_id FROM entries WHERE phone = %s", ["+79123456789"])
+    queries["entries WHERE phone prefix"] = entry._phone_prefix_query("+7912", 100)
+    queries["lookup values WHERE phonetic prefix"] = entry._match_query("кузнецов", "кузницаф", 2)
+    return queries
+
+
+def _walk_plan(plan: Dict[str, Any]):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk_plan(child)
+
+
+def verify_plans(connection: Connection, min_rows: int = 10_000) -> List[PlanIssue]:
+    """
+    Проверяет планы основных запросов приложения через EXPLAIN.
+
+    Последовательное сканирование и сортировка считаются проблемой, только если
+    планировщик ожидает обработать не меньше min_rows строк: на маленьких таблицах
+    они дешевле индексов.
+
+    :param connection: Подключение к базе данных.
+    :param min_rows: Порог количества строк, начиная с которого план считается медленным.
+    :return: Список найденных проблем.
+    """
+    from database.storage import require_postgres
+
+    require_postgres(connection, "Проверка планов запросов")
+    issues = []
+    for name, (query, params) in _main_queries(connection).items():
+        with connection.cursor(False) as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+            plan = cursor.fetchone()[0][0]["Plan"]
+        for node in _walk_plan(plan):
+            node_type = node["Node Type"]
+            relation = node.get("Relation Name")
+            if node_type == "Seq Scan":
+                with connection.cursor(False) as cursor:
+                    cursor.execute("SELECT greatest(reltuples, 0) FROM pg_class WHERE oid = %s::regclass",
+                                   (relation,))
+                    table_rows = cursor.fetchone()[0]
+                if table_rows >= min_rows:
+                    issues.append(PlanIssue(query=name, node_type=node_type, relation=relation,
+                                            estimated_rows=table_rows,
+                                            message=f"Последовательное сканирование таблицы {relation}"))
+            elif node_type == "Sort" and node["Plans"][0].get("Plan Rows", 0) >= min_rows:
+                issues.append(PlanIssue(query=name, node_type=node_type,
+                                        estimated_rows=node["Plans"][0]["Plan Rows"],
+                                        message=f"Сортировка без индекса: {', '.join(node.get('Sort Key', []))}"))
+    for issue in issues:
+        logger.warning(f"Медленный план запроса «{issue.query}»: {issue.message}")
+    if not issues:
+        logger.success("Планы основных запросов используют индексы")
+    return issues
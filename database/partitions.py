@@ -0,0 +1,230 @@
+"""
+Секционирование таблицы записей по хешу entry_id и параллельная загрузка записей в секции.
+
+Таблица entries пересоздаётся как секционированная (PARTITION BY HASH) с секциями entries_p0 ... entries_pN-1.
+Запросы приложения по-прежнему обращаются к entries: PostgreSQL выбирает нужные секции сам,
+внешние ключи, индексы и триггеры создаются на основной таблице и распространяются на секции.
+Каждая секция - отдельная куча со своими индексами, поэтому VACUUM, построение индексов и загрузка
+выполняются по секциям и могут идти параллельно.
+"""
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from loguru import logger
+
+from database.connection import Connection
+from database.entry import Entry
+from database.migrations import CHANGE_EVENT_MAX_IDS, CHANGES_CHANNEL, ENTRY_COUNTERS, SUPPRESS_NOTIFY_SETTING
+from database.storage import require_postgres
+from database.tracing import span
+
+PARTITION_PREFIX = "entries_p"
+# Секция значения ключа в PostgreSQL: (hashint4extended(ключ, HASH_PARTITION_SEED) + HASH_COMBINE_OFFSET) mod 2^64
+# mod количество секций (см. compute_partition_hash_value и hash_combine64 в исходном коде PostgreSQL)
+HASH_PARTITION_SEED = 0x7A5B22367996DCFD
+HASH_COMBINE_OFFSET = 0x49A0F4DD15E5A8E3
+
+
+def get_partition_count(connection: Connection) -> int:
+    """Количество секций таблицы entries, 0 - таблица не секционирована"""
+    with connection.cursor(False) as cursor:
+        cursor.execute("SELECT count(*) FROM pg_inherits WHERE inhparent = 'entries'::regclass")
+        return cursor.fetchone()[0]
+
+
+def _table_definitions(cursor) -> List[str]:
+    """Команды, воссоздающие ограничения, индексы и триггеры таблицы entries"""
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = 'entries'::regclass AND contype IN ('p', 'u', 'f', 'c')
+        ORDER BY contype <> 'p', conname
+    """)
+    definitions = [f"ALTER TABLE entries ADD CONSTRAINT {name} {definition}" for name, definition in cursor.fetchall()]
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i
+        WHERE i.indrelid = 'entries'::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        ORDER BY i.indexrelid
+    """)
+    # Индекс секционированной таблицы описывается как ON ONLY, без создания индексов секций
+    definitions += [definition.replace(" ON ONLY ", " ON ", 1) for definition, in cursor.fetchall()]
+    cursor.execute("""
+        SELECT pg_get_triggerdef(oid) FROM pg_trigger
+        WHERE tgrelid = 'entries'::regclass AND NOT tgisinternal
+        ORDER BY tgname
+    """)
+    definitions += [definition for definition, in cursor.fetchall()]
+    return definitions
+
+
+def partition_entries(connection: Connection, partitions: int) -> int:
+    """
+    Пересоздаёт таблицу entries с partitions секциями по хешу entry_id; при partitions <= 1 - без секций.
+
+    Ограничения, индексы и триггеры переносятся по их текущим определениям из каталога, строки
+    копируются без срабатывания триггеров, поэтому версии строк, счётчики и ID сохраняются.
+    Всё выполняется одной транзакцией; на время переноса таблица записей заблокирована.
+
+    :return: Количество секций после изменения.
+    """
+    require_postgres(connection, "Секционирование записей")
+    partitions = partitions if partitions > 1 else 0
+    with connection.cursor() as cursor, span("partitions.partition_entries"):
+        cursor.execute("LOCK TABLE entries IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'entries'::regclass")
+        previous_partitions = [name for name, in cursor.fetchall()]
+        if len(previous_partitions) == partitions:
+            logger.info(f"Таблица записей уже разделена на {partitions} секций")
+            return partitions
+        logger.info(f"Перенос таблицы записей: секций {len(previous_partitions)} -> {partitions}")
+
+        definitions = _table_definitions(cursor)
+        cursor.execute("SELECT pg_get_serial_sequence('entries', 'entry_id')")
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+        cursor.execute("ALTER TABLE entries RENAME TO entries_previous")
+        for name in previous_partitions:
+            cursor.execute(f"ALTER TABLE {name} RENAME TO {name.replace('entries_', 'entries_previous_', 1)}")
+
+        partition_clause = " PARTITION BY HASH (entry_id)" if partitions else ""
+        cursor.execute(f"CREATE TABLE entries (LIKE entries_previous INCLUDING DEFAULTS){partition_clause}")
+        for remainder in range(partitions):
+            cursor.execute(f"CREATE TABLE {PARTITION_PREFIX}{remainder} PARTITION OF entries "
+                           f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})")
+        cursor.execute("INSERT INTO entries SELECT * FROM entries_previous")
+        logger.info(f"Перенесено записей: {cursor.rowcount}")
+        cursor.execute("DROP TABLE entries_previous")
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY entries.entry_id")
+        for definition in definitions:
+            cursor.execute(definition)
+        cursor.execute("ANALYZE entries")
+    logger.success(f"Таблица записей разделена на {partitions} секций" if partitions else
+                   "Таблица записей объединена в одну")
+    return partitions
+
+
+class PartitionLoader:
+    """
+    Параллельная загрузка записей в секционированную таблицу entries.
+
+    ID записей выделяются из последовательности заранее вместе с номером секции каждого ID, и каждая
+    секция загружается командой COPY прямо в таблицу секции в одном из workers подключений, без выбора
+    секции для каждой строки. Подключения открываются при первой загрузке и используются повторно,
+    пока загрузчик не закрыт.
+
+    Триггеры на команду основной таблицы при загрузке в секцию не срабатывают, поэтому счётчики записей
+    обновляются загрузчиком, а о загрузке сообщает одно уведомление после всех секций. Уведомления
+    из сеансов загрузки отключены параметром SUPPRESS_NOTIFY_SETTING.
+
+    Каждая секция фиксируется отдельной транзакцией: обновление счётчиков блокирует их строки
+    до конца транзакции, и общая фиксация после всех секций заставила бы подключения ждать друг друга.
+    Если загрузка какой-либо секции не удалась, уже загруженные записи удаляются по выделенным ID.
+    Если таблица не секционирована, записи загружаются через Entry.bulk_insert.
+    """
+
+    def __init__(self, connection: Connection, workers: int = 4):
+        self.connection = connection
+        self.entries = Entry(connection)
+        self.workers = workers
+        self.partitions = get_partition_count(connection)
+        self.worker_connections: List[Connection] = []
+
+    def _get_worker_connections(self) -> List[Connection]:
+        while len(self.worker_connections) < min(self.workers, self.partitions):
+            worker = Connection()
+            worker.connect()
+            with worker.cursor() as cursor:
+                cursor.execute(f"SET {SUPPRESS_NOTIFY_SETTING} = on")
+            self.worker_connections.append(worker)
+        return self.worker_connections
+
+    def _allocate(self, count: int) -> List[tuple]:
+        """ID для count новых записей и номер секции каждого ID; секция вычисляется один раз на ID"""
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT id, ((hashint4extended(id::integer, %s)::numeric + %s) %% %s %% %s)::integer
+                FROM (SELECT nextval(pg_get_serial_sequence('entries', 'entry_id')) AS id
+                      FROM generate_series(1, %s)) ids
+            """, (HASH_PARTITION_SEED, 2 ** 64 + HASH_COMBINE_OFFSET, 2 ** 64, self.partitions, count))
+            return cursor.fetchall()
+
+    @staticmethod
+    def _copy(worker: Connection, columns: List[str], partition_rows: List[Tuple[int, List[tuple]]]) -> List[int]:
+        """
+        Загружает секции по одной транзакции на секцию; возвращает ID загруженных записей.
+
+        Строка с ID чужой секции нарушила бы ограничение секции, поэтому ошибка в номере секции не остаётся незамеченной.
+        """
+        loaded = []
+        for remainder, rows in partition_rows:
+            with worker.cursor() as cursor:
+                with cursor.copy(f"COPY {PARTITION_PREFIX}{remainder} ({', '.join(columns)}) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                for table_name, key_columns in ENTRY_COUNTERS.items():
+                    positions = [columns.index(column) for column in key_columns]
+                    counts = Counter(tuple(row[position] for position in positions) for row in rows)
+                    key = ", ".join(key_columns)
+                    # Ключи обновляются по порядку, как в триггере счётчиков, без взаимных блокировок секций
+                    cursor.executemany(f"INSERT INTO {table_name} ({key}, entry_count) "
+                                       f"VALUES ({', '.join(['%s'] * (len(key_columns) + 1))}) "
+                                       f"ON CONFLICT ({key}) DO UPDATE "
+                                       f"SET entry_count = {table_name}.entry_count + excluded.entry_count",
+                                       [(*values, entry_count) for values, entry_count in sorted(counts.items())])
+            loaded += [row[0] for row in rows]
+        return loaded
+
+    def _notify(self, entry_ids: List[int]) -> None:
+        """Одно уведомление об изменении для других клиентов, как у триггера notify_row_changes"""
+        event = {"table": "entries", "op": "I",
+                 "ids": entry_ids if len(entry_ids) <= CHANGE_EVENT_MAX_IDS else None}
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", (CHANGES_CHANNEL, json.dumps(event)))
+
+    def load(self, rows: Iterable[Sequence[Any]]) -> int:
+        """
+        Загружает записи; значения колонок - без entry_id, в порядке Entry.columns, как в Entry.bulk_insert.
+
+        :return: Количество загруженных записей.
+        """
+        if self.partitions <= 1:
+            return self.entries.bulk_insert(rows)
+        rows = list(Entry._normalize_rows(rows))
+        if not rows:
+            return 0
+        with span("partitions.load"):
+            by_partition: Dict[int, List[tuple]] = {}
+            for row, (entry_id, remainder) in zip(rows, self._allocate(len(rows))):
+                by_partition.setdefault(remainder, []).append((entry_id, *row))
+            workers = self._get_worker_connections()
+            assignments = [[(remainder, rows) for remainder, rows in by_partition.items()
+                            if remainder % len(workers) == index]
+                           for index in range(len(workers))]
+            loaded: List[int] = []
+            errors = []
+            with ThreadPoolExecutor(len(workers)) as executor:
+                futures = [executor.submit(self._copy, worker, self.entries.columns, partition_rows)
+                           for worker, partition_rows in zip(workers, assignments)]
+                for future in futures:
+                    try:
+                        loaded += future.result()
+                    except Exception as exception:
+                        errors.append(exception)
+            if errors:
+                # Секции, загруженные до ошибки, уже зафиксированы; ID частично загруженной секции не заняты
+                ids = [entry_id for remainder_rows in by_partition.values() for entry_id, *_ in remainder_rows]
+                with self.connection.cursor() as cursor:
+                    cursor.execute("DELETE FROM entries WHERE entry_id = ANY(%s)", (ids,))
+                logger.error(f"Загрузка записей по секциям прервана, удалено загруженных записей: {cursor.rowcount}")
+                raise errors[0]
+            count = len(loaded)
+            self._notify(loaded)
+        logger.debug(f"Загружено записей в {len(by_partition)} секций: {count}")
+        return count
+
+    def close(self) -> None:
+        for worker in self.worker_connections:
+            worker.connection.close()
+        self.worker_connections = []
@@ -0,0 +1,108 @@
+"""
+Номера телефонов в формате E.164 и индекс обратного поиска по номеру.
+
+В базе номера хранятся только в виде +<код страны><номер> без разделителей: так их можно сравнивать
+и искать по префиксу через индекс. Российские номера без кода страны (8 912 ..., 912 ...)
+приводятся к +7. Для отображения номер форматируется один раз при создании ячейки таблицы.
+"""
+import re
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterable, List, Tuple
+
+E164_PATTERN = r"^\+[1-9][0-9]{7,14}$"
+MIN_DIGITS, MAX_DIGITS = 8, 15
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(value: Any) -> str:
+    """
+    Приводит номер телефона к формату E.164.
+
+    Номер с «+» считается записанным с кодом страны. Без «+» принимаются российские номера:
+    11 цифр, начинающихся с 7 или 8, или 10 цифр без кода страны.
+
+    :raises ValueError: Номер нельзя однозначно привести к E.164.
+    """
+    text = str(value).strip()
+    digits = _NON_DIGITS.sub("", text)
+    if text.startswith("+"):
+        if MIN_DIGITS <= len(digits) <= MAX_DIGITS and digits[0] != "0":
+            return "+" + digits
+    elif len(digits) == 11 and digits[0] in "78":
+        return "+7" + digits[1:]
+    elif len(digits) == 10:
+        return "+7" + digits
+    raise ValueError(f"Некорректный номер телефона: {value!r}")
+
+
+def normalize_phone_prefix(value: Any) -> str:
+    """
+    Приводит начало номера к началу номера в формате E.164 для поиска по префиксу.
+
+    Префикс без «+» должен начинаться с кода страны или с 8 для российских номеров.
+    """
+    text = str(value).strip()
+    digits = _NON_DIGITS.sub("", text)
+    if not digits or len(digits) > MAX_DIGITS:
+        raise ValueError(f"Некорректное начало номера телефона: {value!r}")
+    if not text.startswith("+") and digits[0] == "8":
+        digits = "7" + digits[1:]
+    return "+" + digits
+
+
+def format_phone(phone: str) -> str:
+    """Текст номера E.164 для отображения, российские номера - в виде +7 (912) 345-67-89"""
+    if len(phone) == 12 and phone.startswith("+7"):
+        return f"+7 ({phone[2:5]}) {phone[5:8]}-{phone[8:10]}-{phone[10:]}"
+    return phone
+
+
+class PhoneIndex:
+    """
+    Отсортированный массив номеров для обратного поиска по номеру без обращения к базе данных.
+
+    Номера хранятся числами int64: номер E.164 не начинается с нуля, поэтому числа одной длины
+    упорядочены так же, как строки, а номера разной длины занимают соседние непрерывные диапазоны.
+    Поиск - двоичный по массиву, на номер приходится 16 байт вместе с ID записи.
+    Индекс - снимок на момент построения, после изменений записей его нужно построить заново.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[str, int]]):
+        """
+        :param rows: Пары (номер E.164, ID записи), упорядоченные по длине номера, затем по номеру.
+        """
+        self.numbers = array("q")
+        self.entry_ids = array("q")
+        for phone, entry_id in rows:
+            self.numbers.append(int(phone[1:]))
+            self.entry_ids.append(entry_id)
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def find(self, phone: str) -> List[int]:
+        """ID записей с номером phone в формате E.164"""
+        number = int(phone[1:])
+        start = bisect_left(self.numbers, number)
+        end = bisect_left(self.numbers, number + 1, start)
+        return self.entry_ids[start:end].tolist()
+
+    def find_prefix(self, prefix: str, limit: int = 100) -> List[Tuple[str, int]]:
+        """
+        Номера, начинающиеся с prefix (начало номера E.164, с «+»), и ID их записей.
+
+        :return: Не больше limit пар (номер, ID записи) в порядке длины и значения номера.
+        """
+        digits = prefix[1:]
+        found = []
+        for length in range(max(len(digits), MIN_DIGITS), MAX_DIGITS + 1):
+            scale = 10 ** (length - len(digits))
+            start = bisect_left(self.numbers, int(digits) * scale)
+            end = bisect_left(self.numbers, (int(digits) + 1) * scale, start)
+            for index in range(start, min(end, start + limit - len(found))):
+                found.append((f"+{self.numbers[index]}", self.entry_ids[index]))
+            if len(found) >= limit:
+                break
+        return found
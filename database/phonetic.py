@@ -0,0 +1,99 @@
+"""
+Нормализация и фонетические ключи русских имён, фамилий, отчеств и улиц для нечёткого поиска.
+
+Для каждого значения родительской таблицы в базе хранятся нормализованное значение, оно же в обратном
+порядке и фонетический ключ (генерируемые колонки с индексами, см. database/migrations.py). Функции
+normalize_name, reversed_name и phonetic_key PostgreSQL строятся из тех же правил, что и функции ниже,
+поэтому ключ строки поиска, вычисленный в приложении, совпадает с ключами в базе. Кандидаты ищутся через
+индексы по началу и по концу значения и по началу ключа, а итоговый отбор и порядок - по расстоянию
+редактирования между нормализованными значениями.
+"""
+import re
+from functools import reduce
+from typing import List, Tuple
+
+NAME_CASE_FROM = "АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯABCDEFGHIJKLMNOPQRSTUVWXYZё"
+NAME_CASE_TO = "абвгдеежзийклмнопрстуфхцчшщъыьэюяabcdefghijklmnopqrstuvwxyzе"
+NOT_NAME_PATTERN = "[^а-яa-z0-9]"
+# Кандидаты ищутся по началу и концу нормализованного значения и по началу ключа такой длины:
+# значение не находится, только если опечатки есть и в первых, и в последних буквах
+CANDIDATE_PREFIX_LENGTH = 2
+
+# Правила применяются по порядку ко всем вхождениям; шаблоны - общее подмножество re и регулярных выражений PostgreSQL
+PHONETIC_RULES: List[Tuple[str, str]] = [
+    ("[ъь]", ""),
+    ("[йи][ое]", "и"),
+    # Окончания -ов/-ев (Кузнецов, Кузнецев) пишутся и слышатся одинаково
+    ("[оеэ]в(а|ский|ская)?$", r"ав\1"),
+    ("[оыя]", "а"),
+    ("[еэйи]", "и"),
+    ("ю", "у"),
+    # Оглушение звонких согласных перед глухими и в конце слова
+    *((voiced + "(?=[пфктшсхцчщ]|$)", voiceless) for voiced, voiceless in zip("бвгджз", "пфктшс")),
+    ("[тд]с", "ц"),
+    (r"(.)\1+", r"\1"),
+]
+
+_CASE_TABLE = str.maketrans(NAME_CASE_FROM, NAME_CASE_TO)
+_NOT_NAME = re.compile(NOT_NAME_PATTERN)
+_PHONETIC_RULES = [(re.compile(pattern), replacement) for pattern, replacement in PHONETIC_RULES]
+
+
+def normalize_name(value: str) -> str:
+    """Значение в нижнем регистре, «ё» как «е», без пробелов, дефисов и знаков препинания"""
+    return _NOT_NAME.sub("", value.translate(_CASE_TABLE))
+
+
+def reversed_name(value: str) -> str:
+    """Нормализованное значение в обратном порядке: по его началу ищутся значения с опечаткой в первых буквах"""
+    return normalize_name(value)[::-1]
+
+
+def phonetic_key(value: str) -> str:
+    """
+    Фонетический ключ: одинаковый у значений, которые звучат похоже.
+
+    Безударные гласные сводятся к «а», «и», «у», звонкие согласные оглушаются там, где они
+    звучат глухо, «тс» и «дс» заменяются на «ц», повторы букв сокращаются до одной.
+    """
+    return reduce(lambda key, rule: rule[0].sub(rule[1], key), _PHONETIC_RULES, normalize_name(value))
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """
+    Расстояние Левенштейна между строками; если оно больше limit, возвращается limit + 1.
+
+    Строки, длины которых отличаются больше чем на limit, не сравниваются посимвольно.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first_char != second_char)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def max_distance(value: str) -> int:
+    """Допустимое количество опечаток: одна на каждые четыре буквы нормализованного значения, не меньше одной"""
+    return max(1, len(value) // 4)
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def normalize_name_sql(expression: str) -> str:
+    """Выражение PostgreSQL, вычисляющее normalize_name от expression"""
+    translated = f"translate({expression}, {_sql_literal(NAME_CASE_FROM)}, {_sql_literal(NAME_CASE_TO)})"
+    return f"regexp_replace({translated}, {_sql_literal(NOT_NAME_PATTERN)}, '', 'g')"
+
+
+def phonetic_key_sql(expression: str) -> str:
+    """Выражение PostgreSQL, применяющее правила PHONETIC_RULES к нормализованному значению expression"""
+    return reduce(lambda key, rule: f"regexp_replace({key}, {_sql_literal(rule[0])}, {_sql_literal(rule[1])}, 'g')",
+                  PHONETIC_RULES, expression)
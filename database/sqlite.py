@@ -0,0 +1,461 @@
+import os
+import re
+import json
+import sqlite3
+import contextlib
+from time import perf_counter
+from typing import List, Dict, Any, Iterable, Sequence, Tuple, Optional, Callable
+
+from loguru import logger
+
+from database.base import Base
+from database.connection import Connection
+from database.entry import Entry
+from database.migrations import ENTRY_COUNTERS, LOOKUP_TABLES, rebuild_entry_counters
+from database.phone import normalize_phone
+from database.phonetic import normalize_name, phonetic_key, reversed_name
+from database.tracing import tracer
+
+PLACEHOLDER_PATTERN = re.compile(r"%%|%s")
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+    "cache_size": "-65536",
+    "mmap_size": "268435456",
+}
+TRIGRAM_LENGTH = 3
+
+
+class SQLiteCursor:
+    """
+    Курсор SQLite с интерфейсом курсора psycopg: параметры запросов передаются как %s,
+    время выполнения и количество строк каждого запроса передаются в tracer.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+
+    @staticmethod
+    def _translate(query: str, has_params: bool) -> str:
+        if not has_params:
+            return query
+        return PLACEHOLDER_PATTERN.sub(lambda match: "%" if match.group() == "%%" else "?", query)
+
+    def execute(self, query: str, params: Optional[Sequence[Any]] = None) -> "SQLiteCursor":
+        started = perf_counter()
+        try:
+            self.cursor.execute(self._translate(query, params is not None), params or ())
+        finally:
+            tracer.record(query, params, perf_counter() - started, self.cursor.rowcount)
+        return self
+
+    def executemany(self, query: str, params_seq: Iterable[Sequence[Any]]) -> "SQLiteCursor":
+        params_seq = list(params_seq)
+        started = perf_counter()
+        try:
+            self.cursor.executemany(self._translate(query, True), params_seq)
+        finally:
+            tracer.record(query, params_seq, perf_counter() - started, self.cursor.rowcount, len(params_seq))
+        return self
+
+    def fetchone(self) -> Optional[tuple]:
+        return self.cursor.fetchone()
+
+    def fetchall(self) -> List[tuple]:
+        return self.cursor.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    def close(self) -> None:
+        self.cursor.close()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def _ru_lower(value: Any) -> Any:
+    """lower для запросов SQLite: встроенная функция меняет регистр только латинских букв"""
+    return value.lower() if isinstance(value, str) else value
+
+
+def _normalize_phone(value: Any) -> Optional[str]:
+    """normalize_phone для запросов SQLite: NULL вместо ошибки, как у функции PostgreSQL из миграций"""
+    try:
+        return normalize_phone(value)
+    except ValueError:
+        return None
+
+
+def _name_function(function: Callable[[str], str]) -> Callable[[Any], Optional[str]]:
+    """Функция database/phonetic.py для запросов SQLite: NULL для NULL, как у функций PostgreSQL из миграций"""
+    return lambda value: function(value) if isinstance(value, str) else None
+
+
+class SQLiteConnection(Connection):
+    """
+    Подключение к встроенной базе SQLite в файле DB_PATH.
+
+    База открывается в режиме WAL: чтение не блокируется записью, а фиксация транзакции
+    не требует синхронизации всего файла.
+
+    Подключение регистрирует функции приложения: ru_lower (lower с кириллицей для поиска без учёта
+    регистра), normalize_phone, normalize_name, reversed_name и phonetic_key. Встроенная lower
+    не переопределяется. От normalize_name, reversed_name и phonetic_key зависят генерируемые колонки
+    и индексы родительских таблиц (миграции 5 и 6), поэтому другие клиенты SQLite, включая sqlite3, не могут изменять эти таблицы
+    и читать генерируемые колонки (в том числе через SELECT *): запрос завершается ошибкой
+    «unknown function». Остальные колонки читаются любым клиентом.
+    """
+    backend = "sqlite"
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        self.path = path or os.getenv("DB_PATH") or "phone_table.sqlite3"
+
+    def connect(self):
+        logger.info(f"Подключение к базе данных SQLite {self.path}...")
+        try:
+            self.connection = sqlite3.connect(self.path)
+            for pragma, value in SQLITE_PRAGMAS.items():
+                self.connection.execute(f"PRAGMA {pragma} = {value}")
+            self.connection.create_function("ru_lower", 1, _ru_lower, deterministic=True)
+            self.connection.create_function("normalize_phone", 1, _normalize_phone, deterministic=True)
+            self.connection.create_function("normalize_name", 1, _name_function(normalize_name), deterministic=True)
+            self.connection.create_function("phonetic_key", 1, _name_function(phonetic_key), deterministic=True)
+            self.connection.create_function("reversed_name", 1, _name_function(reversed_name), deterministic=True)
+            logger.success("Подключение к базе данных успешно выполнено")
+        except Exception as exception:
+            logger.error(f"Ошибка при подключении к базе данных: {str(exception)}")
+            raise
+        return True
+
+    def get_sort_collation(self) -> Optional[str]:
+        """В SQLite значения сортируются по кодам символов, русская сортировка не используется"""
+        return None
+
+    @contextlib.contextmanager
+    def cursor(self, commit=True) -> SQLiteCursor:
+        if not self.connection:
+            logger.warning("Подключение к базе данных ещё не было установлено")
+            self.connect()
+        cursor = SQLiteCursor(self.connection.cursor())
+        try:
+            yield cursor
+            if commit:
+                self.connection.commit()
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении запроса: {str(e)}")
+            self.connection.rollback()
+            raise e
+        finally:
+            cursor.close()
+
+
+class SQLiteDialect:
+    """Замена запросов Base, использующих возможности PostgreSQL, на запросы SQLite"""
+    lower_function = "ru_lower"
+
+    def _match_any(self, expression: str) -> str:
+        return f"{expression} IN (SELECT value FROM json_each(%s))"
+
+    @staticmethod
+    def _any_param(values: Iterable[Any]) -> str:
+        return json.dumps(list(values), ensure_ascii=False)
+
+    def update(self, data: dict, target_id: str) -> tuple:
+        logger.info(f"Обновление записи с ID {target_id} и данными {data}")
+        columns = list(data.keys())
+        set_expr = ", ".join(f"{column} = %s" for column in columns)
+        query = (f"UPDATE {self.table_name} SET {set_expr} WHERE {self.primary_key} = %s "
+                 f"RETURNING {self.primary_key}, {', '.join(columns)}")
+        with self.exception_handler(), self.connection.cursor() as cur:
+            cur.execute(query, list(data.values()) + [target_id])
+            result = cur.fetchone()
+            logger.debug(f"Обновлено записей: {int(result is not None)}")
+            # PostgreSQL возвращает значения одной составной колонкой, форма результата сохраняется
+            return (result,) if result is not None else None
+
+    def get_or_create_ids(self, column: str, values: List[str]) -> Dict[str, Any]:
+        logger.info(f"Получение ID для {len(values)} значений колонки {column} таблицы {self.table_name}")
+        values = list(set(values))
+        with self.exception_handler(), self.connection.cursor() as cur:
+            cur.executemany(f"INSERT OR IGNORE INTO {self.table_name} ({column}) VALUES (%s)",
+                            [(value,) for value in values])
+            cur.execute(f"SELECT {self.primary_key}, {column} FROM {self.table_name} "
+                        f"WHERE {self._match_any(column)}", (self._any_param(values),))
+            return {value.strip(): value_id for value_id, value in cur.fetchall()}
+
+    @contextlib.contextmanager
+    def exception_handler(self):
+        try:
+            yield
+        except sqlite3.IntegrityError as e:
+            message = str(e)
+            logger.error(f"Нарушение ограничения: {message}")
+            if message.startswith("UNIQUE"):
+                raise ValueError("Нарушение уникальности значения") from e
+            if message.startswith("FOREIGN KEY"):
+                raise ValueError("Нарушение ссылочной целостности") from e
+            if message.startswith("NOT NULL"):
+                raise ValueError("Обязательное поле не может быть пустым") from e
+            raise
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при работе с БД: {str(e)}")
+            raise
+
+
+class SQLiteBase(SQLiteDialect, Base):
+    pass
+
+
+class SQLiteEntry(SQLiteDialect, Entry):
+    phone_range_condition = "e.phone >= %s AND e.phone < %s"
+    phone_order = "e.phone"
+    key_range_condition = "{column} >= %s AND {column} < %s"
+
+    def _stream_rows(self, cursor: SQLiteCursor, query: str, types: List[str]) -> Iterable[tuple]:
+        cursor.execute(query)
+        yield from cursor
+
+    def _search_condition(self, search: str) -> Tuple[str, List[Any]]:
+        """
+        Поиск по полнотекстовому индексу FTS5 с триграммами: подстрока длиной от трёх символов
+        ищется по индексу без учёта регистра, более короткие строки - перебором.
+        """
+        if len(search) < TRIGRAM_LENGTH:
+            return super()._search_condition(search)
+        phrase = '"' + search.replace('"', '""') + '"'
+        return "e.entry_id IN (SELECT rowid FROM entries_search WHERE entries_search MATCH %s)", [phrase]
+
+    def bulk_insert(self, rows: Iterable[Sequence[Any]]) -> int:
+        """
+        Загружает записи одним executemany в одной транзакции.
+
+        :param rows: Значения колонок записи без entry_id, в порядке self.columns.
+        :return: Количество загруженных записей.
+        """
+        columns = [column for column in self.columns if column != self.primary_key]
+        rows = list(self._normalize_rows(rows))
+        with self.exception_handler(), self.connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {self.table_name} ({', '.join(columns)}) "
+                               f"VALUES ({', '.join(['%s'] * len(columns))})", rows)
+        logger.debug(f"Загружено записей через executemany: {len(rows)}")
+        return len(rows)
+
+
+SEARCH_COLUMNS = ["entry_id", "name", "surname", "patronymic", "street", "building", "apartment", "phone"]
+
+
+def _create_tables(cursor: SQLiteCursor) -> None:
+    for table_name, (id_column, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                {id_column} INTEGER PRIMARY KEY AUTOINCREMENT,
+                {data_column} TEXT NOT NULL UNIQUE
+            )
+        """)
+    foreign_keys = ",\n".join(
+        f"{id_column} INTEGER NOT NULL REFERENCES {table_name} ({id_column})"
+        for table_name, (id_column, _) in LOOKUP_TABLES.items()
+    )
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS entries (
+            entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            {foreign_keys},
+            building TEXT NOT NULL DEFAULT '',
+            apartment INTEGER NOT NULL DEFAULT 0,
+            phone TEXT NOT NULL
+        )
+    """)
+    for id_column, _ in LOOKUP_TABLES.values():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS entries_{id_column}_idx ON entries ({id_column})")
+    for column in ("phone", "apartment", "building"):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS entries_{column}_idx ON entries ({column})")
+
+
+def _create_search_index(cursor: SQLiteCursor) -> None:
+    """
+    Полнотекстовый индекс записей по отображаемым значениям.
+
+    Индекс поддерживается триггерами на записях и на родительских таблицах: при переименовании
+    значения обновляются только записи, которые на него ссылаются.
+    """
+    cursor.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS entries_search
+        USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize = 'trigram')
+    """)
+    cursor.execute("""
+        CREATE VIEW IF NOT EXISTS entry_search_values AS
+        SELECT e.entry_id, n.name, s.surname, p.patronymic, st.street, e.building, e.apartment, e.phone
+        FROM entries e
+        JOIN names n ON e.name_id = n.name_id
+        JOIN surnames s ON e.surname_id = s.surname_id
+        JOIN patronymics p ON e.patronymic_id = p.patronymic_id
+        JOIN streets st ON e.street_id = st.street_id
+    """)
+    columns = ", ".join(SEARCH_COLUMNS)
+    assignments = ", ".join(f"{column} = c.{column}" for column in SEARCH_COLUMNS[1:])
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS entries_search_insert AFTER INSERT ON entries BEGIN
+            INSERT INTO entries_search (rowid, {columns})
+            SELECT entry_id, {columns} FROM entry_search_values WHERE entry_id = new.entry_id;
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS entries_search_update AFTER UPDATE ON entries BEGIN
+            UPDATE entries_search SET {assignments}
+            FROM entry_search_values c
+            WHERE entries_search.rowid = new.entry_id AND c.entry_id = new.entry_id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS entries_search_delete AFTER DELETE ON entries BEGIN
+            DELETE FROM entries_search WHERE rowid = old.entry_id;
+        END
+    """)
+    for table_name, (id_column, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table_name}_search_update AFTER UPDATE OF {data_column} ON {table_name}
+            BEGIN
+                UPDATE entries_search SET {data_column} = new.{data_column}
+                WHERE rowid IN (SELECT entry_id FROM entries WHERE {id_column} = new.{id_column});
+            END
+        """)
+    cursor.execute(f"""
+        INSERT INTO entries_search (rowid, {columns})
+        SELECT entry_id, {columns} FROM entry_search_values
+        WHERE entry_id NOT IN (SELECT rowid FROM entries_search)
+    """)
+
+
+def _normalize_phones(cursor: SQLiteCursor) -> None:
+    """Номера телефонов в формате E.164; поиск по началу номера использует индекс entries_phone_idx"""
+    cursor.execute("""
+        UPDATE entries SET phone = normalize_phone(phone)
+        WHERE normalize_phone(phone) IS NOT NULL AND normalize_phone(phone) <> phone
+    """)
+    logger.info(f"Номеров телефонов приведено к E.164: {cursor.rowcount}")
+
+
+def _create_entry_counters(cursor: SQLiteCursor) -> None:
+    """Счётчики записей по улицам, фамилиям и домам, обновляемые триггерами на строку"""
+    column_types = {"street_id": "INTEGER", "surname_id": "INTEGER", "building": "TEXT"}
+    increments, decrements = [], []
+    for table_name, key_columns in ENTRY_COUNTERS.items():
+        columns = ", ".join(f"{column} {column_types[column]} NOT NULL" for column in key_columns)
+        key = ", ".join(key_columns)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                {columns},
+                entry_count INTEGER NOT NULL,
+                PRIMARY KEY ({key})
+            )
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_entry_count_idx "
+                       f"ON {table_name} (entry_count DESC, {key})")
+        increments.append(f"""
+            INSERT INTO {table_name} ({key}, entry_count) VALUES ({', '.join(f'new.{c}' for c in key_columns)}, 1)
+            ON CONFLICT ({key}) DO UPDATE SET entry_count = entry_count + 1;""")
+        condition = " AND ".join(f"{column} = old.{column}" for column in key_columns)
+        decrements.append(f"""
+            UPDATE {table_name} SET entry_count = entry_count - 1 WHERE {condition};
+            DELETE FROM {table_name} WHERE {condition} AND entry_count = 0;""")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS entries_counters_insert AFTER INSERT ON entries BEGIN
+            {''.join(increments)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS entries_counters_update
+        AFTER UPDATE OF {', '.join(dict.fromkeys(c for columns in ENTRY_COUNTERS.values() for c in columns))} ON entries
+        BEGIN
+            {''.join(decrements)}
+            {''.join(increments)}
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS entries_counters_delete AFTER DELETE ON entries BEGIN
+            {''.join(decrements)}
+        END
+    """)
+    rebuild_entry_counters(cursor)
+
+
+def _create_phonetic_keys(cursor: SQLiteCursor) -> None:
+    """
+    Нормализованные значения и фонетические ключи родительских таблиц для нечёткого поиска.
+
+    Колонки виртуальные: SQLite не добавляет хранимые генерируемые колонки в существующую таблицу,
+    а значения для индекса вычисляются функциями, которые регистрирует SQLiteConnection.
+    Без этих функций таблицы нельзя изменять, а генерируемые колонки - читать, поэтому
+    база после этой миграции полностью доступна только через SQLiteConnection.
+    """
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        for suffix, function in (("normalized", "normalize_name"), ("phonetic", "phonetic_key")):
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {data_column}_{suffix} TEXT "
+                           f"GENERATED ALWAYS AS ({function}({data_column})) VIRTUAL")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_{data_column}_{suffix}_idx "
+                           f"ON {table_name} ({data_column}_{suffix})")
+
+
+def _create_reversed_names(cursor: SQLiteCursor) -> None:
+    """Нормализованные значения родительских таблиц в обратном порядке для поиска опечаток в первых буквах"""
+    for table_name, (_, data_column) in LOOKUP_TABLES.items():
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {data_column}_reversed TEXT "
+                       f"GENERATED ALWAYS AS (reversed_name({data_column})) VIRTUAL")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_{data_column}_reversed_idx "
+                       f"ON {table_name} ({data_column}_reversed)")
+
+
+SQLITE_MIGRATIONS = [
+    (1, "Базовые таблицы справочника и индексы", [_create_tables]),
+    (2, "Полнотекстовый поиск по записям", [_create_search_index]),
+    (3, "Номера телефонов в формате E.164", [_normalize_phones]),
+    (4, "Счётчики записей по улицам, фамилиям и домам", [_create_entry_counters]),
+    (5, "Фонетические ключи значений родительских таблиц для нечёткого поиска", [_create_phonetic_keys]),
+    (6, "Значения родительских таблиц в обратном порядке для поиска опечаток в первых буквах", [_create_reversed_names]),
+]
+
+
+def migrate_sqlite(connection: SQLiteConnection) -> int:
+    """
+    Применяет к базе SQLite все ещё не применённые миграции.
+
+    Каждая миграция выполняется в транзакции BEGIN IMMEDIATE, которая блокирует запись
+    другими процессами, поэтому одновременный запуск нескольких клиентов безопасен.
+
+    :param connection: Подключение к базе данных SQLite.
+    :return: Версия схемы после применения миграций.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT coalesce(max(version), 0) FROM schema_migrations")
+        version = cursor.fetchone()[0]
+    pending = [migration for migration in SQLITE_MIGRATIONS if migration[0] > version]
+    if not pending:
+        logger.debug(f"Схема базы данных актуальна, версия {version}")
+        return version
+
+    for migration_version, description, steps in pending:
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (migration_version,))
+            if cursor.fetchone() is not None:
+                continue
+            logger.info(f"Применение миграции {migration_version}: {description}")
+            for step in steps:
+                step(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (migration_version, description))
+        version = migration_version
+    logger.success(f"Схема базы данных обновлена до версии {version}")
+    return version
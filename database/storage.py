@@ -0,0 +1,53 @@
+"""
+Выбор хранилища справочника.
+
+Хранилище задаётся переменной DB_BACKEND в .env:
+    DB_BACKEND=postgres  # по умолчанию: сервер PostgreSQL из DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+    DB_BACKEND=sqlite    # встроенная база SQLite в файле DB_PATH (по умолчанию phone_table.sqlite3)
+
+Таблицы создаются через create_table и create_entry_table: для SQLite возвращаются реализации
+Base и Entry с запросами SQLite, остальной код работает с общим интерфейсом.
+"""
+import os
+from typing import List
+
+from dotenv import load_dotenv
+
+from database.base import Base
+from database.connection import Connection
+from database.entry import Entry
+from database.sqlite import SQLiteConnection, SQLiteBase, SQLiteEntry
+
+BACKENDS = ("postgres", "sqlite")
+
+
+def get_backend() -> str:
+    load_dotenv()
+    backend = (os.getenv("DB_BACKEND") or "postgres").strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестное хранилище DB_BACKEND={backend!r}, допустимые значения: {', '.join(BACKENDS)}")
+    return backend
+
+
+def create_connection() -> Connection:
+    """Создаёт подключение к хранилищу из настроек .env, подключение не устанавливается"""
+    return SQLiteConnection() if get_backend() == "sqlite" else Connection()
+
+
+def is_sqlite(connection: Connection) -> bool:
+    return isinstance(connection, SQLiteConnection)
+
+
+def create_table(table_name: str, columns: List[str], connection: Connection, primary_key: str) -> Base:
+    table_class = SQLiteBase if is_sqlite(connection) else Base
+    return table_class(table_name, columns, connection, primary_key)
+
+
+def create_entry_table(connection: Connection) -> Entry:
+    return SQLiteEntry(connection) if is_sqlite(connection) else Entry(connection)
+
+
+def require_postgres(connection: Connection, action: str) -> None:
+    """Проверяет, что операция, использующая возможности PostgreSQL, выполняется не на SQLite"""
+    if is_sqlite(connection):
+        raise ValueError(f"Операция «{action}» доступна только для хранилища PostgreSQL (DB_BACKEND=postgres)")
@@ -1,13 +1,14 @@
-from database.base import Base
-from database.entry import Entry
-
-from database.connection import Connection
+from database.cache import create_local_cache
+from database.migrations import migrate
+from database.storage import create_connection, create_table, create_entry_table
 from schema.table import ColumnsInfo, ColumnInfo, ParentTableInfo
 
-connection = Connection()
+connection = create_connection()
 connection.connect()
+migrate(connection)
+local_cache = create_local_cache(connection)
 
-entries_table = Entry(connection)
+entries_table = create_entry_table(connection)
 entries_table.columns_info = ColumnsInfo(columns=[
     ColumnInfo(ui_title="ID", db_column="entry_id", editable=False),
     ColumnInfo(ui_title="Имя", db_column="name_id",
@@ -31,22 +32,22 @@ entries_table.columns_info = ColumnsInfo(columns=[
     ColumnInfo(ui_title="Телефон", db_column="phone")
 ])
 
-names_table = Base("names", ["name_id", "name"], connection, "name_id")
+names_table = create_table("names", ["name_id", "name"], connection, "name_id")
 names_table.columns_info = ColumnsInfo(columns=[
     ColumnInfo(ui_title="ID", db_column="name_id", editable=False),
     ColumnInfo(ui_title="Имя", db_column="name")
 ])
-surnames_table = Base("surnames", ["surname_id", "surname"], connection, "surname_id")
+surnames_table = create_table("surnames", ["surname_id", "surname"], connection, "surname_id")
 surnames_table.columns_info = ColumnsInfo(columns=[
     ColumnInfo(ui_title="ID", db_column="surname_id", editable=False),
     ColumnInfo(ui_title="Фамилия", db_column="surname")
 ])
-patronymics_table = Base("patronymics", ["patronymic_id", "patronymic"], connection, "patronymic_id")
+patronymics_table = create_table("patronymics", ["patronymic_id", "patronymic"], connection, "patronymic_id")
 patronymics_table.columns_info = ColumnsInfo(columns=[
     ColumnInfo(ui_title="ID", db_column="patronymic_id", editable=False),
     ColumnInfo(ui_title="Отчество", db_column="patronymic")
 ])
-streets_table = Base("streets", ["street_id", "street"], connection, "street_id")
+streets_table = create_table("streets", ["street_id", "street"], connection, "street_id")
 streets_table.columns_info = ColumnsInfo(columns=[
     ColumnInfo(ui_title="ID", db_column="street_id", editable=False),
     ColumnInfo(ui_title="Улица", db_column="street")
@@ -0,0 +1,317 @@
+import io
+import os
+import re
+import json
+import pstats
+import random
+import cProfile
+import threading
+import contextlib
+from collections import deque
+from functools import lru_cache
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import psycopg
+from loguru import logger
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+REPEATED_VALUES_PATTERN = re.compile(r"(\((?:\s*%s\s*,)*\s*%s\s*\))(?:\s*,\s*\1)+")
+
+
+class Histogram:
+    """
+    Гистограмма с логарифмическими корзинами: значение попадает в корзину по номеру старшего бита,
+    поэтому добавление выполняется за O(1), а перцентили оцениваются с точностью до двух раз.
+    """
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        bucket = int(value).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """Верхняя граница корзины, в которую попадает заданный перцентиль"""
+        if not self.count:
+            return 0.0
+        threshold = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= threshold:
+                return min(float(2 ** bucket), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+            "buckets": {2 ** bucket: count for bucket, count in sorted(self.buckets.items())},
+        }
+
+
+class StatementStats:
+    def __init__(self, shape: str):
+        self.shape = shape
+        self.latency_us = Histogram()
+        self.rows = Histogram()
+        self.bytes = Histogram()
+
+    def to_dict(self) -> dict:
+        return {
+            "shape": self.shape,
+            "latency_us": self.latency_us.to_dict(),
+            "rows": self.rows.to_dict(),
+            "bytes": self.bytes.to_dict(),
+        }
+
+
+MAX_CACHED_QUERY_LENGTH = 4096
+
+
+def query_shape(query: str) -> str:
+    """Нормализованный вид запроса: без лишних пробелов и литералов, повторяющиеся VALUES свёрнуты"""
+    if len(query) <= MAX_CACHED_QUERY_LENGTH:
+        return _cached_query_shape(query)
+    return _query_shape(query)
+
+
+@lru_cache(maxsize=1024)
+def _cached_query_shape(query: str) -> str:
+    return _query_shape(query)
+
+
+def _query_shape(query: str) -> str:
+    shape = WHITESPACE_PATTERN.sub(" ", query).strip()
+    shape = LITERAL_PATTERN.sub("?", shape)
+    return REPEATED_VALUES_PATTERN.sub(r"\1, ...", shape)
+
+
+def _param_size(param: Any) -> int:
+    if isinstance(param, (str, bytes, bytearray, memoryview)):
+        return len(param)
+    if isinstance(param, (list, tuple)):
+        return sum(_param_size(item) for item in param)
+    return 8
+
+
+def format_params(params: Optional[Sequence[Any]], limit: int) -> str:
+    """Краткое представление параметров запроса: не больше limit значений, длинные списки усекаются"""
+    if not params:
+        return ""
+    if isinstance(params, dict):
+        params = [f"{key}={value!r}" for key, value in params.items()]
+    shown = []
+    for param in list(params)[:limit]:
+        if isinstance(param, (list, tuple)) and len(param) > limit:
+            shown.append(f"[{', '.join(map(repr, param[:limit]))}, ... ещё {len(param) - limit}]")
+        else:
+            shown.append(repr(param))
+    if len(params) > limit:
+        shown.append(f"... ещё {len(params) - limit}")
+    return ", ".join(shown)
+
+
+class Tracer:
+    """
+    Сбор статистики SQL запросов по их нормализованному виду.
+
+    Для каждого запроса измеряется время выполнения; в гистограммы попадает доля запросов,
+    заданная sample_rate. Решение о выборке принимается до вычисления вида запроса, а размер запроса
+    с параметрами, требующий обхода всех параметров, измеряется только для доли size_sample_rate
+    попавших в выборку запросов. Текст запроса форматируется только если журнал принимает уровень DEBUG.
+    """
+
+    def __init__(self):
+        self.sample_rate = 1.0
+        self.size_sample_rate = 0.1
+        self.max_params = 10
+        self.statements: Dict[str, StatementStats] = {}
+        self.lock = threading.Lock()
+
+    def configure_from_env(self) -> None:
+        self.sample_rate = float(os.getenv("SQL_TRACE_SAMPLE_RATE", self.sample_rate))
+        self.size_sample_rate = float(os.getenv("SQL_TRACE_SIZE_SAMPLE_RATE", self.size_sample_rate))
+        self.max_params = int(os.getenv("SQL_TRACE_MAX_PARAMS", self.max_params))
+
+    def record(self, query: Any, params: Optional[Sequence[Any]], duration: float, rows: int,
+               batch: int = 1) -> None:
+        logger.opt(lazy=True).debug(
+            "SQL {:.2f} мс, строк: {}\n{}\n[{}]",
+            lambda: duration * 1000, lambda: rows,
+            lambda: str(query).strip(), lambda: format_params(params, self.max_params)
+        )
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if not isinstance(query, str):
+            query = str(query)
+        shape = query_shape(query)
+        size = None
+        if self.size_sample_rate >= 1.0 or random.random() < self.size_sample_rate:
+            size = len(query) * batch + (_param_size(params) if params else 0)
+        with self.lock:
+            stats = self.statements.get(shape)
+            if stats is None:
+                stats = self.statements[shape] = StatementStats(shape)
+            stats.latency_us.add(duration * 1_000_000)
+            stats.rows.add(max(rows, 0))
+            if size is not None:
+                stats.bytes.add(size)
+
+    def summary(self, top: Optional[int] = None) -> List[dict]:
+        """Статистика запросов, отсортированная по суммарному времени выполнения"""
+        with self.lock:
+            statements = sorted(self.statements.values(), key=lambda stats: stats.latency_us.total, reverse=True)
+            return [stats.to_dict() for stats in statements[:top]]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.statements.clear()
+
+
+tracer = Tracer()
+
+
+class TracedCursor(psycopg.Cursor):
+    """Курсор, передающий время выполнения и количество строк каждого запроса в tracer"""
+
+    def execute(self, query, params=None, **kwargs):
+        started = perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            tracer.record(query, params, perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, params_seq, **kwargs):
+        params_seq = list(params_seq)
+        started = perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            tracer.record(query, params_seq, perf_counter() - started, self.rowcount, len(params_seq))
+
+    @contextlib.contextmanager
+    def copy(self, statement, params=None, **kwargs):
+        started = perf_counter()
+        with super().copy(statement, params, **kwargs) as copy:
+            yield copy
+        tracer.record(statement, params, perf_counter() - started, self.rowcount)
+
+
+class SpanRecorder:
+    """
+    Замер длительности этапов работы приложения (запрос, построение строк таблицы, фильтрация, отрисовка).
+
+    По каждому этапу хранится гистограмма длительностей и последнее значение, а последние max_events
+    замеров сохраняются как события для экспорта в формате Chrome trace.
+    """
+
+    def __init__(self, max_events: int = 50_000):
+        self.enabled = True
+        self.stages: Dict[str, Histogram] = {}
+        self.last: Dict[str, float] = {}
+        self.events = deque(maxlen=max_events)
+        self.origin = perf_counter()
+        self.lock = threading.Lock()
+        self.profile: Optional[cProfile.Profile] = None
+
+    def configure_from_env(self) -> None:
+        self.enabled = os.getenv("PROFILING", "1") != "0"
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            finished = perf_counter()
+            duration_us = (finished - started) * 1_000_000
+            with self.lock:
+                histogram = self.stages.get(name)
+                if histogram is None:
+                    histogram = self.stages[name] = Histogram()
+                histogram.add(duration_us)
+                self.last[name] = duration_us
+                self.events.append((name, started, duration_us, threading.get_ident()))
+
+    def summary(self) -> List[dict]:
+        """Статистика этапов в микросекундах, отсортированная по суммарному времени"""
+        with self.lock:
+            return [
+                {"name": name, "last": self.last[name], **histogram.to_dict()}
+                for name, histogram in sorted(self.stages.items(), key=lambda item: item[1].total, reverse=True)
+            ]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages.clear()
+            self.last.clear()
+            self.events.clear()
+
+    def export_json(self, path: str) -> None:
+        """Сохраняет статистику этапов и SQL запросов в JSON файл"""
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"stages": self.summary(), "sql": tracer.summary()}, file, ensure_ascii=False, indent=2)
+        logger.info(f"Статистика производительности сохранена в {path}")
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Сохраняет события в формате Chrome trace (chrome://tracing, Perfetto)"""
+        with self.lock:
+            events = [
+                {"name": name, "ph": "X", "ts": (started - self.origin) * 1_000_000, "dur": duration_us,
+                 "pid": os.getpid(), "tid": thread_id}
+                for name, started, duration_us, thread_id in self.events
+            ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, ensure_ascii=False)
+        logger.info(f"Chrome trace сохранён в {path}: {len(events)} событий")
+
+    def start_profile(self) -> None:
+        """Начинает запись cProfile для последующих действий пользователя"""
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        logger.info("Запись cProfile начата")
+
+    def stop_profile(self, path: Optional[str] = None, top: int = 30) -> str:
+        """
+        Завершает запись cProfile.
+
+        :param path: Путь для сохранения статистики в формате pstats, None - не сохранять.
+        :param top: Количество функций в текстовом отчёте.
+        :return: Текстовый отчёт по функциям с наибольшим суммарным временем.
+        """
+        if self.profile is None:
+            return ""
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+        if path:
+            profile.dump_stats(path)
+            logger.info(f"Статистика cProfile сохранена в {path}")
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(top)
+        return report.getvalue()
+
+
+spans = SpanRecorder()
+span = spans.span
@@ -1,29 +1,48 @@
 import sys
 
-from PyQt5.QtCore import Qt, QSortFilterProxyModel, QRect
+from PyQt5.QtCore import Qt, QSortFilterProxyModel, QRect, QTimer, pyqtSignal
 from PyQt5.QtGui import QKeySequence, QFont
 from PyQt5.QtWidgets import QApplication, QWidget, QMainWindow, QVBoxLayout, QMenu, QStackedWidget, QMessageBox, \
-    QAction, QInputDialog, QLabel, QHBoxLayout, QLineEdit, QPushButton, QSizePolicy
+    QAction, QInputDialog, QLabel, QHBoxLayout, QLineEdit, QPushButton, QSizePolicy, QFileDialog, QProgressDialog, \
+    QCheckBox
 from loguru import logger
 from pyqtexcept_forgenet.main import create_exceptions_hook
 
+from database.changes import create_change_listener
+from database.tables import connection, local_cache
+from database.tracing import span
 from modules.reset import reset_database
+from modules.transfer import import_entries, export_entries
+from modules.snapshot import save_snapshot, restore_snapshot, list_snapshots
+from ui.duplicates import DuplicatesWidget
+from ui.profiling import ProfilingWidget
+from ui.statistics import StatisticsWidget
 from ui.table import EntriesTableWidget, ParentTableWidget
 
 
 class SearchWidget(QWidget):
+    search_delay_ms = 300
+
     def __init__(self, table):
         super().__init__()
         self.table = table
-        self.setFixedWidth(200)
+        self.setFixedWidth(300)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.search_delay_ms)
+        self.search_timer.timeout.connect(self.search)
         self.search_line_edit = QLineEdit()
         self.search_line_edit.setPlaceholderText("Поиск...")
-        self.search_line_edit.textEdited.connect(self.search)
+        self.search_line_edit.textEdited.connect(lambda: self.search_timer.start())
+        self.fuzzy_checkbox = QCheckBox("Похожие")
+        self.fuzzy_checkbox.setToolTip("Искать имена, фамилии, отчества и улицы с опечатками и похожие по звучанию")
+        self.fuzzy_checkbox.toggled.connect(self.search)
         layout = QHBoxLayout(self)
         layout.addWidget(self.search_line_edit)
+        layout.addWidget(self.fuzzy_checkbox)
 
     def search(self):
-        self.table.set_filter(self.search_line_edit.text())
+        self.table.set_filter(self.search_line_edit.text(), self.fuzzy_checkbox.isChecked())
 
 
 class ParentControlWidget(QWidget):
@@ -99,6 +118,9 @@ class ParentWindow(QMainWindow):
 
 
 class App(QMainWindow):
+    changes_interval_ms = 500
+    local_cache_synced = pyqtSignal(int)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle(f"Телефонный справочник")
@@ -113,6 +135,9 @@ class App(QMainWindow):
 
         self.parent_window = ParentWindow()
         self.parent_widgets = {}
+        self.profiling_widget = None
+        self.duplicates_widget = None
+        self.statistics_widget = None
 
         menu_bar = self.menuBar()
         tables_menu = QMenu("&Таблицы", self)
@@ -125,8 +150,31 @@ class App(QMainWindow):
         settings_menu = QMenu("&Утилиты", self)
         settings_menu.addAction("&Заполнить базу данных", self.fill_database_dialog)
         settings_menu.addAction("&Сброс базы данных", self.reset_database_dialog)
+        settings_menu.addSeparator()
+        settings_menu.addAction("&Импорт записей...", self.import_entries_dialog)
+        settings_menu.addAction("&Экспорт записей...", self.export_entries_dialog)
+        settings_menu.addSeparator()
+        settings_menu.addAction("Сохранить &снимок...", self.save_snapshot_dialog)
+        settings_menu.addAction("&Восстановить снимок...", self.restore_snapshot_dialog)
+        settings_menu.addSeparator()
+        settings_menu.addAction("Поиск по&второв...", self.open_duplicates_widget)
+        settings_menu.addAction("С&татистика...", self.open_statistics_widget)
+        settings_menu.addSeparator()
+        settings_menu.addAction("&Производительность...", self.open_profiling_widget)
         menu_bar.addMenu(settings_menu)
 
+        self.local_cache_synced.connect(self.on_local_cache_synced)
+
+        self.change_listener = create_change_listener(connection)
+        if self.change_listener is not None:
+            self.change_listener.start()
+            # Изменения применяются пачками раз в интервал, поэтому массовые операции других клиентов
+            # приводят к одному перечитыванию изменённых строк, а не к обновлению на каждую команду
+            self.changes_timer = QTimer(self)
+            self.changes_timer.setInterval(self.changes_interval_ms)
+            self.changes_timer.timeout.connect(self.apply_remote_changes)
+            self.changes_timer.start()
+
     def fill_database_dialog(self):
         dialog = QInputDialog(self)
         dialog.setWindowTitle("Заполнить базу данных")
@@ -155,9 +203,144 @@ class App(QMainWindow):
 
         chosen_variant = approval.exec()
         if chosen_variant == QMessageBox.Yes:
-            reset_database()
+            reset_database(connection)
             self.entries_widget.table.load_data()
 
+    def _create_progress_dialog(self, title: str, cancelable: bool = True) -> QProgressDialog:
+        dialog = QProgressDialog(title, "Отмена", 0, 0, self)
+        if not cancelable:
+            dialog.setCancelButton(None)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+        return dialog
+
+    @staticmethod
+    def _progress_callback(dialog: QProgressDialog, text: str):
+        def update(rows: int) -> bool:
+            dialog.setLabelText(text.format(rows=rows))
+            QApplication.processEvents()
+            return not dialog.wasCanceled()
+        return update
+
+    def import_entries_dialog(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Импорт записей", "", "Таблицы (*.csv *.xlsx)")
+        if not path:
+            return
+        dialog = self._create_progress_dialog("Импорт записей")
+        try:
+            report = import_entries(path, connection,
+                                    progress=self._progress_callback(dialog, "Обработано строк: {rows}"))
+        except (ValueError, RuntimeError) as e:
+            QMessageBox.warning(self, "Импорт записей", str(e))
+            return
+        finally:
+            dialog.close()
+        message = f"Импортировано записей: {report.imported}\nСтрок с ошибками: {report.error_count}"
+        if report.failure:
+            message += (f"\n\nИмпорт остановлен ошибкой базы данных на строке {report.resume_line}: "
+                        f"{report.failure}\nЗаписи до этой строки загружены.")
+        if report.errors:
+            message += "\n\n" + "\n".join(f"Строка {error.line}: {error.message}" for error in report.errors[:20])
+        QMessageBox.information(self, "Импорт записей", message)
+        self.entries_widget.table.load_data()
+
+    def export_entries_dialog(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт записей", "entries.csv", "CSV (*.csv);;Excel (*.xlsx)")
+        if not path:
+            return
+        dialog = self._create_progress_dialog("Экспорт записей", cancelable=False)
+        try:
+            count = export_entries(path, connection,
+                                   progress=self._progress_callback(dialog, "Выгружено записей: {rows}"))
+        except (ValueError, RuntimeError) as e:
+            QMessageBox.warning(self, "Экспорт записей", str(e))
+            return
+        finally:
+            dialog.close()
+        QMessageBox.information(self, "Экспорт записей", f"Выгружено записей: {count}")
+
+    def save_snapshot_dialog(self):
+        name, accepted = QInputDialog.getText(self, "Сохранить снимок", "Имя снимка:")
+        if not accepted or not name.strip():
+            return
+        try:
+            save_snapshot(name.strip(), connection)
+        except ValueError as e:
+            QMessageBox.warning(self, "Сохранить снимок", str(e))
+
+    def restore_snapshot_dialog(self):
+        names = [snapshot["name"] for snapshot in list_snapshots()]
+        if not names:
+            QMessageBox.information(self, "Восстановить снимок", "Нет сохранённых снимков")
+            return
+        name, accepted = QInputDialog.getItem(self, "Восстановить снимок",
+                                              "Текущие данные будут заменены данными снимка:", names, 0, False)
+        if not accepted:
+            return
+        try:
+            restore_snapshot(name, connection)
+        except ValueError as e:
+            QMessageBox.warning(self, "Восстановить снимок", str(e))
+            return
+        self.entries_widget.table.load_data()
+
+    def sync_local_cache(self):
+        """Загружает изменения после сохранённого снимка в отдельном потоке, не блокируя интерфейс"""
+        if local_cache is None:
+            return
+        # Сигнал из потока синхронизации доставляется в поток интерфейса через очередь событий
+        local_cache.start_sync(self.local_cache_synced.emit)
+
+    def on_local_cache_synced(self, changes: int):
+        """Обновляет таблицу, если синхронизация локального кеша загрузила изменения"""
+        if changes:
+            self.entries_widget.table.load_data()
+
+    def apply_remote_changes(self):
+        """Применяет изменения других клиентов, накопленные с прошлого вызова"""
+        changes = self.change_listener.buffer.drain()
+        if not changes:
+            return
+        with span("apply_remote_changes"):
+            entries_table = self.entries_widget.table
+            lookup_changes = {table_name: table_changes for table_name, table_changes in changes.items()
+                              if table_name != "entries"}
+            for table_name, table_changes in lookup_changes.items():
+                if table_name in self.parent_widgets:
+                    self.parent_widgets[table_name].table.apply_changes(table_changes)
+            if any(table_changes.reload for table_changes in lookup_changes.values()):
+                entries_table.load_data()
+                return
+            for table_name, table_changes in lookup_changes.items():
+                entries_table.apply_lookup_changes(table_name, table_changes)
+            if "entries" in changes:
+                entries_table.apply_changes(changes["entries"])
+
+    def closeEvent(self, event):
+        if self.change_listener is not None:
+            self.change_listener.stop()
+        super().closeEvent(event)
+
+    def open_duplicates_widget(self):
+        if self.duplicates_widget is None:
+            self.duplicates_widget = DuplicatesWidget()
+            self.duplicates_widget.entries_removed.connect(lambda _: self.entries_widget.table.reload_rows())
+        self.duplicates_widget.show()
+        self.duplicates_widget.activateWindow()
+
+    def open_statistics_widget(self):
+        if self.statistics_widget is None:
+            self.statistics_widget = StatisticsWidget()
+        self.statistics_widget.show()
+        self.statistics_widget.activateWindow()
+
+    def open_profiling_widget(self):
+        if self.profiling_widget is None:
+            self.profiling_widget = ProfilingWidget()
+        self.profiling_widget.show()
+        self.profiling_widget.activateWindow()
+
     def open_parent_widget(self, table_name: str, title: str):
         if table_name not in self.parent_widgets:
             widget = ParentControlWidget(table_name)
@@ -187,6 +370,7 @@ def main():
     window = App()
     sys.excepthook = create_exceptions_hook(window, True)
     window.show()
+    QTimer.singleShot(0, window.sync_local_cache)
     sys.exit(app.exec_())
 
 
@@ -0,0 +1,224 @@
+"""
+Поиск повторяющихся записей справочника.
+
+Точные повторы - записи с одинаковым ключом: ФИО и телефон или адрес и телефон. Они находятся
+одним запросом с оконной функцией, без сравнения записей попарно.
+
+Похожие записи - совпадающие во всех полях или во всех, кроме одного, после нормализации значений
+(регистр, «ё», пробелы и знаки препинания). Для каждого поля вычисляется хеш остальных полей записи: записи с одинаковым
+хешем попадают в один блок-кандидат. Хеши хранятся в массивах int64, поэтому память растёт линейно с числом записей,
+а попарное сравнение не выполняется. Одинаковый хеш не гарантирует совпадения значений, поэтому значения записей
+из блоков-кандидатов читаются заново и группы составляются по самим значениям.
+"""
+import re
+from array import array
+from itertools import groupby
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from loguru import logger
+
+from database.connection import Connection
+from database.storage import create_entry_table
+from database.tracing import span
+from schema.duplicates import DuplicateGroup
+
+DUPLICATE_KEYS = {
+    "person": ("ФИО и телефон", ["name_id", "surname_id", "patronymic_id", "phone"]),
+    "address": ("Адрес и телефон", ["street_id", "building", "apartment", "phone"]),
+}
+NEAR_FIELDS = {
+    "surname": "Фамилия",
+    "name": "Имя",
+    "patronymic": "Отчество",
+    "street": "Улица",
+    "building": "Дом",
+    "apartment": "Квартира",
+    "phone": "Телефон",
+}
+LABELS_QUERY = """
+    SELECT e.entry_id, s.surname, n.name, p.patronymic, st.street, e.building, e.apartment, e.phone
+    FROM entries e
+    JOIN names n ON e.name_id = n.name_id
+    JOIN surnames s ON e.surname_id = s.surname_id
+    JOIN patronymics p ON e.patronymic_id = p.patronymic_id
+    JOIN streets st ON e.street_id = st.street_id
+"""
+LABELS_TYPES = ["int8", "text", "text", "text", "text", "text", "int8", "text"]
+DELETE_CHUNK_SIZE = 10_000
+LABELS_CHUNK_SIZE = 10_000
+PROGRESS_INTERVAL = 10_000
+
+Progress = Callable[[int], Optional[bool]]
+
+_NOT_ALPHANUMERIC = re.compile(r"[\W_]+")
+
+
+def normalize_label(value) -> str:
+    """Значение без учёта регистра, «ё», пробелов и знаков препинания"""
+    return _NOT_ALPHANUMERIC.sub("", str(value).lower().replace("ё", "е"))
+
+
+def find_exact_duplicates(connection: Connection, kind: str) -> List[DuplicateGroup]:
+    """
+    Группы записей с одинаковым ключом kind (см. DUPLICATE_KEYS).
+
+    Размер группы вычисляется оконной функцией на стороне базы данных, в приложение передаются
+    только записи из групп больше одной записи.
+    """
+    title, columns = DUPLICATE_KEYS[kind]
+    key = ", ".join(columns)
+    query = f"""
+        SELECT entry_id, {key} FROM (
+            SELECT entry_id, {key}, count(*) OVER (PARTITION BY {key}) AS group_size FROM entries
+        ) candidates
+        WHERE group_size > 1
+        ORDER BY {key}, entry_id
+    """
+    with connection.cursor(False) as cursor, span(f"duplicates.{kind}"):
+        cursor.execute(query)
+        rows = cursor.fetchall()
+    return [DuplicateGroup(kind=kind, description=f"Совпадают: {title.lower()}", entry_ids=[row[0] for row in group])
+            for _, group in groupby(rows, key=lambda row: row[1:])]
+
+
+def find_near_duplicates(connection: Connection, progress: Optional[Progress] = None) -> List[DuplicateGroup]:
+    """
+    Группы записей, совпадающих после нормализации во всех полях или во всех, кроме одного.
+
+    :param progress: Функция, получающая количество прочитанных записей; если она вернёт False, поиск прерывается.
+    """
+    entries = create_entry_table(connection)
+    entry_ids, record_hashes = array("q"), array("q")
+    block_hashes = [array("q") for _ in NEAR_FIELDS]
+    with connection.cursor(False) as cursor, span("duplicates.near.read"):
+        rows = entries._stream_rows(cursor, LABELS_QUERY, LABELS_TYPES)
+        for count, row in enumerate(rows, 1):
+            values = tuple(normalize_label(value) for value in row[1:])
+            entry_ids.append(row[0])
+            record_hashes.append(hash(values))
+            for index, hashes in enumerate(block_hashes):
+                hashes.append(hash(values[:index] + values[index + 1:]))
+            if progress and count % PROGRESS_INTERVAL == 0 and progress(count) is False:
+                logger.warning("Поиск похожих записей прерван пользователем")
+                rows.close()
+                # Прерванное чтение оставляет транзакцию в состоянии ошибки
+                connection.connection.rollback()
+                return []
+
+    with span("duplicates.near.blocks"):
+        # Блоки-кандидаты: номер поля, которым могут отличаться записи (None - совпадают все поля), и ID записей
+        candidates = [(None, [entry_ids[position] for position in positions])
+                      for positions in _repeated_blocks(record_hashes)]
+        candidates += [(index, [entry_ids[position] for position in positions])
+                       for index, hashes in enumerate(block_hashes) for positions in _repeated_blocks(hashes)]
+        del entry_ids, record_hashes, block_hashes
+    with span("duplicates.near.verify"):
+        values = _normalized_labels(connection, sorted({entry_id for _, block in candidates for entry_id in block}))
+        titles = list(NEAR_FIELDS.values())
+        groups = []
+        for index, block in candidates:
+            members: Dict[tuple, List[int]] = {}
+            for entry_id in block:
+                # Запись могла быть удалена после чтения
+                if entry_id in values:
+                    record = values[entry_id]
+                    key = record if index is None else record[:index] + record[index + 1:]
+                    members.setdefault(key, []).append(entry_id)
+            for group_ids in members.values():
+                if len(group_ids) < 2:
+                    continue
+                if index is None:
+                    description = "Совпадают без учёта регистра и знаков"
+                elif len({values[entry_id][index] for entry_id in group_ids}) > 1:
+                    description = f"Отличается поле «{titles[index]}»"
+                else:
+                    # Записи, совпадающие и в этом поле, уже найдены как совпадающие полностью
+                    continue
+                groups.append(DuplicateGroup(kind="near", description=description, entry_ids=sorted(group_ids)))
+    return groups
+
+
+def _normalized_labels(connection: Connection, entry_ids: List[int]) -> Dict[int, tuple]:
+    """Нормализованные значения полей NEAR_FIELDS записей entry_ids"""
+    entries = create_entry_table(connection)
+    labels = {}
+    with connection.cursor(False) as cursor:
+        for start in range(0, len(entry_ids), LABELS_CHUNK_SIZE):
+            chunk = entry_ids[start:start + LABELS_CHUNK_SIZE]
+            cursor.execute(f"{LABELS_QUERY} WHERE {entries._match_any('e.entry_id')}", (entries._any_param(chunk),))
+            for row in cursor.fetchall():
+                labels[row[0]] = tuple(normalize_label(value) for value in row[1:])
+    return labels
+
+
+def _repeated_blocks(hashes: array) -> Iterable[List[int]]:
+    """Номера позиций с одинаковым хешем для хешей, встречающихся больше одного раза"""
+    seen, repeated = set(), set()
+    for block in hashes:
+        if block in seen:
+            repeated.add(block)
+        else:
+            seen.add(block)
+    del seen
+    members: Dict[int, List[int]] = {}
+    for position, block in enumerate(hashes):
+        if block in repeated:
+            members.setdefault(block, []).append(position)
+    return members.values()
+
+
+def find_duplicates(connection: Connection, kinds: Iterable[str] = tuple(DUPLICATE_KEYS), near: bool = True,
+                    progress: Optional[Progress] = None) -> List[DuplicateGroup]:
+    """
+    Точные повторы по ключам kinds и, если near, похожие записи.
+
+    Группы из одних и тех же записей, найденные разными способами, возвращаются один раз.
+    """
+    logger.info("Поиск повторяющихся записей")
+    found = [group for kind in kinds for group in find_exact_duplicates(connection, kind)]
+    if near:
+        found += find_near_duplicates(connection, progress)
+    groups, seen = [], set()
+    for group in found:
+        key = tuple(group.entry_ids)
+        if key not in seen:
+            seen.add(key)
+            groups.append(group)
+    logger.info(f"Найдено групп повторяющихся записей: {len(groups)}")
+    return groups
+
+
+def get_entry_labels(connection: Connection, entry_ids: List[int]) -> Dict[int, tuple]:
+    """Отображаемые значения записей: ID записи -> (фамилия, имя, отчество, улица, дом, квартира, телефон)"""
+    entries = create_entry_table(connection)
+    with connection.cursor(False) as cursor:
+        cursor.execute(f"{LABELS_QUERY} WHERE {entries._match_any('e.entry_id')}", (entries._any_param(entry_ids),))
+        return {row[0]: tuple(value.strip() if isinstance(value, str) else value for value in row[1:])
+                for row in cursor.fetchall()}
+
+
+def remove_duplicates(connection: Connection, groups: Iterable[DuplicateGroup],
+                      keep_ids: Optional[Set[int]] = None) -> int:
+    """
+    Оставляет в каждой группе одну запись и удаляет остальные одной транзакцией.
+
+    :param groups: Группы повторяющихся записей.
+    :param keep_ids: Записи, которые нужно оставить; в группе без таких записей остаётся запись с наименьшим ID.
+        Запись, оставленная в одной группе, не удаляется и в других.
+    :return: Количество удалённых записей.
+    """
+    keep_ids = set(keep_ids or ())
+    kept, members = set(), set()
+    for group in groups:
+        members.update(group.entry_ids)
+        kept.update([entry_id for entry_id in group.entry_ids if entry_id in keep_ids] or [min(group.entry_ids)])
+    removed_ids = sorted(members - kept)
+    entries = create_entry_table(connection)
+    removed = 0
+    with entries.exception_handler(), connection.cursor() as cursor, span("duplicates.remove"):
+        for start in range(0, len(removed_ids), DELETE_CHUNK_SIZE):
+            chunk = removed_ids[start:start + DELETE_CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM entries WHERE {entries._match_any('entry_id')}", (entries._any_param(chunk),))
+            removed += cursor.rowcount
+    logger.success(f"Удалено повторяющихся записей: {removed}")
+    return removed
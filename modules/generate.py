@@ -1,10 +1,16 @@
 import random
 from concurrent.futures import ThreadPoolExecutor
-from typing import List
+from typing import List, Callable, Optional
 
 from mimesis import Person, Address, Locale, Gender
 from mimesis.builtins import RussiaSpecProvider
 
+from database.connection import Connection
+from database.lookups import LabelResolver
+from database.partitions import PartitionLoader
+from database.storage import create_entry_table, is_sqlite
+from database.tracing import span
+
 person = Person(Locale.RU)
 address = Address(Locale.RU)
 provider = RussiaSpecProvider()
@@ -41,3 +47,47 @@ def generate_entries(count: int) -> List[dict]:
     with ThreadPoolExecutor() as executor:
         entries = list(executor.map(lambda _: generate_entry(), range(count)))
     return entries
+
+
+def fill_database(count: int, connection: Connection, chunk_size: int = 10_000,
+                  progress: Optional[Callable[[int, int], None]] = None, workers: int = 1) -> int:
+    """
+    Заполняет базу данных случайно сгенерированными записями.
+
+    Записи генерируются и загружаются частями по chunk_size, поэтому потребление памяти
+    не зависит от count. Значения родительских таблиц переиспользуются, если уже существуют.
+
+    :param count: Количество записей.
+    :param connection: Подключение к базе данных.
+    :param chunk_size: Количество записей в одной части.
+    :param progress: Функция, получающая количество созданных записей и общее количество.
+    :param workers: Количество подключений для параллельной загрузки в секции таблицы записей
+        (см. database/partitions.py); используется, только если таблица секционирована.
+    :return: Количество созданных записей.
+    """
+    resolver = LabelResolver(connection)
+    if workers > 1 and not is_sqlite(connection):
+        loader = PartitionLoader(connection, workers)
+        load, close = loader.load, loader.close
+    else:
+        load, close = create_entry_table(connection).bulk_insert, lambda: None
+    created = 0
+    try:
+        while created < count:
+            with span("generate.entries"):
+                entries = generate_entries(min(chunk_size, count - created))
+            with span("generate.load"):
+                ids = {column: resolver.resolve(column, [entry[column] for entry in entries])
+                       for column in ("name", "surname", "patronymic", "street")}
+                load(
+                    (ids["name"][entry["name"]], ids["surname"][entry["surname"]],
+                     ids["patronymic"][entry["patronymic"]], ids["street"][entry["street"]],
+                     entry["building"], entry["apartment"], entry["phone"])
+                    for entry in entries
+                )
+            created += len(entries)
+            if progress:
+                progress(created, count)
+    finally:
+        close()
+    return created
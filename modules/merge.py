@@ -0,0 +1,134 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from database.connection import Connection
+from database.migrations import LOOKUP_TABLES
+from database.storage import is_sqlite
+from database.tracing import span
+from modules.duplicates import normalize_label
+
+MERGE_CHUNK_SIZE = 10_000
+
+Progress = Callable[[int], Any]
+
+
+def merge_duplicate_values(connection: Connection, table_names: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Объединяет одинаковые значения родительских таблиц: записи справочника переносятся
+    на значение с наименьшим ID, остальные значения удаляются. Все таблицы обрабатываются одной транзакцией.
+
+    :param connection: Подключение к базе данных.
+    :param table_names: Родительские таблицы, по умолчанию все.
+    :return: Словарь имя таблицы -> количество удалённых значений.
+    """
+    removed = {}
+    with connection.cursor() as cursor:
+        for table_name in table_names or list(LOOKUP_TABLES):
+            id_column, data_column = LOOKUP_TABLES[table_name]
+            cursor.execute(f"""
+                WITH merged AS (
+                    SELECT old_id, new_id FROM (
+                        SELECT {id_column} AS old_id,
+                               min({id_column}) OVER (PARTITION BY {data_column}) AS new_id
+                        FROM {table_name}
+                    ) candidates
+                    WHERE old_id <> new_id
+                )
+                UPDATE entries e SET {id_column} = merged.new_id
+                FROM merged
+                WHERE e.{id_column} = merged.old_id
+            """)
+            moved = cursor.rowcount
+            cursor.execute(f"""
+                DELETE FROM {table_name} t
+                WHERE EXISTS (
+                    SELECT 1 FROM {table_name} kept
+                    WHERE kept.{data_column} = t.{data_column} AND kept.{id_column} < t.{id_column}
+                )
+            """)
+            removed[table_name] = cursor.rowcount
+            logger.info(f"Таблица {table_name}: удалено повторяющихся значений {cursor.rowcount}, "
+                        f"перенесено записей {moved}")
+    return removed
+
+
+def find_similar_values(connection: Connection, table_name: str) -> Dict[Any, List[Any]]:
+    """
+    Значения родительской таблицы, совпадающие без учёта регистра, «ё», пробелов и знаков препинания.
+
+    Основным в группе выбирается значение, на которое ссылается больше всего записей справочника,
+    при равенстве - с наименьшим ID.
+
+    :return: Словарь ID основного значения -> ID значений, объединяемых с ним.
+    """
+    id_column, data_column = LOOKUP_TABLES[table_name]
+    with connection.cursor(False) as cursor, span(f"merge.{table_name}.find"):
+        cursor.execute(f"""
+            SELECT t.{id_column}, t.{data_column}, coalesce(used.entry_count, 0)
+            FROM {table_name} t
+            LEFT JOIN (
+                SELECT {id_column}, count(*) AS entry_count FROM entries GROUP BY {id_column}
+            ) used ON used.{id_column} = t.{id_column}
+        """)
+        rows = cursor.fetchall()
+    groups: Dict[str, List[Tuple[int, Any]]] = {}
+    for value_id, value, entry_count in rows:
+        groups.setdefault(normalize_label(value), []).append((-entry_count, value_id))
+    merges = {}
+    for members in groups.values():
+        if len(members) > 1:
+            members.sort()
+            merges[members[0][1]] = [value_id for _, value_id in members[1:]]
+    return merges
+
+
+def merge_values(connection: Connection, table_name: str, merges: Dict[Any, List[Any]],
+                 progress: Optional[Progress] = None) -> Tuple[int, int]:
+    """
+    Переносит записи справочника на основные значения и удаляет объединённые значения одной транзакцией.
+
+    Соответствие ID загружается во временную таблицу (в PostgreSQL - через COPY), после чего ссылки
+    переносятся запросами UPDATE ... FROM, а значения удаляются запросами DELETE по диапазонам
+    из MERGE_CHUNK_SIZE объединяемых значений.
+
+    :param merges: Словарь ID основного значения -> ID объединяемых значений (см. find_similar_values).
+    :param progress: Функция, получающая количество объединённых значений после каждого диапазона.
+    :return: Количество перенесённых записей и удалённых значений.
+    """
+    id_column, _ = LOOKUP_TABLES[table_name]
+    pairs = sorted((old_id, new_id) for new_id, old_ids in merges.items() for old_id in old_ids)
+    logger.info(f"Объединение значений таблицы {table_name}: {len(pairs)}")
+    sqlite = is_sqlite(connection)
+    # Имя временной таблицы указывается со схемой, чтобы не задеть постоянную таблицу с тем же именем
+    merge_map = "temp.merge_map" if sqlite else "pg_temp.merge_map"
+    moved = removed = 0
+    with connection.cursor() as cursor, span(f"merge.{table_name}"):
+        if sqlite:
+            cursor.execute(f"DROP TABLE IF EXISTS {merge_map}")
+        cursor.execute("CREATE TEMP TABLE merge_map (old_id bigint PRIMARY KEY, new_id bigint NOT NULL)"
+                       + ("" if sqlite else " ON COMMIT DROP"))
+        if sqlite:
+            cursor.executemany(f"INSERT INTO {merge_map} (old_id, new_id) VALUES (%s, %s)", pairs)
+        else:
+            with cursor.copy(f"COPY {merge_map} (old_id, new_id) FROM STDIN") as copy:
+                for pair in pairs:
+                    copy.write_row(pair)
+        for start in range(0, len(pairs), MERGE_CHUNK_SIZE):
+            end = min(start + MERGE_CHUNK_SIZE, len(pairs))
+            bounds = (pairs[start][0], pairs[end - 1][0])
+            cursor.execute(f"""
+                UPDATE entries SET {id_column} = m.new_id
+                FROM {merge_map} m
+                WHERE entries.{id_column} = m.old_id AND m.old_id BETWEEN %s AND %s
+            """, bounds)
+            moved += cursor.rowcount
+            cursor.execute(f"DELETE FROM {table_name} WHERE {id_column} IN "
+                           f"(SELECT old_id FROM {merge_map} WHERE old_id BETWEEN %s AND %s)", bounds)
+            removed += cursor.rowcount
+            if progress:
+                progress(end)
+        if sqlite:
+            cursor.execute(f"DROP TABLE {merge_map}")
+    logger.success(f"Таблица {table_name}: удалено значений {removed}, перенесено записей {moved}")
+    return moved, removed
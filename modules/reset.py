@@ -1,25 +1,30 @@
+from typing import Optional
+
 from loguru import logger
 
 from database.connection import Connection
+from database.storage import create_connection, is_sqlite
+
+RESET_TABLES = ["entries", "names", "surnames", "patronymics", "streets"]
+
+
+def reset_database(connection: Optional[Connection] = None):
+    """
+    Очищает все таблицы справочника и сбрасывает счётчики ID.
 
+    TRUNCATE не оставляет мёртвых строк, поэтому после сброса не требуется VACUUM.
 
-def reset_database():
-    connection = Connection()
-    connection.connect()
+    :param connection: Подключение к базе данных, по умолчанию создаётся новое.
+    """
+    if connection is None:
+        connection = create_connection()
+        connection.connect()
     logger.warning("Сброс базы данных...")
     with connection.cursor() as cursor:
-        cursor.execute("""
-            DELETE FROM entries;
-            
-            DELETE FROM names;
-            DELETE FROM surnames;
-            DELETE FROM patronymics;
-            DELETE FROM streets;
-            
-            alter sequence entries_entry_id_seq restart with 1;
-            alter sequence names_name_id_seq restart with 1;
-            alter sequence patronymics_patronymic_id_seq restart with 1;
-            alter sequence streets_street_id_seq restart with 1;
-            alter sequence surnames_surname_id_seq restart with 1;
-        """)
-    logger.success("База данных сброшена")
\ No newline at end of file
+        if is_sqlite(connection):
+            for table_name in RESET_TABLES:
+                cursor.execute(f"DELETE FROM {table_name}")
+            cursor.execute("DELETE FROM sqlite_sequence")
+        else:
+            cursor.execute(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY CASCADE")
+    logger.success("База данных сброшена")
@@ -0,0 +1,133 @@
+import os
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import List, Dict
+
+from loguru import logger
+
+from database.connection import Connection
+from database.entry import Entry
+from database.migrations import LOOKUP_TABLES, get_schema_version
+from database.storage import require_postgres
+from modules.reset import RESET_TABLES
+
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", "snapshots"))
+MANIFEST_FILE = "manifest.json"
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def _snapshot_tables(connection: Connection) -> Dict[str, List[str]]:
+    """Таблицы снимка в порядке восстановления: сначала родительские, затем записи"""
+    tables = {table_name: list(columns) for table_name, columns in LOOKUP_TABLES.items()}
+    tables["entries"] = Entry(connection).columns
+    return tables
+
+
+def _snapshot_path(name: str) -> Path:
+    if not name or Path(name).name != name or name.startswith("."):
+        raise ValueError(f"Недопустимое имя снимка: {name!r}")
+    return SNAPSHOT_DIR / name
+
+
+def list_snapshots() -> List[dict]:
+    """Возвращает описания сохранённых снимков, от новых к старым"""
+    if not SNAPSHOT_DIR.exists():
+        return []
+    snapshots = []
+    for manifest_path in SNAPSHOT_DIR.glob(f"*/{MANIFEST_FILE}"):
+        with open(manifest_path, encoding="utf-8") as file:
+            snapshots.append(json.load(file))
+    return sorted(snapshots, key=lambda snapshot: snapshot["created_at"], reverse=True)
+
+
+def save_snapshot(name: str, connection: Connection) -> dict:
+    """
+    Сохраняет все таблицы справочника в именованный снимок.
+
+    Данные выгружаются через COPY в двоичном формате, по файлу на таблицу.
+    Все таблицы читаются в одной транзакции, поэтому снимок согласован.
+
+    :param name: Имя снимка, существующий снимок с тем же именем будет заменён.
+    :param connection: Подключение к базе данных.
+    :return: Манифест сохранённого снимка.
+    """
+    require_postgres(connection, "Сохранение снимка")
+    path = _snapshot_path(name)
+    temp_path = path.with_name(f".{name}.tmp")
+    shutil.rmtree(temp_path, ignore_errors=True)
+    temp_path.mkdir(parents=True)
+    logger.info(f"Сохранение снимка базы данных {name}")
+
+    manifest = {
+        "name": name,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "schema_version": get_schema_version(connection),
+        "tables": {}
+    }
+    # get_schema_version завершает транзакцию, поэтому уровень изоляции задаётся первым запросом новой
+    with connection.cursor() as cursor:
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        for table_name, columns in _snapshot_tables(connection).items():
+            with open(temp_path / f"{table_name}.bin", "wb") as file, \
+                    cursor.copy(f"COPY {table_name} ({', '.join(columns)}) TO STDOUT (FORMAT BINARY)") as copy:
+                for block in copy:
+                    file.write(block)
+            cursor.execute(f"SELECT count(*) FROM {table_name}")
+            manifest["tables"][table_name] = {"columns": columns, "rows": cursor.fetchone()[0]}
+
+    with open(temp_path / MANIFEST_FILE, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    temp_path.rename(path)
+    logger.success(f"Снимок {name} сохранён: {manifest['tables']['entries']['rows']} записей")
+    return manifest
+
+
+def restore_snapshot(name: str, connection: Connection) -> dict:
+    """
+    Заменяет содержимое справочника данными из снимка.
+
+    Очистка таблиц и загрузка выполняются в одной транзакции: при ошибке база остаётся прежней.
+
+    :param name: Имя снимка.
+    :param connection: Подключение к базе данных.
+    :return: Манифест восстановленного снимка.
+    """
+    require_postgres(connection, "Восстановление снимка")
+    path = _snapshot_path(name)
+    manifest_path = path / MANIFEST_FILE
+    if not manifest_path.exists():
+        raise ValueError(f"Снимок {name} не найден")
+    with open(manifest_path, encoding="utf-8") as file:
+        manifest = json.load(file)
+    schema_version = get_schema_version(connection)
+    if manifest["schema_version"] != schema_version:
+        raise ValueError(f"Снимок {name} создан для схемы версии {manifest['schema_version']}, "
+                         f"текущая версия схемы {schema_version}")
+
+    logger.warning(f"Восстановление снимка базы данных {name}")
+    with connection.cursor() as cursor:
+        cursor.execute(f"TRUNCATE {', '.join(RESET_TABLES)} RESTART IDENTITY CASCADE")
+        for table_name in _snapshot_tables(connection):
+            columns = manifest["tables"][table_name]["columns"]
+            with open(path / f"{table_name}.bin", "rb") as file, \
+                    cursor.copy(f"COPY {table_name} ({', '.join(columns)}) FROM STDIN (FORMAT BINARY)") as copy:
+                while block := file.read(COPY_BLOCK_SIZE):
+                    copy.write(block)
+            primary_key = columns[0]
+            cursor.execute(f"""
+                SELECT setval(pg_get_serial_sequence(%s, %s), coalesce(max({primary_key}), 1), max({primary_key}) IS NOT NULL)
+                FROM {table_name}
+            """, (table_name, primary_key))
+    logger.success(f"Снимок {name} восстановлен: {manifest['tables']['entries']['rows']} записей")
+    return manifest
+
+
+def delete_snapshot(name: str) -> None:
+    path = _snapshot_path(name)
+    if not path.exists():
+        raise ValueError(f"Снимок {name} не найден")
+    shutil.rmtree(path)
+    logger.info(f"Снимок {name} удалён")
@@ -0,0 +1,68 @@
+"""
+Статистика справочника: количество записей по улицам, фамилиям и домам.
+
+Значения читаются из таблиц счётчиков (database/migrations.py, ENTRY_COUNTERS), которые обновляются
+триггерами при изменении записей. Размер этих таблиц зависит от количества улиц, фамилий и домов,
+а не от количества записей, поэтому запросы не читают таблицу entries.
+"""
+from typing import Dict, List, Tuple
+
+from loguru import logger
+
+from database.connection import Connection
+from database.migrations import ENTRY_COUNTERS, rebuild_entry_counters
+from database.storage import is_sqlite
+from database.tracing import span
+from schema.statistics import CountRow, DistributionRow
+
+STATISTICS: Dict[str, Tuple[str, str, str]] = {
+    "streets": ("Записей на улице", "street_counts",
+                "SELECT st.street, c.entry_count FROM street_counts c JOIN streets st ON st.street_id = c.street_id"),
+    "surnames": ("Записей с фамилией", "surname_counts",
+                 "SELECT s.surname, c.entry_count FROM surname_counts c "
+                 "JOIN surnames s ON s.surname_id = c.surname_id"),
+    "buildings": ("Телефонов в доме", "building_counts",
+                  "SELECT st.street || ', ' || c.building, c.entry_count FROM building_counts c "
+                  "JOIN streets st ON st.street_id = c.street_id"),
+}
+
+
+def top_counts(connection: Connection, kind: str, limit: int = 20) -> List[CountRow]:
+    """Значения с наибольшим количеством записей; kind - ключ STATISTICS"""
+    _, table_name, query = STATISTICS[kind]
+    order = ", ".join(f"c.{column}" for column in ENTRY_COUNTERS[table_name])
+    with connection.cursor(False) as cursor, span(f"statistics.{kind}.top"):
+        cursor.execute(f"{query} ORDER BY c.entry_count DESC, {order} LIMIT %s", (limit,))
+        return [CountRow(label=label, entry_count=entry_count) for label, entry_count in cursor.fetchall()]
+
+
+def count_distribution(connection: Connection, kind: str) -> List[DistributionRow]:
+    """Распределение: сколько улиц (фамилий, домов) имеют каждое количество записей"""
+    _, table_name, _ = STATISTICS[kind]
+    with connection.cursor(False) as cursor, span(f"statistics.{kind}.distribution"):
+        cursor.execute(f"SELECT entry_count, count(*) FROM {table_name} GROUP BY entry_count ORDER BY entry_count")
+        return [DistributionRow(entry_count=entry_count, groups=groups) for entry_count, groups in cursor.fetchall()]
+
+
+def count_totals(connection: Connection, kind: str) -> Tuple[int, int]:
+    """Количество улиц (фамилий, домов), на которые ссылаются записи, и количество этих записей"""
+    _, table_name, _ = STATISTICS[kind]
+    with connection.cursor(False) as cursor:
+        cursor.execute(f"SELECT count(*), coalesce(sum(entry_count), 0) FROM {table_name}")
+        groups, entries = cursor.fetchone()
+        return groups, int(entries)
+
+
+def rebuild_counters(connection: Connection) -> None:
+    """
+    Пересчитывает счётчики по таблице записей, например после изменения записей с отключёнными триггерами.
+
+    В PostgreSQL на время пересчёта запись в entries блокируется, чтобы изменения других клиентов
+    не были учтены дважды.
+    """
+    logger.info("Пересчёт счётчиков статистики")
+    with connection.cursor() as cursor, span("statistics.rebuild"):
+        if not is_sqlite(connection):
+            cursor.execute("LOCK TABLE entries IN SHARE MODE")
+        rebuild_entry_counters(cursor)
+    logger.success("Счётчики статистики пересчитаны")
@@ -0,0 +1,236 @@
+import csv
+from pathlib import Path
+from itertools import islice
+from typing import Iterator, Tuple, Dict, List, Callable, Optional, Any
+
+from loguru import logger
+
+from database.connection import Connection
+from database.lookups import LabelResolver
+from database.phone import normalize_phone
+from database.storage import create_entry_table, is_sqlite
+from schema.transfer import ImportReport, RowError
+
+EXPORT_COLUMNS = ["surname", "name", "patronymic", "street", "building", "apartment", "phone"]
+COLUMN_ALIASES = {
+    "фамилия": "surname",
+    "имя": "name",
+    "отчество": "patronymic",
+    "улица": "street",
+    "дом": "building",
+    "квартира": "apartment",
+    "телефон": "phone",
+}
+EXPORT_QUERY = """
+    SELECT s.surname, n.name, p.patronymic, st.street, e.building, e.apartment, e.phone
+    FROM entries e
+    JOIN names n ON e.name_id = n.name_id
+    JOIN surnames s ON e.surname_id = s.surname_id
+    JOIN patronymics p ON e.patronymic_id = p.patronymic_id
+    JOIN streets st ON e.street_id = st.street_id
+    ORDER BY e.entry_id
+"""
+XLSX_MAX_ROWS = 1_048_576
+CHUNK_SIZE = 10_000
+MAX_REPORTED_ERRORS = 1000
+
+Progress = Callable[[int], Optional[bool]]
+
+
+def _load_openpyxl():
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise RuntimeError("Для работы с XLSX необходимо установить пакет openpyxl") from e
+    return openpyxl
+
+
+def _count_csv_records(block: bytes, quoted: bool) -> Tuple[int, bool]:
+    """
+    Количество концов записей CSV в блоке: переводы строк внутри значений в кавычках не учитываются.
+
+    :param quoted: Начинается ли блок внутри значения в кавычках.
+    :return: Количество записей и признак того, что блок закончился внутри значения в кавычках.
+    """
+    count = 0
+    for index, part in enumerate(block.split(b'"')):
+        if index:
+            quoted = not quoted
+        if not quoted:
+            count += part.count(b"\n")
+    return count, quoted
+
+
+def _export_rows(cursor, connection: Connection) -> Iterator[tuple]:
+    """Строки выгрузки: из PostgreSQL - потоком через COPY, из SQLite - чтением курсора"""
+    if is_sqlite(connection):
+        yield from cursor.execute(EXPORT_QUERY)
+        return
+    with cursor.copy(f"COPY ({EXPORT_QUERY}) TO STDOUT") as copy:
+        copy.set_types(["text", "text", "text", "text", "text", "int4", "text"])
+        yield from copy.rows()
+
+
+def export_entries(path: str, connection: Connection, progress: Optional[Progress] = None) -> int:
+    """
+    Выгружает все записи справочника в CSV или XLSX файл.
+
+    Строки передаются потоком (из PostgreSQL через COPY), поэтому потребление памяти не зависит от размера справочника.
+
+    :param path: Путь к файлу, формат определяется по расширению (.csv или .xlsx).
+    :param connection: Подключение к базе данных.
+    :param progress: Функция, получающая количество выгруженных строк.
+    :return: Количество выгруженных записей.
+    """
+    logger.info(f"Экспорт записей в файл {path}")
+    exported = 0
+    with connection.cursor(False) as cursor:
+        if Path(path).suffix.lower() == ".xlsx":
+            openpyxl = _load_openpyxl()
+            workbook = openpyxl.Workbook(write_only=True)
+            sheet = workbook.create_sheet("entries")
+            sheet.append(EXPORT_COLUMNS)
+            for row in _export_rows(cursor, connection):
+                if exported >= XLSX_MAX_ROWS - 1:
+                    raise ValueError(f"XLSX файл не может содержать больше {XLSX_MAX_ROWS - 1} записей")
+                sheet.append(row)
+                exported += 1
+                if progress and exported % CHUNK_SIZE == 0:
+                    progress(exported)
+            workbook.save(path)
+        elif is_sqlite(connection):
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                writer = csv.writer(file)
+                writer.writerow(EXPORT_COLUMNS)
+                for row in _export_rows(cursor, connection):
+                    writer.writerow(row)
+                    exported += 1
+                    if progress and exported % CHUNK_SIZE == 0:
+                        progress(exported)
+        else:
+            quoted = False
+            with open(path, "wb") as file, \
+                    cursor.copy(f"COPY ({EXPORT_QUERY}) TO STDOUT (FORMAT CSV, HEADER)") as copy:
+                for block in copy:
+                    block = bytes(block)
+                    file.write(block)
+                    records, quoted = _count_csv_records(block, quoted)
+                    exported += records
+                    if progress:
+                        progress(max(exported - 1, 0))
+            exported = max(exported - 1, 0)
+    logger.success(f"Экспортировано записей: {exported}")
+    return exported
+
+
+def _normalize_header(header: List[Any]) -> List[str]:
+    columns = []
+    for value in header:
+        column = str(value or "").strip().lower()
+        columns.append(COLUMN_ALIASES.get(column, column))
+    missing = set(EXPORT_COLUMNS) - set(columns)
+    if missing:
+        raise ValueError(f"В файле отсутствуют колонки: {', '.join(sorted(missing))}")
+    return columns
+
+
+def _read_csv(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.reader(file)
+        columns = _normalize_header(next(reader, []))
+        for row in reader:
+            if any(row):
+                yield reader.line_num, dict(zip(columns, row))
+
+
+def _read_xlsx(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    openpyxl = _load_openpyxl()
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = _normalize_header(list(next(rows, [])))
+        for line, row in enumerate(rows, start=2):
+            if any(value is not None for value in row):
+                yield line, dict(zip(columns, row))
+    finally:
+        workbook.close()
+
+
+def _parse_row(row: Dict[str, Any]) -> Tuple:
+    labels = []
+    for column in ("name", "surname", "patronymic", "street"):
+        value = str(row.get(column) or "").strip()
+        if not value:
+            raise ValueError(f"Не заполнено поле {column}")
+        labels.append(value)
+    building = str(row.get("building") or "").strip()
+    try:
+        apartment = int(str(row.get("apartment") or 0).strip())
+    except ValueError:
+        raise ValueError(f"Некорректный номер квартиры: {row.get('apartment')!r}")
+    return (*labels, building, apartment, normalize_phone(row.get("phone") or ""))
+
+
+def import_entries(path: str, connection: Connection, chunk_size: int = CHUNK_SIZE,
+                   progress: Optional[Progress] = None, start_line: int = 0) -> ImportReport:
+    """
+    Загружает записи из CSV или XLSX файла.
+
+    Файл читается частями по chunk_size строк. Для каждой части значения имён, фамилий,
+    отчеств и улиц разрешаются в ID одним запросом на таблицу (отсутствующие создаются),
+    после чего записи передаются через COPY. Каждая часть фиксируется отдельной транзакцией.
+    Строки с ошибками пропускаются и попадают в отчёт. Если часть не удалось загрузить из-за ошибки
+    базы данных, импорт останавливается: предыдущие части остаются загруженными, а в отчёте указываются
+    ошибка и строка, с которой импорт можно продолжить (start_line).
+
+    :param path: Путь к файлу, формат определяется по расширению (.csv или .xlsx).
+    :param connection: Подключение к базе данных.
+    :param chunk_size: Количество строк в одной части.
+    :param progress: Функция, получающая количество обработанных строк; если она вернёт False, импорт прерывается.
+    :param start_line: Номер строки файла, с которой начинается импорт; предыдущие строки пропускаются.
+    :return: Отчёт об импорте.
+    """
+    logger.info(f"Импорт записей из файла {path}")
+    rows = _read_xlsx(path) if Path(path).suffix.lower() == ".xlsx" else _read_csv(path)
+    rows = (row for row in rows if row[0] >= start_line)
+    resolver = LabelResolver(connection)
+    entries = create_entry_table(connection)
+    report = ImportReport()
+
+    while chunk := list(islice(rows, chunk_size)):
+        parsed = []
+        for line, row in chunk:
+            try:
+                parsed.append(_parse_row(row))
+            except ValueError as e:
+                report.error_count += 1
+                if len(report.errors) < MAX_REPORTED_ERRORS:
+                    report.errors.append(RowError(line=line, message=str(e)))
+
+        try:
+            name_ids = resolver.resolve("name", [row[0] for row in parsed])
+            surname_ids = resolver.resolve("surname", [row[1] for row in parsed])
+            patronymic_ids = resolver.resolve("patronymic", [row[2] for row in parsed])
+            street_ids = resolver.resolve("street", [row[3] for row in parsed])
+
+            entries.bulk_insert(
+                (name_ids[name], surname_ids[surname], patronymic_ids[patronymic], street_ids[street],
+                 building, apartment, phone)
+                for name, surname, patronymic, street, building, apartment, phone in parsed
+            )
+        except Exception as e:
+            report.resume_line = chunk[0][0]
+            report.failure = str(e)
+            logger.error(f"Импорт остановлен на части со строки {report.resume_line}, "
+                         f"импортировано записей: {report.imported}")
+            break
+
+        report.processed += len(chunk)
+        report.imported += len(parsed)
+        logger.debug(f"Импортировано записей: {report.imported}, обработано строк: {report.processed}")
+        if progress and progress(report.processed) is False:
+            logger.warning("Импорт прерван пользователем")
+            break
+
+    logger.success(f"Импорт завершён: {report.imported} записей, ошибок: {report.error_count}")
+    return report
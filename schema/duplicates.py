@@ -0,0 +1,7 @@
+from pydantic import BaseModel
+
+
+class DuplicateGroup(BaseModel):
+    kind: str
+    description: str
+    entry_ids: list[int]
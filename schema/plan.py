@@ -0,0 +1,10 @@
+from typing import Optional
+from pydantic import BaseModel
+
+
+class PlanIssue(BaseModel):
+    query: str
+    node_type: str
+    relation: Optional[str] = None
+    estimated_rows: float
+    message: str
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class ValueMatch(BaseModel):
+    table_name: str
+    value_id: int
+    value: str
+    distance: int
+    same_sound: bool
@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+
+
+class CountRow(BaseModel):
+    label: str
+    entry_count: int
+
+
+class DistributionRow(BaseModel):
+    entry_count: int
+    groups: int
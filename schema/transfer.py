@@ -0,0 +1,18 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class RowError(BaseModel):
+    line: int
+    message: str
+
+
+class ImportReport(BaseModel):
+    processed: int = 0
+    imported: int = 0
+    error_count: int = 0
+    errors: list[RowError] = []
+    # Строка файла, с которой импорт нужно продолжить после ошибки базы данных, и текст ошибки
+    resume_line: Optional[int] = None
+    failure: Optional[str] = None
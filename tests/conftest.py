@@ -0,0 +1,194 @@
+"""
+Бенчмарки генерации, операций с базой данных и загрузки таблицы.
+
+Запуск:
+    pytest --bench-max-rows 1000000
+    pytest --bench-update-baselines  # сохранить медианы как базовые значения в tests/baselines.json
+    pytest --bench-require-baselines  # считать ошибкой бенчмарк без базового значения
+    pytest tests/test_memory.py --memory-report memory.json  # сохранить замеры памяти и места выделений
+
+Медиана каждого бенчмарка сравнивается с базовым значением, превышение больше
+чем на --bench-threshold считается регрессией и роняет запуск. Базовые значения зависят
+от машины, поэтому не хранятся в репозитории: перед сравнением их нужно записать на той же
+машине запуском с --bench-update-baselines. Бенчмарк без базового значения отмечается предупреждением,
+а при --bench-require-baselines или заданной переменной окружения CI (её задают CI-системы) роняет запуск:
+в CI базовые значения записываются первым шагом на том же агенте.
+
+Тесты памяти в tests/test_memory.py проверяют бюджеты байт на строку, заданные в самом модуле,
+и не зависят от базовых значений. Таблица измеряется в отдельном процессе.
+"""
+import os
+import sys
+import json
+import uuid
+import warnings
+from pathlib import Path
+
+import psycopg
+import pytest
+from dotenv import load_dotenv
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+DATASET_SIZES = [1_000, 100_000, 1_000_000]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("phone-table")
+    group.addoption("--bench-max-rows", type=int, default=100_000,
+                    help="Максимальный размер набора данных для бенчмарков с базой данных")
+    group.addoption("--bench-threshold", type=float, default=0.25,
+                    help="Допустимое замедление относительно базового значения (0.25 = 25%%)")
+    group.addoption("--bench-update-baselines", action="store_true",
+                    help="Записать медианы текущего запуска как базовые значения")
+    group.addoption("--bench-require-baselines", action="store_true",
+                    help="Считать ошибкой бенчмарк, для которого нет базового значения (включено, если задан CI)")
+    group.addoption("--memory-report", default=None,
+                    help="Путь для сохранения замеров памяти и основных мест выделения в JSON")
+
+
+@pytest.fixture(scope="session")
+def baselines(request):
+    current = json.loads(BASELINES_PATH.read_text(encoding="utf-8")) if BASELINES_PATH.exists() else {}
+    measured = {}
+    yield current, measured
+    if request.config.getoption("--bench-update-baselines") and measured:
+        current.update(measured)
+        BASELINES_PATH.write_text(json.dumps(current, ensure_ascii=False, indent=2, sort_keys=True) + "\n",
+                                  encoding="utf-8")
+
+
+@pytest.fixture
+def check_baseline(request, baselines):
+    """
+    Сравнивает медиану бенчмарка с сохранённой в baselines.json.
+
+    Тест падает, если медиана больше базовой более чем на --bench-threshold.
+    """
+    current, measured = baselines
+
+    def check(benchmark):
+        if benchmark.stats is None:
+            return
+        median = benchmark.stats.stats.median
+        name = request.node.nodeid.split("::", 1)[-1]
+        measured[name] = median
+        baseline = current.get(name)
+        if request.config.getoption("--bench-update-baselines"):
+            return
+        if baseline is None:
+            message = f"Нет базового значения для {name}, запустите pytest с --bench-update-baselines"
+            if request.config.getoption("--bench-require-baselines") or os.getenv("CI"):
+                pytest.fail(message)
+            warnings.warn(message)
+            return
+        limit = baseline * (1 + request.config.getoption("--bench-threshold"))
+        assert median <= limit, (f"Регрессия производительности {name}: медиана {median * 1000:.3f} мс, "
+                                 f"базовое значение {baseline * 1000:.3f} мс, допустимо до {limit * 1000:.3f} мс")
+
+    return check
+
+
+def _server_params() -> dict:
+    load_dotenv()
+    return {
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "dbname": os.getenv("DB_NAME") or "postgres",
+    }
+
+
+@pytest.fixture(scope="session")
+def database():
+    """
+    Временная база данных на локальном сервере PostgreSQL из настроек .env.
+
+    База создаётся на время сессии, на неё переключаются переменные окружения DB_NAME,
+    после сессии база удаляется. Если сервер недоступен, тесты с базой данных пропускаются.
+    """
+    params = _server_params()
+    try:
+        admin = psycopg.connect(**params, autocommit=True, connect_timeout=3)
+    except psycopg.Error as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+    name = f"phone_table_test_{uuid.uuid4().hex[:8]}"
+    admin.execute(f"CREATE DATABASE {name}")
+    previous_name = os.environ.get("DB_NAME")
+    os.environ["DB_NAME"] = name
+
+    from database.connection import Connection
+    from database.migrations import migrate
+
+    connection = Connection()
+    connection.connect()
+    migrate(connection)
+    try:
+        yield connection
+    finally:
+        connection.connection.close()
+        try:
+            import database.tables
+            database.tables.connection.connection.close()
+        except ImportError:
+            pass
+        if previous_name is None:
+            os.environ.pop("DB_NAME", None)
+        else:
+            os.environ["DB_NAME"] = previous_name
+        admin.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+        admin.close()
+
+
+def fill_dataset(connection, rows: int) -> None:
+    """Заполняет базу rows записями на стороне сервера, без генерации данных в Python"""
+    from modules.reset import reset_database
+
+    reset_database(connection)
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO names (name) SELECT 'Имя ' || i FROM generate_series(1, 1000) i")
+        cursor.execute("INSERT INTO surnames (surname) SELECT 'Фамилия ' || i FROM generate_series(1, 1000) i")
+        cursor.execute("INSERT INTO patronymics (patronymic) SELECT 'Отчество ' || i FROM generate_series(1, 200) i")
+        cursor.execute("INSERT INTO streets (street) SELECT 'Улица ' || i FROM generate_series(1, 500) i")
+        cursor.execute("""
+            INSERT INTO entries (name_id, surname_id, patronymic_id, street_id, building, apartment, phone)
+            SELECT 1 + i %% 1000, 1 + (i * 7) %% 1000, 1 + i %% 200, 1 + i %% 500,
+                   (1 + i %% 150)::text, 1 + i %% 400, '+79' || lpad(i::text, 9, '0')
+            FROM generate_series(1, %s) i
+        """, (rows,))
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def assert_counters_match(connection) -> None:
+    """Счётчики записей (ENTRY_COUNTERS) совпадают с подсчётом по таблице записей"""
+    from database.migrations import ENTRY_COUNTERS
+
+    with connection.cursor(False) as cursor:
+        for table_name, key_columns in ENTRY_COUNTERS.items():
+            key = ", ".join(key_columns)
+            cursor.execute(f"SELECT {key}, entry_count FROM {table_name} ORDER BY {key}")
+            counters = cursor.fetchall()
+            cursor.execute(f"SELECT {key}, count(*) FROM entries GROUP BY {key} ORDER BY {key}")
+            assert counters == cursor.fetchall(), table_name
+
+
+@pytest.fixture(scope="module", params=DATASET_SIZES, ids=lambda rows: f"{rows}rows")
+def dataset(request, database):
+    rows = request.param
+    if rows > request.config.getoption("--bench-max-rows"):
+        pytest.skip(f"Набор из {rows} записей больше --bench-max-rows")
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        # Чтения в приложении не завершают транзакцию, а открытая транзакция заблокировала бы TRUNCATE
+        tables.connection.connection.rollback()
+    fill_dataset(database, rows)
+    return database, rows
+
+
+@pytest.fixture(scope="session")
+def qt_app():
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    widgets = pytest.importorskip("PyQt5.QtWidgets")
+    app = widgets.QApplication.instance() or widgets.QApplication([])
+    yield app
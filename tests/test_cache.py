@@ -0,0 +1,152 @@
+"""Локальный кеш: снимок и журнал изменений должны совпадать с данными сервера"""
+from datetime import timedelta
+
+import pytest
+
+from database.base import Base
+from database.cache import LocalCache, DELTA_FILE, CLIENT_RETENTION_DAYS
+from database.connection import Connection
+from database.entry import Entry
+from tests.conftest import fill_dataset
+
+ROWS = 5_000
+
+
+@pytest.fixture
+def tables(database):
+    fill_dataset(database, ROWS)
+    return Entry(database), Base("names", ["name_id", "name"], database, "name_id")
+
+
+@pytest.fixture
+def cache(database, tmp_path):
+    cache = LocalCache(database, tmp_path / "cache")
+    yield cache
+    cache.close()
+
+
+def test_full_download(tables, cache):
+    entries, names = tables
+    assert not cache.load()
+    assert cache.sync() >= ROWS
+    assert cache.read_all(entries) == entries.get_all("entry_id")
+    assert cache.read_all(names) == names.get_all("name_id")
+
+
+def test_delta_sync(database, tables, cache, tmp_path):
+    entries, names = tables
+    cache.sync()
+    entries.update({"phone": "+70000000000"}, 5)
+    entries.delete([7])
+    entries.duplicate([1])
+    names.update({"name": "Новое имя"}, 3)
+
+    assert cache.sync() == 4
+    assert cache.read_all(entries) == entries.get_all("entry_id")
+    assert cache.read_all(names) == names.get_all("name_id")
+    assert (tmp_path / "cache" / DELTA_FILE).exists()
+
+    restarted = LocalCache(database, tmp_path / "cache")
+    try:
+        assert restarted.load()
+        assert list(restarted.rows("entries")) == list(cache.rows("entries"))
+        assert restarted.sync() == 0
+    finally:
+        restarted.close()
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_read_page_matches_get_page(tables, cache, descending):
+    entries, _ = tables
+    cache.sync()
+    entries.delete([ROWS // 2 + 1])
+    cache.sync()
+    after = None
+    while True:
+        page, next_after = cache.read_page(entries, 700, after, descending)
+        assert (page, next_after) == entries.get_page("entry_id", descending, 700, after)
+        if next_after is None:
+            break
+        after = next_after
+
+
+def test_compaction(database, tables, cache, tmp_path):
+    entries, _ = tables
+    cache.sync()
+    with database.cursor() as cursor:
+        cursor.execute("UPDATE entries SET apartment = apartment + 1 WHERE entry_id <= %s", (ROWS // 5,))
+
+    assert cache.sync() == ROWS // 5
+    assert not (tmp_path / "cache" / DELTA_FILE).exists()
+    assert cache.read_all(entries) == entries.get_all("entry_id")
+
+
+def test_compaction_prunes_deleted_rows(database, tables, cache, tmp_path):
+    entries, _ = tables
+    with database.cursor() as cursor:
+        cursor.execute("DELETE FROM cache_clients")
+    stale = LocalCache(database, tmp_path / "stale")
+    try:
+        stale.sync()
+        cache.sync()
+        entries.delete([1, 2])
+        with database.cursor() as cursor:
+            # Кеш, не синхронизировавшийся дольше срока хранения, не удерживает журнал удалений
+            cursor.execute("UPDATE cache_clients SET synced_at = synced_at - %s WHERE client_id = %s",
+                           (timedelta(days=CLIENT_RETENTION_DAYS + 1), stale.client_id))
+            cursor.execute("UPDATE entries SET apartment = apartment + 1 WHERE entry_id <= %s", (ROWS // 5,))
+        cache.sync()
+        with database.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM deleted_rows WHERE table_name = 'entries' AND row_id = ANY(%s)",
+                           ([1, 2],))
+            assert cursor.fetchone()[0] == 0
+
+        assert stale.sync() >= ROWS
+        assert stale.read_all(entries) == entries.get_all("entry_id")
+    finally:
+        stale.close()
+
+
+def test_read_all_syncs_only_on_refresh(tables, cache):
+    _, names = tables
+    assert cache.refresh() == 0 and not cache.synced
+    cache.sync()
+    names.update({"name": "Новое имя"}, 3)
+    assert cache.read_all(names) != names.get_all("name_id")
+
+    assert cache.refresh() == 1
+    assert cache.read_all(names) == names.get_all("name_id")
+
+
+def test_start_sync_uses_own_connection(database, tables, cache):
+    entries, _ = tables
+    results = []
+    cache.start_sync(results.append).join()
+    assert results and results[0] >= ROWS
+    assert cache.synced
+    assert cache.read_all(entries) == entries.get_all("entry_id")
+
+
+def test_truncate_reloads_snapshot(database, tables, cache):
+    entries, _ = tables
+    cache.sync()
+    fill_dataset(database, 100)
+
+    cache.sync()
+    assert cache.read_all(entries) == entries.get_all("entry_id")
+
+
+def test_transaction_committed_after_sync(tables, cache):
+    _, names = tables
+    cache.sync()
+    other = Connection()
+    other.connect()
+    try:
+        other.connection.execute("INSERT INTO names (name) VALUES ('Позднее имя')")
+        assert cache.sync() == 0
+        other.connection.commit()
+    finally:
+        other.connection.close()
+
+    assert cache.sync() == 1
+    assert cache.read_all(names) == names.get_all("name_id")
@@ -0,0 +1,136 @@
+"""Поток изменений других клиентов: уведомления триггеров, объединение событий и применение к таблице"""
+import time
+
+import pytest
+
+from database.changes import ChangeBuffer, ChangeListener, TableChanges, CHANGE_BUFFER_MAX_IDS
+from database.connection import Connection
+from database.migrations import CHANGE_EVENT_MAX_IDS
+from tests.conftest import fill_dataset
+
+ROWS = 2_000
+
+
+def test_buffer_coalesces_events():
+    buffer = ChangeBuffer()
+    buffer.add("entries", "U", [1, 2])
+    buffer.add("entries", "D", [2, 3])
+    buffer.add("names", "I", [7])
+
+    changes = buffer.drain()
+    assert changes["entries"].ids == {1, 2, 3} and not changes["entries"].reload
+    assert changes["names"].ids == {7}
+    assert buffer.drain() == {}
+
+
+def test_buffer_overflow_reloads_table():
+    buffer = ChangeBuffer()
+    buffer.add("entries", "I", range(CHANGE_BUFFER_MAX_IDS))
+    buffer.add("entries", "I", [CHANGE_BUFFER_MAX_IDS + 1])
+    buffer.add("names", "I", None)
+    buffer.add("streets", "T", None)
+
+    changes = buffer.drain()
+    assert all(changes[table_name].reload and not changes[table_name].ids
+               for table_name in ["entries", "names", "streets"])
+
+
+def _wait_for_changes(listener: ChangeListener, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    changes = {}
+    while time.monotonic() < deadline:
+        for table_name, table_changes in listener.buffer.drain().items():
+            changes.setdefault(table_name, TableChanges()).add(None if table_changes.reload else table_changes.ids)
+        if changes:
+            # Уведомления одной транзакции приходят вместе, небольшая пауза собирает их все
+            time.sleep(0.2)
+            for table_name, table_changes in listener.buffer.drain().items():
+                changes.setdefault(table_name, TableChanges()).add(None if table_changes.reload else table_changes.ids)
+            return changes
+        time.sleep(0.05)
+    return changes
+
+
+@pytest.fixture
+def listener(database):
+    fill_dataset(database, ROWS)
+    listener = ChangeListener(database)
+    listener.start()
+    assert listener.listening.wait(5)
+    yield listener
+    listener.stop()
+
+
+@pytest.fixture
+def other_client(database):
+    other = Connection()
+    other.connect()
+    yield other
+    other.connection.close()
+
+
+def test_listener_receives_other_client_changes(listener, other_client):
+    with other_client.cursor() as cursor:
+        cursor.execute("UPDATE entries SET apartment = 1 WHERE entry_id IN (3, 5)")
+        cursor.execute("DELETE FROM entries WHERE entry_id = 8")
+        cursor.execute("INSERT INTO names (name) VALUES ('Новое имя') RETURNING name_id")
+        name_id = cursor.fetchone()[0]
+
+    changes = _wait_for_changes(listener)
+    assert changes["entries"].ids == {3, 5, 8}
+    assert changes["names"].ids == {name_id}
+
+
+def test_listener_skips_own_changes(database, listener, other_client):
+    with database.cursor() as cursor:
+        cursor.execute("UPDATE entries SET apartment = 1 WHERE entry_id = 1")
+    with other_client.cursor() as cursor:
+        cursor.execute("UPDATE entries SET apartment = 1 WHERE entry_id = 2")
+
+    assert _wait_for_changes(listener)["entries"].ids == {2}
+
+
+def test_bulk_and_truncate_request_reload(listener, other_client):
+    with other_client.cursor() as cursor:
+        cursor.execute("UPDATE entries SET apartment = 2 WHERE entry_id <= %s", (CHANGE_EVENT_MAX_IDS + 1,))
+    assert _wait_for_changes(listener)["entries"].reload
+
+    with other_client.cursor() as cursor:
+        cursor.execute("TRUNCATE entries")
+    assert _wait_for_changes(listener)["entries"].reload
+
+
+def test_widget_applies_row_patches(qt_app, database, other_client):
+    from ui.table import EntriesTableWidget
+
+    fill_dataset(database, ROWS)
+    widget = EntriesTableWidget()
+    try:
+        with other_client.cursor() as cursor:
+            cursor.execute("UPDATE entries SET phone = '+70000000000' WHERE entry_id = 3")
+            cursor.execute("DELETE FROM entries WHERE entry_id = 6")
+            cursor.execute("INSERT INTO entries (name_id, surname_id, patronymic_id, street_id, building, apartment, "
+                           "phone) VALUES (1, 1, 1, 1, '1', 1, '+72222222222') RETURNING entry_id")
+            inserted_id = cursor.fetchone()[0]
+            cursor.execute("UPDATE names SET name = 'Переименованное имя' WHERE name_id = 2")
+        names = TableChanges()
+        names.add([2])
+        entries = TableChanges()
+        entries.add([3, 6, inserted_id])
+
+        widget.apply_lookup_changes("names", names)
+        widget.apply_changes(entries)
+
+        ids = [widget.item(row, 0).data(0) for row in range(widget.rowCount())]
+        assert ids[:6] == [1, 2, 3, 4, 5, 7]
+        # Новая запись за пределами загруженной страницы появится при подгрузке
+        assert inserted_id not in ids
+        phone_column = widget.columns.index("phone")
+        assert widget.item(2, phone_column).text() == "+7 (000) 000-00-00"
+        name_column = widget.columns.index("name_id")
+        assert widget.cellWidget(0, name_column).currentText() == "Переименованное имя"
+        assert widget.item(0, name_column).text() == "Переименованное имя"
+    finally:
+        widget.deleteLater()
+        # Чтения приложения не завершают транзакцию, она заблокировала бы TRUNCATE в следующих тестах
+        widget.table.connection.connection.rollback()
@@ -0,0 +1,102 @@
+import itertools
+
+import pytest
+
+from database.base import Base
+from database.entry import Entry
+
+pytest.importorskip("pytest_benchmark")
+
+PAGE_SIZE = 500
+BATCH_SIZE = 100
+
+labels = itertools.count()
+
+
+@pytest.fixture
+def cleanup(dataset):
+    """Удаляет записи и значения, созданные тестом, чтобы не влиять на остальные тесты модуля"""
+    connection, _ = dataset
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT (SELECT coalesce(max(entry_id), 0) FROM entries), "
+                       "(SELECT coalesce(max(name_id), 0) FROM names)")
+        last_entry_id, last_name_id = cursor.fetchone()
+    yield
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM entries WHERE entry_id > %s", (last_entry_id,))
+        cursor.execute("DELETE FROM names WHERE name_id > %s", (last_name_id,))
+
+
+def test_base_create(benchmark, check_baseline, dataset, cleanup):
+    connection, _ = dataset
+    names = Base("names", ["name_id", "name"], connection, "name_id")
+
+    def create():
+        return names.create([{"name": f"Новое имя {next(labels)}"} for _ in range(BATCH_SIZE)])
+
+    assert len(benchmark(create)) == BATCH_SIZE
+    check_baseline(benchmark)
+
+
+def test_base_update(benchmark, check_baseline, dataset):
+    connection, rows = dataset
+    entries = Entry(connection)
+    target_ids = itertools.cycle(range(1, rows + 1, max(rows // 1000, 1)))
+
+    benchmark(lambda: entries.update({"apartment": 7}, next(target_ids)))
+    check_baseline(benchmark)
+
+
+def test_base_update_many(benchmark, check_baseline, dataset):
+    connection, rows = dataset
+    entries = Entry(connection)
+    target_ids = list(range(1, rows + 1, 2))
+
+    assert benchmark(entries.update_many, {"apartment": 9, "phone": "8 912 000-00-00"}, target_ids) == len(target_ids)
+    updated = {entry["entry_id"]: entry for entry in entries.get_by_ids(target_ids[:3] + [2])}
+    assert [(updated[entry_id]["apartment"], updated[entry_id]["phone"]) for entry_id in target_ids[:3]] == \
+           [(9, "+79120000000")] * 3
+    assert updated[2]["apartment"] != 9
+    check_baseline(benchmark)
+
+
+def test_base_delete(benchmark, check_baseline, dataset, cleanup):
+    connection, _ = dataset
+    entries = Entry(connection)
+
+    def setup():
+        return (entries.duplicate(list(range(1, BATCH_SIZE + 1))),), {}
+
+    def delete(created):
+        entries.delete([row["entry_id"] for row in created])
+
+    benchmark.pedantic(delete, setup=setup, rounds=10)
+    check_baseline(benchmark)
+
+
+def test_entry_get_page(benchmark, check_baseline, dataset):
+    connection, rows = dataset
+    entries = Entry(connection)
+    _, middle = entries.get_page("surname_id", False, rows // 2)
+
+    page, _ = benchmark(entries.get_page, "surname_id", False, PAGE_SIZE, middle)
+    assert len(page) == min(PAGE_SIZE, rows - rows // 2)
+    check_baseline(benchmark)
+
+
+def test_entry_get_all(benchmark, check_baseline, dataset):
+    connection, rows = dataset
+    entries = Entry(connection)
+
+    result = benchmark.pedantic(entries.get_all, rounds=3, iterations=1)
+    assert len(result) == rows
+    check_baseline(benchmark)
+
+
+def test_entry_duplicate(benchmark, check_baseline, dataset, cleanup):
+    connection, _ = dataset
+    entries = Entry(connection)
+
+    result = benchmark(entries.duplicate, list(range(1, BATCH_SIZE + 1)))
+    assert len(result) == BATCH_SIZE
+    check_baseline(benchmark)
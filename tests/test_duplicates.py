@@ -0,0 +1,142 @@
+"""Поиск повторяющихся и похожих записей и удаление повторов"""
+import sys
+
+import pytest
+
+from database.entry import Entry
+from database.sqlite import SQLiteConnection, SQLiteEntry
+from modules.duplicates import find_duplicates, find_exact_duplicates, find_near_duplicates, get_entry_labels, \
+    remove_duplicates
+from schema.duplicates import DuplicateGroup
+from tests.conftest import fill_dataset
+
+ROWS = 3000
+
+
+def _copy(entries, entry_id, **changes) -> int:
+    entry = entries.get_by_ids([entry_id])[0]
+    data = {column: entry[column] for column in entries.columns if column != "entry_id"}
+    return entries.create([{**data, **changes}])[0]["entry_id"]
+
+
+@pytest.fixture(scope="module")
+def entries(database):
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        tables.connection.connection.rollback()
+    fill_dataset(database, ROWS)
+    return Entry(database)
+
+
+def test_generated_dataset_has_no_duplicates(entries):
+    assert find_duplicates(entries.connection) == []
+
+
+def test_find_duplicates(entries):
+    connection = entries.connection
+    exact = entries.duplicate([1])[0]["entry_id"]
+    other_phone = _copy(entries, 3, phone="+79990000003")
+    other_apartment = _copy(entries, 4, apartment=999)
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO names (name) VALUES ('ИМЯ-6') RETURNING name_id")
+        name_variant = _copy(entries, 5, name_id=cursor.fetchone()[0], apartment=999)
+    try:
+        groups = {tuple(group.entry_ids): group for group in find_duplicates(connection)}
+        assert set(groups) == {(1, exact), (3, other_phone), (4, other_apartment), (5, name_variant)}
+        assert groups[(1, exact)].kind == "person"
+        assert groups[(4, other_apartment)].kind == "person"
+        assert (groups[(3, other_phone)].kind, groups[(3, other_phone)].description) == \
+               ("near", "Отличается поле «Телефон»")
+        assert groups[(5, name_variant)].description == "Отличается поле «Квартира»"
+
+        assert [group.entry_ids for group in find_exact_duplicates(connection, "address")] == [[1, exact]]
+        assert find_duplicates(connection, near=False) == [groups[(1, exact)], groups[(4, other_apartment)]]
+        assert get_entry_labels(connection, [name_variant])[name_variant][1] == "ИМЯ-6"
+    finally:
+        entries.delete([exact, other_phone, other_apartment, name_variant])
+
+
+def test_hash_collisions_do_not_group_different_entries(entries, monkeypatch):
+    other_phone = _copy(entries, 3, phone="+79990000003")
+    try:
+        expected = find_near_duplicates(entries.connection)
+        assert [group.entry_ids for group in expected] == [[3, other_phone]]
+        # Все записи попадают в одни блоки-кандидаты, группы составляются по значениям
+        monkeypatch.setattr("modules.duplicates.hash", lambda values: 0, raising=False)
+        assert find_near_duplicates(entries.connection) == expected
+    finally:
+        entries.delete([other_phone])
+
+
+def test_find_duplicates_can_be_cancelled(entries, monkeypatch):
+    monkeypatch.setattr("modules.duplicates.PROGRESS_INTERVAL", 1000)
+    seen = []
+    assert find_duplicates(entries.connection, kinds=[], progress=lambda rows: seen.append(rows) or False) == []
+    assert seen == [1000]
+
+
+def test_remove_duplicates(entries):
+    copies = [entries.duplicate([entry_id])[0]["entry_id"] for entry_id in [10, 10, 20]]
+    groups = [DuplicateGroup(kind="person", description="", entry_ids=[10] + copies[:2]),
+              DuplicateGroup(kind="near", description="", entry_ids=[20, copies[2]])]
+
+    assert remove_duplicates(entries.connection, groups, keep_ids={copies[1]}) == 3
+    remaining = {entry["entry_id"] for entry in entries.get_by_ids([10, 20] + copies)}
+    assert remaining == {copies[1], 20}
+    entries.delete([copies[1]])
+    assert find_duplicates(entries.connection) == []
+
+
+def test_widget_search_and_remove(qt_app, entries, monkeypatch):
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QMessageBox
+    from ui.duplicates import DuplicatesWidget
+
+    copy = entries.duplicate([30])[0]["entry_id"]
+    widget = DuplicatesWidget()
+    try:
+        widget.search()
+        assert widget.table.rowCount() == 2
+        assert widget.checked_ids() == {30}
+        widget.table.item(0, 0).setCheckState(Qt.Unchecked)
+        widget.table.item(1, 0).setCheckState(Qt.Checked)
+
+        removed = []
+        widget.entries_removed.connect(removed.append)
+        monkeypatch.setattr(QMessageBox, "exec", lambda self: QMessageBox.Yes)
+        widget.remove()
+        assert removed == [1]
+        assert widget.table.rowCount() == 0
+        assert [entry["entry_id"] for entry in entries.get_by_ids([30, copy])] == [copy]
+    finally:
+        # Чтения в приложении не завершают транзакцию, а открытая транзакция заблокировала бы TRUNCATE
+        import database.tables
+        database.tables.connection.connection.rollback()
+
+
+def test_sqlite_find_duplicates(tmp_path):
+    from database.migrations import migrate
+    from database.sqlite import SQLiteBase
+
+    connection = SQLiteConnection(str(tmp_path / "phone_table.sqlite3"))
+    connection.connect()
+    try:
+        migrate(connection)
+        ids = {table_name: SQLiteBase(table_name, [id_column, value], connection, id_column)
+               .get_or_create_ids(value, ["Значение", "значение"])
+               for table_name, id_column, value in [("names", "name_id", "name"), ("surnames", "surname_id", "surname"),
+                                                    ("patronymics", "patronymic_id", "patronymic"),
+                                                    ("streets", "street_id", "street")]}
+        entries = SQLiteEntry(connection)
+        first = [ids[table_name]["Значение"] for table_name in ["names", "surnames", "patronymics", "streets"]]
+        entries.bulk_insert([(*first, "1", 1, "+79120000001"), (*first, "1", 1, "+79120000001"),
+                             (*first, "1", 1, "+79120000002"),
+                             (ids["names"]["значение"], *first[1:], "1", 1, "+79120000002")])
+
+        groups = find_duplicates(connection)
+        assert [(group.kind, group.entry_ids) for group in groups] == [("person", [1, 2]), ("address", [3, 4]),
+                                                                       ("near", [1, 2, 3, 4])]
+        assert remove_duplicates(connection, groups[:2]) == 2
+        assert [entry["entry_id"] for entry in entries.get_all(order_by="entry_id")] == [1, 3]
+    finally:
+        connection.connection.close()
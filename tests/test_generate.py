@@ -0,0 +1,20 @@
+import pytest
+
+from modules.generate import generate_entries, generate_entry
+
+pytest.importorskip("pytest_benchmark")
+
+
+def test_generate_entry(benchmark, check_baseline):
+    entry = benchmark(generate_entry)
+    assert set(entry) == {"name", "surname", "patronymic", "street", "building", "apartment", "phone"}
+    check_baseline(benchmark)
+
+
+@pytest.mark.parametrize("count", [1_000, 10_000])
+def test_generate_entries(benchmark, check_baseline, count):
+    entries = benchmark.pedantic(generate_entries, args=(count,), rounds=3, iterations=1)
+    assert len(entries) == count
+    if benchmark.stats is not None:
+        benchmark.extra_info["entries_per_second"] = count / benchmark.stats.stats.median
+    check_baseline(benchmark)
@@ -0,0 +1,229 @@
+"""
+Контроль потребления памяти на больших справочниках.
+
+Для каждого слоя (генерация, выборка из базы, загрузка в таблицу) измеряются прирост RSS процесса,
+пик tracemalloc и места наибольших выделений памяти, после чего проверяется бюджет байт на строку.
+Для слоёв на Python бюджет задаётся по пику tracemalloc. Элементы и виджеты Qt выделяются вне
+интерпретатора, поэтому таблица измеряется в отдельном процессе с PYTHONMALLOC=malloc: после прогревочной
+загрузки подгружается несколько страниц, и бюджет проверяется по наклону занятой памяти кучи на строку.
+Отчёт сохраняется в файл, указанный в --memory-report.
+"""
+import os
+import gc
+import sys
+import json
+import ctypes
+import subprocess
+import tracemalloc
+from typing import Callable, Any, List, Tuple, Optional
+
+import pytest
+
+from modules.generate import generate_entries
+
+# Измеренное значение плюс около 10%: около 2,2 КБ на сгенерированную запись, 0,7 КБ на прочитанную
+# и 100 КБ на строку таблицы, большая часть которых приходится на виджеты выпадающих списков в ячейках
+BYTES_PER_ROW_BUDGETS = {
+    "generate_entries": 2_400,
+    "entry_get_all": 800,
+    "load_data": 112_000,
+}
+TOP_ALLOCATION_SITES = 10
+TABLE_PAGE_SIZE = 100
+TABLE_PAGES = 8
+
+measurements = []
+
+
+def _rss() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class _MallInfo2(ctypes.Structure):
+    _fields_ = [(name, ctypes.c_size_t) for name in
+                ("arena", "ordblks", "smblks", "hblks", "hblkhd", "usmblks", "fsmblks", "uordblks", "fordblks",
+                 "keepcost")]
+
+
+def _heap_in_use() -> Optional[int]:
+    """Занятая память кучи glibc, включая блоки из mmap, или None, если mallinfo2 недоступна"""
+    try:
+        mallinfo2 = ctypes.CDLL(None).mallinfo2
+    except (OSError, AttributeError):
+        return None
+    mallinfo2.restype = _MallInfo2
+    info = mallinfo2()
+    return info.uordblks + info.hblkhd
+
+
+def _trace(function: Callable[[], Any]) -> Tuple[int, List[dict]]:
+    """
+    Выполняет function под tracemalloc.
+
+    Результат function удерживается до снятия снимка, чтобы учитывались и временные,
+    и оставшиеся после вызова выделения.
+
+    :return: Пик выделенной памяти и места наибольших выделений.
+    """
+    gc.collect()
+    tracemalloc.start(5)
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    sites = [
+        {"site": str(statistic.traceback[0]), "size": statistic.size, "count": statistic.count}
+        for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATION_SITES]
+    ]
+    return peak, sites
+
+
+def measure(layer: str, rows: int, function: Callable[[], Any]) -> dict:
+    """
+    Выполняет function трижды и возвращает замер памяти слоя на Python.
+
+    Первый запуск прогревает импорты и кеши, второй измеряет прирост RSS, третий - пик и места
+    выделений tracemalloc: собственные структуры tracemalloc увеличивают RSS и исказили бы второй замер.
+    """
+    function()
+    gc.collect()
+    rss_before = _rss()
+    result = function()
+    rss_delta = max(_rss() - rss_before, 0)
+    del result
+
+    peak, sites = _trace(function)
+    measurement = {
+        "layer": layer,
+        "rows": rows,
+        "metric": "tracemalloc_peak",
+        "bytes_per_row": peak / rows,
+        "rss_delta": rss_delta,
+        "tracemalloc_peak": peak,
+        "top_sites": sites,
+    }
+    measurements.append(measurement)
+    return measurement
+
+
+def memory_slope(points: List[Tuple[int, int]]) -> float:
+    """Прирост памяти на строку по методу наименьших квадратов для точек (строк загружено, байт)"""
+    count = len(points)
+    mean_rows = sum(rows for rows, _ in points) / count
+    mean_rss = sum(rss for _, rss in points) / count
+    covariance = sum((rows - mean_rows) * (rss - mean_rss) for rows, rss in points)
+    variance = sum((rows - mean_rows) ** 2 for rows, _ in points)
+    return covariance / variance
+
+
+def check_budget(measurement: dict) -> None:
+    budget = BYTES_PER_ROW_BUDGETS[measurement["layer"]]
+    bytes_per_row = measurement["bytes_per_row"]
+    sites = "\n".join(f"  {site['size'] / 1024:.0f} КиБ ({site['count']}): {site['site']}"
+                      for site in measurement["top_sites"][:5])
+    assert bytes_per_row <= budget, (
+        f"{measurement['layer']} на {measurement['rows']} строках: {bytes_per_row:.0f} байт/строку "
+        f"({measurement['metric']}) при бюджете {budget}\nОсновные места выделения памяти:\n{sites}"
+    )
+
+
+@pytest.fixture(scope="module", autouse=True)
+def memory_report(request):
+    yield
+    path = request.config.getoption("--memory-report")
+    if path and measurements:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(measurements, file, ensure_ascii=False, indent=2)
+
+
+@pytest.mark.parametrize("rows", [1_000, 10_000, 100_000])
+def test_generate_entries_memory(request, rows):
+    if rows > request.config.getoption("--bench-max-rows"):
+        pytest.skip(f"Набор из {rows} записей больше --bench-max-rows")
+    check_budget(measure("generate_entries", rows, lambda: generate_entries(rows)))
+
+
+def test_entry_get_all_memory(dataset):
+    from database.entry import Entry
+
+    connection, rows = dataset
+    entries = Entry(connection)
+    check_budget(measure("entry_get_all", rows, entries.get_all))
+
+
+def table_pages_memory(page_size: int, pages: int) -> dict:
+    """
+    Загружает в таблицу записей pages страниц по page_size строк и снимает память после каждой страницы.
+
+    Стили, шрифты и модели выпадающих списков создаются при прогревочной загрузке и в прирост не входят.
+    Вызывается в отдельном процессе: освобождённая другими тестами память процесса скрыла бы прирост RSS.
+    """
+    from PyQt5.QtWidgets import QApplication
+    from ui.table import EntriesTableWidget
+
+    app = QApplication.instance() or QApplication([])
+    widget = EntriesTableWidget()
+    widget.page_size = page_size
+    widget.load_data()
+    widget.reload_rows()
+    app.processEvents()
+
+    heap, rss = [], []
+    for page in range(pages + 1):
+        if page:
+            widget.fetch_more()
+        app.processEvents()
+        gc.collect()
+        heap.append((widget.rowCount(), _heap_in_use()))
+        rss.append((widget.rowCount(), _rss()))
+
+    widget.reload_rows()
+    peak, sites = _trace(lambda: (widget.fetch_more(), app.processEvents()))
+    return {
+        "heap_points": heap if heap[0][1] is not None else None,
+        "rss_points": rss,
+        "tracemalloc_peak": peak,
+        "top_sites": sites,
+    }
+
+
+def test_load_data_memory(dataset):
+    pytest.importorskip("PyQt5.QtWidgets")
+    _, rows = dataset
+    if rows < TABLE_PAGE_SIZE * (TABLE_PAGES + 1):
+        pytest.skip(f"Для {TABLE_PAGES} страниц после прогрева нужно больше {rows} записей")
+
+    environment = dict(os.environ, PYTHONMALLOC="malloc", QT_QPA_PLATFORM="offscreen")
+    completed = subprocess.run(
+        [sys.executable, "-m", "tests.test_memory", str(TABLE_PAGE_SIZE), str(TABLE_PAGES)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=environment, capture_output=True, text=True, timeout=600,
+    )
+    assert completed.returncode == 0, completed.stderr[-2000:]
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    loaded = result["rss_points"][-1][0] - result["rss_points"][0][0]
+    assert loaded == TABLE_PAGE_SIZE * TABLE_PAGES
+
+    heap_points = result["heap_points"]
+    measurement = {
+        "layer": "load_data",
+        "rows": loaded,
+        "metric": "heap_slope" if heap_points else "rss_slope",
+        "bytes_per_row": memory_slope(heap_points or result["rss_points"]),
+        "rss_slope": memory_slope(result["rss_points"]),
+        **result,
+    }
+    measurements.append(measurement)
+    check_budget(measurement)
+
+
+if __name__ == "__main__":
+    print(json.dumps(table_pages_memory(int(sys.argv[1]), int(sys.argv[2]))))
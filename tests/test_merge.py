@@ -0,0 +1,123 @@
+"""Объединение похожих значений родительских таблиц"""
+import sys
+
+import pytest
+
+from database.sqlite import SQLiteConnection, SQLiteBase, SQLiteEntry
+from modules.merge import find_similar_values, merge_values
+from tests.conftest import fill_dataset
+
+ROWS = 2000
+
+
+def _add_variants(connection, entry_ids):
+    """Значения «ИМЯ-5» и «имя 5» для записей entry_ids, на «Имя 5» ссылаются две записи из набора"""
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO names (name) VALUES ('ИМЯ-5'), ('имя  5') RETURNING name_id")
+        variant_ids = [row[0] for row in cursor.fetchall()]
+        for entry_id, name_id in zip(entry_ids, variant_ids):
+            cursor.execute("UPDATE entries SET name_id = %s WHERE entry_id = %s", (name_id, entry_id))
+    return variant_ids
+
+
+@pytest.fixture
+def database_with_variants(database):
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        tables.connection.connection.rollback()
+    fill_dataset(database, ROWS)
+    return database, _add_variants(database, [1, 2])
+
+
+def test_find_similar_values(database_with_variants):
+    connection, variant_ids = database_with_variants
+    assert find_similar_values(connection, "names") == {5: variant_ids}
+    assert find_similar_values(connection, "streets") == {}
+
+
+def test_merge_values(database_with_variants):
+    connection, variant_ids = database_with_variants
+    done = []
+    assert merge_values(connection, "names", {5: variant_ids}, done.append) == (2, 2)
+    assert done == [2]
+    with connection.cursor(False) as cursor:
+        cursor.execute("SELECT name_id FROM entries WHERE entry_id IN (1, 2)")
+        assert [row[0] for row in cursor.fetchall()] == [5, 5]
+        cursor.execute("SELECT count(*) FROM names WHERE name_id = ANY(%s)", (variant_ids,))
+        assert cursor.fetchone()[0] == 0
+        cursor.execute("SELECT count(*) FROM entries WHERE name_id = 5")
+        assert cursor.fetchone()[0] == ROWS // 1000 + 2
+    assert find_similar_values(connection, "names") == {}
+
+
+def test_merge_values_in_chunks_keeps_permanent_merge_map(database_with_variants, monkeypatch):
+    connection, variant_ids = database_with_variants
+    monkeypatch.setattr("modules.merge.MERGE_CHUNK_SIZE", 1)
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE TABLE public.merge_map (note text)")
+    try:
+        done = []
+        assert merge_values(connection, "names", {5: variant_ids}, done.append) == (2, 2)
+        assert done == [1, 2]
+        with connection.cursor(False) as cursor:
+            cursor.execute("SELECT to_regclass('public.merge_map') IS NOT NULL, to_regclass('pg_temp.merge_map')")
+            assert cursor.fetchone() == (True, None)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TABLE public.merge_map")
+
+
+def test_merge_is_atomic(database_with_variants):
+    connection, variant_ids = database_with_variants
+    with pytest.raises(Exception):
+        merge_values(connection, "names", {5: variant_ids, 6: [variant_ids[0]]})
+    with connection.cursor(False) as cursor:
+        cursor.execute("SELECT count(*) FROM entries WHERE name_id = ANY(%s)", (variant_ids,))
+        assert cursor.fetchone()[0] == 2
+
+
+def test_widget_merges_similar_values(qt_app, database_with_variants, monkeypatch):
+    from PyQt5.QtWidgets import QMessageBox
+    from ui.table import ParentTableWidget
+
+    connection, variant_ids = database_with_variants
+    widget = ParentTableWidget("names")
+    try:
+        assert widget.merge_action in widget.context_actions
+        changed = []
+        widget.data_changed.connect(lambda *args: changed.append(args))
+        monkeypatch.setattr(QMessageBox, "exec", lambda self: QMessageBox.Yes)
+        widget.merge_similar_values()
+        assert changed == [("names", "merge", "", "")]
+        assert not set(variant_ids) & set(widget._loaded_ids())
+        assert find_similar_values(connection, "names") == {}
+    finally:
+        # Чтения в приложении не завершают транзакцию, а открытая транзакция заблокировала бы TRUNCATE
+        widget.table.connection.connection.rollback()
+
+
+def test_sqlite_merge_values(tmp_path):
+    from database.migrations import migrate
+
+    connection = SQLiteConnection(str(tmp_path / "phone_table.sqlite3"))
+    connection.connect()
+    try:
+        migrate(connection)
+        ids = {table_name: SQLiteBase(table_name, [id_column, value], connection, id_column)
+               .get_or_create_ids(value, ["Значение"])["Значение"]
+               for table_name, id_column, value in [("surnames", "surname_id", "surname"),
+                                                    ("patronymics", "patronymic_id", "patronymic"),
+                                                    ("streets", "street_id", "street")]}
+        names = SQLiteBase("names", ["name_id", "name"], connection, "name_id")
+        name_ids = names.get_or_create_ids("name", ["Алёна", "алена", "АЛЕНА"])
+        SQLiteEntry(connection).bulk_insert(
+            (name_ids[name], ids["surnames"], ids["patronymics"], ids["streets"], "1", 1, f"+7912000000{i}")
+            for i, name in enumerate(["Алёна", "алена", "алена"])
+        )
+
+        merges = find_similar_values(connection, "names")
+        assert merges == {name_ids["алена"]: [name_ids["Алёна"], name_ids["АЛЕНА"]]}
+        assert merge_values(connection, "names", merges) == (1, 2)
+        assert [row["name"] for row in names.get_all()] == ["алена"]
+    finally:
+        connection.connection.close()
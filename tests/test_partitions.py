@@ -0,0 +1,158 @@
+"""Секционирование таблицы записей и параллельная загрузка в секции"""
+import json
+import sys
+
+import psycopg
+import pytest
+
+from database.entry import Entry
+from database.migrations import CHANGES_CHANNEL
+from database.partitions import PartitionLoader, get_partition_count, partition_entries
+from tests.conftest import assert_counters_match, fill_dataset
+
+ROWS = 5000
+TABLE_STATE_QUERY = """
+    SELECT count(*), sum(hashtext(e::text)::bigint), max(entry_id) FROM entries e
+"""
+
+
+def _table_state(connection):
+    with connection.cursor(False) as cursor:
+        cursor.execute(TABLE_STATE_QUERY)
+        return cursor.fetchone()
+
+
+@pytest.fixture(scope="module")
+def partitioned(database):
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        tables.connection.connection.rollback()
+    fill_dataset(database, ROWS)
+    state = _table_state(database)
+    assert partition_entries(database, 4) == 4
+    yield database, state
+    partition_entries(database, 1)
+
+
+def test_partitioning_keeps_rows_and_schema(partitioned):
+    connection, state = partitioned
+    assert get_partition_count(connection) == 4
+    assert _table_state(connection) == state
+    with connection.cursor(False) as cursor:
+        cursor.execute("SELECT count(DISTINCT tableoid) FROM entries")
+        assert cursor.fetchone()[0] == 4
+        cursor.execute("SELECT conname FROM pg_constraint WHERE conrelid = 'entries'::regclass ORDER BY conname")
+        constraints = [name for name, in cursor.fetchall()]
+        cursor.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = 'entries'::regclass AND NOT tgisinternal")
+        triggers = {name for name, in cursor.fetchall()}
+    assert {"entries_pkey", "entries_phone_e164", "entries_street_id_fkey"} <= set(constraints)
+    assert {"entries_row_version", "entries_deleted", "entries_notify_insert", "entries_counters_insert"} <= triggers
+
+
+def test_foreign_keys_and_checks_across_partitions(partitioned):
+    connection, _ = partitioned
+    entries = Entry(connection)
+    with pytest.raises(ValueError):
+        entries.create([{**entries.get_default_entry_data(), "street_id": 10 ** 6}])
+    with connection.cursor() as cursor, pytest.raises(ValueError):
+        with entries.exception_handler():
+            cursor.execute("UPDATE entries SET phone = '123' WHERE entry_id = 1")
+    with connection.cursor() as cursor, pytest.raises(ValueError):
+        with entries.exception_handler():
+            cursor.execute("DELETE FROM streets WHERE street_id = 1")
+
+
+def test_entry_queries_across_partitions(partitioned):
+    connection, _ = partitioned
+    entries = Entry(connection)
+    page, after = entries.get_page(limit=100)
+    assert [row["entry_id"] for row in page] == list(range(1, 101))
+    next_page, _ = entries.get_page(limit=100, after=after)
+    assert next_page[0]["entry_id"] == 101
+    assert len(entries.get_all()) == ROWS
+
+    copies = entries.duplicate([1, 2, 3])
+    try:
+        assert [row["phone"] for row in copies] == [row["phone"] for row in entries.get_by_ids([1, 2, 3])]
+        assert_counters_match(connection)
+    finally:
+        entries.delete([row["entry_id"] for row in copies])
+    with connection.cursor(False) as cursor:
+        cursor.execute("SELECT DISTINCT table_name FROM deleted_rows WHERE row_id = ANY(%s)",
+                       ([row["entry_id"] for row in copies],))
+        assert cursor.fetchall() == [("entries",)]
+
+        query, params = entries._select_query("entry_id", False, 500, 0)
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        plan = json.dumps(cursor.fetchone()[0])
+    assert '"Node Type": "Sort"' not in plan
+
+
+def test_partition_loader(partitioned):
+    connection, _ = partitioned
+    loader = PartitionLoader(connection, workers=3)
+    try:
+        rows = [(1, 2, 3, 4, "5", 6, f"8 999 {i:07d}") for i in range(2000)]
+        assert loader.load(rows) == 2000
+        assert len(loader.worker_connections) == 3
+        with connection.cursor(False) as cursor:
+            cursor.execute("SELECT count(*), count(DISTINCT entry_id) FROM entries WHERE phone LIKE '+7999%%'")
+            assert cursor.fetchone() == (2000, 2000)
+            cursor.execute("SELECT max(entry_id) FROM entries")
+            last_id = cursor.fetchone()[0]
+        assert_counters_match(connection)
+
+        with pytest.raises(Exception):
+            loader.load([(1, 2, 3, 4, "5", 6, "+79980000001"), (1, 2, 3, 10 ** 6, "5", 6, "+79980000002")])
+        with connection.cursor(False) as cursor:
+            cursor.execute("SELECT count(*) FROM entries WHERE phone LIKE '+7998%%'")
+            assert cursor.fetchone()[0] == 0
+        assert_counters_match(connection)
+        assert Entry(connection).create([Entry(connection).get_default_entry_data()])[0]["entry_id"] > last_id
+    finally:
+        loader.close()
+
+
+def test_partition_loader_sends_one_notification(partitioned):
+    connection, _ = partitioned
+    loader = PartitionLoader(connection, workers=2)
+    with psycopg.connect(host=connection.host, port=connection.port, user=connection.user,
+                         password=connection.password, dbname=connection.database, autocommit=True) as listen:
+        listen.execute(f"LISTEN {CHANGES_CHANNEL}")
+        try:
+            loader.load([(1, 2, 3, 4, "5", 6, f"8 997 {i:07d}") for i in range(10)])
+            with connection.cursor(False) as cursor:
+                cursor.execute("SELECT entry_id, tableoid::regclass::text FROM entries WHERE phone LIKE '+7997%%'")
+                partitions = {entry_id: partition for entry_id, partition in cursor.fetchall()}
+            # Сеансы загрузки не отправляют уведомлений и через триггеры основной таблицы
+            with loader.worker_connections[0].cursor() as cursor:
+                cursor.execute("UPDATE entries SET apartment = 7 WHERE phone LIKE '+7997%%'")
+                assert cursor.rowcount == 10
+        finally:
+            loader.close()
+        events = [json.loads(notify.payload) for notify in listen.notifies(timeout=0.5)]
+    assert len(set(partitions.values())) > 1
+    assert [(event["table"], event["op"], sorted(event["ids"])) for event in events] == \
+           [("entries", "I", sorted(partitions))]
+
+
+def test_fill_database_with_workers(partitioned):
+    pytest.importorskip("mimesis")
+    from modules.generate import fill_database
+
+    connection, _ = partitioned
+    before = _table_state(connection)[0]
+    assert fill_database(300, connection, chunk_size=100, workers=2) == 300
+    assert _table_state(connection)[0] == before + 300
+
+
+def test_repartition_and_merge_back(partitioned):
+    connection, _ = partitioned
+    state = _table_state(connection)
+    assert partition_entries(connection, 2) == 2
+    assert _table_state(connection) == state
+    assert partition_entries(connection, 1) == 0
+    assert get_partition_count(connection) == 0
+    assert _table_state(connection) == state
+    assert_counters_match(connection)
+    assert partition_entries(connection, 4) == 4
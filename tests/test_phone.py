@@ -0,0 +1,178 @@
+"""Номера телефонов: приведение к E.164 и обратный поиск по номеру в базе и в PhoneIndex"""
+import json
+import timeit
+
+import pytest
+
+from database.entry import Entry
+from database.phone import PhoneIndex, format_phone, normalize_phone, normalize_phone_prefix
+from database.sqlite import SQLiteConnection, SQLiteEntry
+from tests.conftest import fill_dataset
+
+ROWS = 20_000
+PHONES = ["+7 (912) 345-67-89", "8 912 345 67 89", "79123456789", "9123456789", " +44 20 7946 0958 ",
+          "+380441234567", "12345", "+0123456789", "8912345678", "", "телефон"]
+
+
+def _normalize_or_none(value):
+    try:
+        return normalize_phone(value)
+    except ValueError:
+        return None
+
+
+def test_normalize_phone():
+    assert [_normalize_or_none(phone) for phone in PHONES] == [
+        "+79123456789", "+79123456789", "+79123456789", "+79123456789", "+442079460958",
+        "+380441234567", None, None, "+78912345678", None, None,
+    ]
+    assert normalize_phone(79123456789) == "+79123456789"
+    assert normalize_phone_prefix("8 912") == "+7912"
+    assert normalize_phone_prefix("+44") == "+44"
+    with pytest.raises(ValueError):
+        normalize_phone_prefix("+")
+
+
+def test_format_phone():
+    assert format_phone("+79123456789") == "+7 (912) 345-67-89"
+    assert format_phone("+442079460958") == "+442079460958"
+    assert normalize_phone(format_phone("+79123456789")) == "+79123456789"
+
+
+def test_phone_index():
+    phones = ["+12025550100", "+4420794609", "+442079460958", "+79123456780", "+79123456789", "+79123456789",
+              "+791234567890"]
+    index = PhoneIndex(sorted(((phone, entry_id) for entry_id, phone in enumerate(phones, 1)),
+                              key=lambda row: (len(row[0]), row[0])))
+
+    assert index.find("+79123456789") == [5, 6]
+    assert index.find("+79000000000") == []
+    assert index.find_prefix("+7912345678") == [("+79123456780", 4), ("+79123456789", 5),
+                                                 ("+79123456789", 6), ("+791234567890", 7)]
+    assert index.find_prefix("+44") == [("+4420794609", 2), ("+442079460958", 3)]
+    assert index.find_prefix("+7", limit=2) == [("+79123456780", 4), ("+79123456789", 5)]
+
+
+@pytest.fixture(scope="module")
+def entries(database):
+    fill_dataset(database, ROWS)
+    return Entry(database)
+
+
+def test_migration_function_matches_application(database):
+    with database.cursor(False) as cursor:
+        cursor.execute("SELECT json_agg(normalize_phone(phone)) FROM unnest(%s::text[]) phone", (PHONES,))
+        assert cursor.fetchone()[0] == [_normalize_or_none(phone) for phone in PHONES]
+
+
+def test_writes_are_normalized(entries):
+    created = entries.create([{**entries.get_default_entry_data(), "phone": "8 (912) 000-11-22"}])[0]
+    assert created["phone"] == "+79120001122"
+    entries.update({"phone": "9120001133"}, created["entry_id"])
+    assert entries.find_by_phone("+7 912 000-11-33")[0]["entry_id"] == created["entry_id"]
+    with pytest.raises(ValueError):
+        entries.update({"phone": "000"}, created["entry_id"])
+    with entries.connection.cursor() as cursor, pytest.raises(ValueError):
+        with entries.exception_handler():
+            cursor.execute("UPDATE entries SET phone = '89120001122' WHERE entry_id = %s", (created["entry_id"],))
+    entries.delete([created["entry_id"]])
+
+
+def test_find_by_phone_prefix(entries):
+    prefix = "+790000012"
+    expected = sorted(f"+79{i:09d}" for i in range(1, ROWS + 1) if f"+79{i:09d}".startswith(prefix))
+    found = entries.find_by_phone_prefix("8 900 000 12", limit=1000)
+    assert [entry["phone"] for entry in found] == expected
+    assert [entry["phone"] for entry in entries.find_by_phone_prefix(prefix, limit=5)] == expected[:5]
+
+
+def test_prefix_query_uses_pattern_index(entries):
+    query, params = entries._phone_prefix_query("+7900001", 100)
+    with entries.connection.cursor(False) as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        plan = json.dumps(cursor.fetchone()[0])
+        entries.connection.connection.rollback()
+    assert "entries_phone_pattern_idx" in plan
+    assert '"Node Type": "Sort"' not in plan
+
+
+def test_phone_index_matches_database(entries):
+    index = entries.load_phone_index()
+    assert len(index) == ROWS
+    assert index.find("+79000000777") == [entry["entry_id"] for entry in entries.find_by_phone("+79000000777")]
+    prefix = "+7900001"
+    assert [phone for phone, _ in index.find_prefix(prefix, 50)] == \
+           [entry["phone"] for entry in entries.find_by_phone_prefix(prefix, 50)]
+
+    per_lookup = min(timeit.repeat(lambda: index.find("+79000000777"), number=1000, repeat=3)) / 1000
+    assert per_lookup < 50e-6
+
+
+def test_sqlite_find_by_phone(tmp_path):
+    from database.migrations import migrate
+    from database.sqlite import SQLiteBase
+
+    connection = SQLiteConnection(str(tmp_path / "phone_table.sqlite3"))
+    connection.connect()
+    try:
+        migrate(connection)
+        ids = {table_name: SQLiteBase(table_name, [id_column, value], connection, id_column)
+               .get_or_create_ids(value, ["Значение"])["Значение"]
+               for table_name, id_column, value in [("names", "name_id", "name"), ("surnames", "surname_id", "surname"),
+                                                    ("patronymics", "patronymic_id", "patronymic"),
+                                                    ("streets", "street_id", "street")]}
+        entries = SQLiteEntry(connection)
+        entries.bulk_insert((ids["names"], ids["surnames"], ids["patronymics"], ids["streets"], "1", 1, phone)
+                            for phone in ["8 912 000 00 01", "+7 912 000-00-02", "+44 20 7946 0958"])
+
+        assert [entry["phone"] for entry in entries.find_by_phone_prefix("8912")] == ["+79120000001", "+79120000002"]
+        assert entries.find_by_phone("89120000002")[0]["entry_id"] == 2
+        assert entries.load_phone_index().find_prefix("+44") == [("+442079460958", 3)]
+    finally:
+        connection.connection.close()
+
+
+def test_migration_converts_phone_column_to_text(database):
+    from database.migrations import MIGRATIONS
+
+    normalize_phones = next(steps for version, _, steps in MIGRATIONS if version == 7)[0]
+    with database.cursor(False) as cursor:
+        try:
+            # Таблица базы, созданной до миграций, с числовой колонкой номера
+            cursor.execute("CREATE SCHEMA phone_migration_test")
+            cursor.execute("SET LOCAL search_path TO phone_migration_test")
+            cursor.execute("CREATE TABLE entries (entry_id serial PRIMARY KEY, phone bigint NOT NULL)")
+            cursor.execute("INSERT INTO entries (phone) VALUES (89123456789), (9123456789), (12345)")
+            normalize_phones(cursor, database)
+
+            cursor.execute("SELECT data_type FROM information_schema.columns "
+                           "WHERE table_schema = 'phone_migration_test' AND table_name = 'entries' "
+                           "AND column_name = 'phone'")
+            assert cursor.fetchone()[0] == "text"
+            cursor.execute("SELECT phone FROM entries ORDER BY entry_id")
+            assert [row[0] for row in cursor.fetchall()] == ["+79123456789", "+79123456789", "12345"]
+        finally:
+            database.connection.rollback()
+
+
+def test_phone_delegate_keeps_value_on_invalid_number(qt_app, database, monkeypatch):
+    from PyQt5.QtGui import QStandardItemModel
+    from PyQt5.QtWidgets import QLineEdit
+    import ui.table
+
+    warnings = []
+    monkeypatch.setattr(ui.table.QMessageBox, "warning", lambda *args: warnings.append(args[2]))
+    model = QStandardItemModel(1, 1)
+    index = model.index(0, 0)
+    model.setData(index, "+7 (912) 345-67-89")
+    delegate, editor = ui.table.PhoneNumberDelegate(), QLineEdit()
+
+    editor.setText("12345")
+    delegate.setModelData(editor, model, index)
+    assert model.data(index) == "+7 (912) 345-67-89"
+    assert warnings == ["Некорректный номер телефона: '12345'"]
+
+    editor.setText("8 912 000 00 01")
+    delegate.setModelData(editor, model, index)
+    assert model.data(index) == "+7 (912) 000-00-01"
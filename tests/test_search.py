@@ -0,0 +1,146 @@
+"""Нечёткий поиск записей по похожим именам, фамилиям, отчествам и улицам"""
+import json
+import sys
+
+import pytest
+
+from database.entry import Entry
+from database.phonetic import edit_distance, max_distance, normalize_name, phonetic_key, reversed_name
+from database.sqlite import SQLiteConnection, SQLiteBase, SQLiteEntry
+from tests.conftest import fill_dataset
+
+ROWS = 5000
+WORDS = ["Кузнецов", "КУЗНЕЦЕВА", "Ёлкин", "Достоевский", "Иванов-Петров", "Гроздь", "Юрьев", "Дьяков", "Smith"]
+
+
+@pytest.fixture(scope="module")
+def entries(database):
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        tables.connection.connection.rollback()
+    fill_dataset(database, ROWS)
+    with database.cursor() as cursor:
+        cursor.execute("INSERT INTO surnames (surname) VALUES ('Кузнецов'), ('Кузнецова'), ('Кузьмин') "
+                       "RETURNING surname_id")
+        surname_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("INSERT INTO names (name) VALUES ('Иван') RETURNING name_id")
+        name_id = cursor.fetchone()[0]
+        for entry_id, surname_id in zip([1, 2, 3], surname_ids):
+            cursor.execute("UPDATE entries SET surname_id = %s WHERE entry_id = %s", (surname_id, entry_id))
+        cursor.execute("UPDATE entries SET name_id = %s WHERE entry_id IN (1, 3)", (name_id,))
+        cursor.execute("ANALYZE")
+    return Entry(database)
+
+
+def test_phonetic_key():
+    assert phonetic_key("Кузнецов") == phonetic_key("кузнецев") == "кузницаф"
+    assert phonetic_key("Достоевский") == phonetic_key("Дастаевский")
+    assert phonetic_key("Пётр") == phonetic_key("ПЕТР")
+    assert normalize_name(" Иванов-Петров ") == "ивановпетров"
+    assert edit_distance("кузнецов", "кузнецова", 2) == 1
+    assert edit_distance("кузнецов", "кузьмин", 2) == 3
+    assert max_distance("иван") == 1 and max_distance("кузнецов") == 2
+
+
+def test_database_keys_match_application(entries):
+    with entries.connection.cursor(False) as cursor:
+        cursor.execute("SELECT word, normalize_name(word), phonetic_key(word), reversed_name(word) "
+                       "FROM unnest(%s::text[]) word", (WORDS,))
+        assert cursor.fetchall() == [(word, normalize_name(word), phonetic_key(word), reversed_name(word))
+                                     for word in WORDS]
+        cursor.execute("SELECT surname, surname_normalized, surname_phonetic, surname_reversed FROM surnames "
+                       "WHERE surname LIKE 'Куз%%'")
+        assert all(row[1:] == (normalize_name(row[0]), phonetic_key(row[0]), reversed_name(row[0]))
+                   for row in cursor.fetchall())
+
+
+def test_match_values(entries):
+    surnames, names = entries.match_values("Кузнецев ивн")
+    assert [(match.value, match.distance, match.same_sound) for match in surnames] == \
+           [("Кузнецов", 1, True), ("Кузнецова", 2, False)]
+    assert [(match.table_name, match.value) for match in names] == [("names", "Иван")]
+    assert entries.match_values("Ыыыы") == [[]]
+
+
+def test_match_values_with_typo_in_first_letters(entries):
+    # Начало значения и ключа отличается, кандидаты находятся по концу значения; «Кузнецова» отличается
+    # от «Гузнецов» и в начале, и в конце, поэтому не находится
+    surnames, names = entries.match_values("Гузнецов Ыван")
+    assert [(match.value, match.distance) for match in surnames] == [("Кузнецов", 1)]
+    assert [(match.table_name, match.value, match.distance) for match in names] == [("names", "Иван", 1)]
+    assert [row["entry_id"] for row in entries.find_similar("Узнецов")] == [1]
+
+
+def test_fuzzy_filter(entries):
+    assert entries.get_page(search="кузнецев", fuzzy=False)[0] == []
+    page, _ = entries.get_page(search="кузнецев", fuzzy=True)
+    assert [row["entry_id"] for row in page] == [1, 2]
+    page, _ = entries.get_page(search="Иван Кузнецев", fuzzy=True)
+    assert [row["entry_id"] for row in page] == [1]
+    assert entries.get_page(search="Кузнецев Ыыыы", fuzzy=True)[0] == []
+
+
+def test_find_similar_ranks_by_distance(entries):
+    assert [row["entry_id"] for row in entries.find_similar("Кузнецова")] == [2, 1]
+    assert [row["entry_id"] for row in entries.find_similar("Кузнецев")] == [1, 2]
+    assert entries.find_similar("Кузнецев", limit=1)[0]["entry_id"] == 1
+
+
+def test_fuzzy_search_uses_indexes(entries):
+    query, params = entries._match_query("кузнецов", "кузницаф", 2)
+    condition, condition_params = entries._fuzzy_condition("Кузнецев")
+    with entries.connection.cursor(False) as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+        lookup_plan = json.dumps(cursor.fetchone()[0])
+        cursor.execute(f"EXPLAIN (FORMAT JSON) SELECT e.entry_id FROM entries e WHERE {condition}", condition_params)
+        entries_plan = json.dumps(cursor.fetchone()[0])
+    entries.connection.connection.rollback()
+    assert "Seq Scan" not in lookup_plan and "surnames_surname_phonetic_idx" in lookup_plan
+    assert "Seq Scan" not in entries_plan and "entries_surname_id_idx" in entries_plan
+
+
+def test_widget_fuzzy_filter(qt_app, entries):
+    from ui.table import EntriesTableWidget
+
+    widget = EntriesTableWidget()
+    try:
+        widget.set_filter("Кузнецев", fuzzy=True)
+        assert widget.rowCount() == 2
+        widget.set_filter("Кузнецев")
+        assert widget.rowCount() == 0
+    finally:
+        # Чтения в приложении не завершают транзакцию, а открытая транзакция заблокировала бы TRUNCATE
+        widget.table.connection.connection.rollback()
+        widget.deleteLater()
+
+
+def test_sqlite_fuzzy_search(tmp_path):
+    from database.migrations import migrate
+
+    connection = SQLiteConnection(str(tmp_path / "phone_table.sqlite3"))
+    connection.connect()
+    try:
+        migrate(connection)
+        ids = {table_name: SQLiteBase(table_name, [id_column, value], connection, id_column)
+               .get_or_create_ids(value, values)
+               for table_name, id_column, value, values in [
+                   ("names", "name_id", "name", ["Иван", "Пётр"]),
+                   ("surnames", "surname_id", "surname", ["Кузнецов", "Кузьмин"]),
+                   ("patronymics", "patronymic_id", "patronymic", ["Иванович"]),
+                   ("streets", "street_id", "street", ["Ленина"])]}
+        entries = SQLiteEntry(connection)
+        entries.bulk_insert([(ids["names"][name], ids["surnames"][surname], ids["patronymics"]["Иванович"],
+                              ids["streets"]["Ленина"], "1", 1, f"+7912000000{i}")
+                             for i, (name, surname) in enumerate([("Иван", "Кузнецов"), ("Пётр", "Кузьмин")])])
+
+        assert [match.value for match in entries.match_values("кузнецев")[0]] == ["Кузнецов"]
+        assert [row["entry_id"] for row in entries.get_page(search="Петр Кузьмин", fuzzy=True)[0]] == [2]
+        assert [row["entry_id"] for row in entries.find_similar("Ленена")] == [1, 2]
+        assert [match.value for match in entries.match_values("Бузнецов")[0]] == ["Кузнецов"]
+        with connection.cursor(False) as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + entries._match_query("кузнецов", "кузницаф", 2)[0],
+                           entries._match_query("кузнецов", "кузницаф", 2)[1])
+            assert "surnames_surname_phonetic_idx" in " ".join(str(row) for row in cursor.fetchall())
+    finally:
+        connection.connection.close()
@@ -0,0 +1,131 @@
+"""Хранилище SQLite: не требует сервера, поэтому тесты выполняются всегда"""
+import pytest
+
+from database.migrations import migrate
+from database.sqlite import SQLiteConnection, SQLiteBase, SQLiteEntry
+
+ROWS = 2_000
+NAMES = ["Иван", "Пётр", "Анна", "Мария", "Юлия"]
+SURNAMES = ["Кузнецов", "Иванова", "Смирнов", "Попова", "Соколов_1"]
+STREETS = ["Ленина", "Мира", "Садовая"]
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = SQLiteConnection(str(tmp_path / "phone_table.sqlite3"))
+    connection.connect()
+    migrate(connection)
+    yield connection
+    connection.connection.close()
+
+
+@pytest.fixture
+def tables(connection):
+    entries = SQLiteEntry(connection)
+    lookups = {
+        "name": SQLiteBase("names", ["name_id", "name"], connection, "name_id"),
+        "surname": SQLiteBase("surnames", ["surname_id", "surname"], connection, "surname_id"),
+        "patronymic": SQLiteBase("patronymics", ["patronymic_id", "patronymic"], connection, "patronymic_id"),
+        "street": SQLiteBase("streets", ["street_id", "street"], connection, "street_id"),
+    }
+    ids = {
+        "name": lookups["name"].get_or_create_ids("name", NAMES),
+        "surname": lookups["surname"].get_or_create_ids("surname", SURNAMES),
+        "patronymic": lookups["patronymic"].get_or_create_ids("patronymic", ["Иванович", "Петровна"]),
+        "street": lookups["street"].get_or_create_ids("street", STREETS),
+    }
+    entries.bulk_insert(
+        (ids["name"][NAMES[i % len(NAMES)]], ids["surname"][SURNAMES[i * 7 % len(SURNAMES)]],
+         ids["patronymic"]["Иванович" if i % 2 else "Петровна"], ids["street"][STREETS[i % len(STREETS)]],
+         str(1 + i % 40), 1 + i % 300, f"+79{i:09d}")
+        for i in range(ROWS)
+    )
+    return entries, lookups
+
+
+def _labels(entries, lookups):
+    values = {column: {row[f"{column}_id"]: row[column] for row in table.get_all()}
+              for column, table in lookups.items()}
+    return {
+        row["entry_id"]: [str(row["entry_id"]), values["name"][row["name_id"]], values["surname"][row["surname_id"]],
+                          values["patronymic"][row["patronymic_id"]], values["street"][row["street_id"]],
+                          row["building"], str(row["apartment"]), row["phone"]]
+        for row in entries.get_all()
+    }
+
+
+def _search_ids(entries, search):
+    rows, after = [], None
+    while True:
+        page, after = entries.get_page(None, False, 500, after, search)
+        rows += [row["entry_id"] for row in page]
+        if after is None:
+            return rows
+
+
+def test_migrate_is_idempotent(connection):
+    assert migrate(connection) == migrate(connection)
+    with connection.cursor(False) as cursor:
+        assert cursor.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+@pytest.mark.parametrize("order_by", ["entry_id", "surname_id", "street_id", "building", "phone"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_get_page_follows_get_all(tables, order_by, descending):
+    entries, _ = tables
+    expected = [row["entry_id"] for row in entries.get_all(order_by, descending)]
+    pages, after = [], None
+    while True:
+        page, after = entries.get_page(order_by, descending, 333, after)
+        pages += [row["entry_id"] for row in page]
+        if after is None:
+            break
+    assert pages == expected
+
+
+@pytest.mark.parametrize("search", ["кузнец", "ПЁТР", "ва", "ИВ", "_1", "000012", "садов"])
+def test_search_matches_substring(tables, search):
+    entries, lookups = tables
+    expected = [entry_id for entry_id, values in _labels(entries, lookups).items()
+                if any(search.lower() in value.lower() for value in values)]
+    assert expected
+    assert _search_ids(entries, search) == expected
+
+
+def test_lookup_search_ignores_cyrillic_case(tables, connection):
+    _, lookups = tables
+    page, _ = lookups["surname"].get_page(None, False, 10, None, "ИВАН")
+    assert [row["surname"] for row in page] == ["Иванова"]
+    with connection.cursor(False) as cursor:
+        # Встроенная lower не переопределяется и меняет регистр только латинских букв
+        assert cursor.execute("SELECT lower('ИВАН AB'), ru_lower('ИВАН AB')").fetchone() == ("ИВАН ab", "иван ab")
+
+
+def test_search_index_follows_changes(tables):
+    entries, lookups = tables
+    surname_id = lookups["surname"].get_or_create_ids("surname", ["Кузнецов"])["Кузнецов"]
+    lookups["surname"].update({"surname": "Кузнецев"}, surname_id)
+    entries.update({"phone": "+70000000000"}, 1)
+    entries.delete([2])
+
+    assert not _search_ids(entries, "кузнецов")
+    assert _search_ids(entries, "кузнецев") == [entry_id for entry_id, values in _labels(entries, lookups).items()
+                                                if values[2] == "Кузнецев"]
+    assert _search_ids(entries, "+70000000000") == [1]
+    assert 2 not in _search_ids(entries, "+79000000002")
+
+
+def test_constraint_errors(tables):
+    _, lookups = tables
+    with pytest.raises(ValueError, match="уникальности"):
+        lookups["name"].create([{"name": "Иван"}])
+    with pytest.raises(ValueError, match="ссылочной"):
+        lookups["name"].delete([1])
+
+
+def test_duplicate_and_update(tables):
+    entries, _ = tables
+    created = entries.duplicate(["1", "2"])
+    assert [row["entry_id"] for row in created] == [ROWS + 1, ROWS + 2]
+    assert entries.update({"apartment": 5}, ROWS + 1) == ((ROWS + 1, 5),)
+    assert len(entries.get_all()) == ROWS + 2
@@ -0,0 +1,143 @@
+"""Счётчики записей по улицам, фамилиям и домам и запросы статистики"""
+import json
+import sys
+import threading
+
+import pytest
+
+from database.connection import Connection
+from database.entry import Entry
+from database.sqlite import SQLiteConnection, SQLiteBase, SQLiteEntry
+from modules.reset import reset_database
+from modules.statistics import count_distribution, count_totals, rebuild_counters, top_counts
+from tests.conftest import assert_counters_match, fill_dataset
+
+ROWS = 5000
+
+
+@pytest.fixture(scope="module")
+def entries(database):
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        tables.connection.connection.rollback()
+    fill_dataset(database, ROWS)
+    return Entry(database)
+
+
+def test_counters_follow_changes(entries):
+    connection = entries.connection
+    assert_counters_match(connection)
+
+    created = entries.duplicate([1, 2, 3])
+    entries.update({"street_id": 7, "building": "7А"}, created[0]["entry_id"])
+    entries.update({"phone": "+79990000000"}, created[1]["entry_id"])
+    entries.update_many({"surname_id": 5}, list(range(10, 200)))
+    entries.bulk_insert([(1, 1, 1, 1, "1", 1, f"+7999{i:07d}") for i in range(100)])
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM entries WHERE entry_id > %s", (ROWS - 300,))
+    assert_counters_match(connection)
+
+
+def test_counters_under_concurrent_writes(entries):
+    def insert():
+        client = Connection()
+        client.connect()
+        try:
+            for _ in range(20):
+                with client.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO entries (name_id, surname_id, patronymic_id, street_id, building, apartment, phone)
+                        SELECT name_id, surname_id, patronymic_id, street_id, building, apartment, phone
+                        FROM entries WHERE entry_id BETWEEN 1 AND 50
+                    """)
+        finally:
+            client.connection.close()
+
+    threads = [threading.Thread(target=insert) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert_counters_match(entries.connection)
+
+
+def test_statistics_queries(entries):
+    connection = entries.connection
+    with connection.cursor(False) as cursor:
+        cursor.execute("""
+            SELECT st.street, count(*) FROM entries e JOIN streets st ON st.street_id = e.street_id
+            GROUP BY st.street_id, st.street ORDER BY count(*) DESC, st.street_id LIMIT 5
+        """)
+        expected_top = cursor.fetchall()
+        cursor.execute("SELECT count(DISTINCT (street_id, building)), count(*) FROM entries")
+        expected_totals = cursor.fetchone()
+    assert [(row.label, row.entry_count) for row in top_counts(connection, "streets", 5)] == expected_top
+    assert count_totals(connection, "buildings") == expected_totals
+    distribution = count_distribution(connection, "surnames")
+    assert sum(row.entry_count * row.groups for row in distribution) == expected_totals[1]
+    assert top_counts(connection, "buildings", 1)[0].label.startswith("Улица ")
+
+
+def test_statistics_do_not_read_entries(entries):
+    with entries.connection.cursor(False) as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) SELECT st.street, c.entry_count FROM street_counts c "
+                       "JOIN streets st ON st.street_id = c.street_id ORDER BY c.entry_count DESC, c.street_id LIMIT 20")
+        plan = json.dumps(cursor.fetchone()[0])
+    assert '"Relation Name": "entries"' not in plan
+
+
+def test_truncate_and_rebuild(entries):
+    connection = entries.connection
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM building_counts")
+    rebuild_counters(connection)
+    assert_counters_match(connection)
+
+    reset_database(connection)
+    assert count_totals(connection, "streets") == (0, 0)
+
+
+def test_widget_refresh(qt_app, database):
+    from ui.statistics import StatisticsWidget
+
+    fill_dataset(database, 1000)
+    widget = StatisticsWidget()
+    try:
+        widget.limit_spinbox.setValue(3)
+        widget.refresh()
+        assert widget.top_table.rowCount() == 3
+        assert widget.summary_label.text() == "Улицы: 500, записей: 1000"
+        widget.kind_combobox.setCurrentIndex(2)
+        assert widget.distribution_table.item(0, 0).text() == "1"
+    finally:
+        # Чтения в приложении не завершают транзакцию, а открытая транзакция заблокировала бы TRUNCATE
+        import database.tables
+        database.tables.connection.connection.rollback()
+
+
+def test_sqlite_counters(tmp_path):
+    from database.migrations import migrate
+
+    connection = SQLiteConnection(str(tmp_path / "phone_table.sqlite3"))
+    connection.connect()
+    try:
+        migrate(connection)
+        ids = {table_name: SQLiteBase(table_name, [id_column, value], connection, id_column)
+               .get_or_create_ids(value, ["Первое", "Второе"])
+               for table_name, id_column, value in [("names", "name_id", "name"), ("surnames", "surname_id", "surname"),
+                                                    ("patronymics", "patronymic_id", "patronymic"),
+                                                    ("streets", "street_id", "street")]}
+        first = [ids[table_name]["Первое"] for table_name in ["names", "surnames", "patronymics"]]
+        entries = SQLiteEntry(connection)
+        entries.bulk_insert([(*first, ids["streets"][street], "1", 1, f"+7912000000{i}")
+                             for i, street in enumerate(["Первое", "Первое", "Второе"])])
+        entries.update({"street_id": ids["streets"]["Первое"]}, 3)
+        entries.update_many({"building": "2"}, [1, 2])
+        entries.delete([1])
+
+        assert_counters_match(connection)
+        assert [(row.label, row.entry_count) for row in top_counts(connection, "buildings")] == \
+               [("Первое, 1", 1), ("Первое, 2", 1)]
+        assert count_totals(connection, "streets") == (1, 2)
+    finally:
+        connection.connection.close()
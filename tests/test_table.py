@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+@pytest.fixture(scope="module")
+def entries_widget(qt_app, dataset):
+    from ui.table import EntriesTableWidget
+
+    widget = EntriesTableWidget()
+    yield widget
+    widget.deleteLater()
+
+
+def test_load_data(benchmark, check_baseline, entries_widget, dataset):
+    _, rows = dataset
+    benchmark.pedantic(entries_widget.load_data, rounds=3, iterations=1)
+    assert entries_widget.rowCount() == min(entries_widget.page_size, rows)
+    check_baseline(benchmark)
+
+
+@pytest.mark.parametrize("filter_text", ["имя 1", "несуществующее"], ids=["match", "no_match"])
+def test_set_filter(benchmark, check_baseline, entries_widget, filter_text):
+    benchmark(entries_widget.set_filter, filter_text)
+    entries_widget.set_filter("")
+    check_baseline(benchmark)
+
+
+def test_set_filter_searches_unloaded_rows(entries_widget, dataset):
+    _, rows = dataset
+    last_phone = f"+79{rows:09d}"
+
+    entries_widget.set_filter(last_phone)
+    try:
+        assert entries_widget.rowCount() == 1
+        assert entries_widget.item(0, 0).text() == str(rows)
+    finally:
+        entries_widget.set_filter("")
+
+
+def test_fill_selection(entries_widget, dataset, monkeypatch):
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QTableWidgetSelectionRange
+
+    connection, _ = dataset
+    entries_widget.load_data()
+    street_column = entries_widget.get_column_by_db_name("street_id")
+    source = entries_widget.cellWidget(3, street_column)
+    street_id = source.currentData(Qt.UserRole)
+    monkeypatch.setattr(entries_widget, "load_data", lambda: pytest.fail("Таблица не должна перезагружаться"))
+
+    entries_widget.setCurrentCell(3, street_column)
+    entries_widget.setRangeSelected(QTableWidgetSelectionRange(0, 0, 9, entries_widget.columnCount() - 1), True)
+    entries_widget.fill_selection()
+    try:
+        target_ids = [int(entries_widget.item(row, 0).text()) for row in range(10)]
+        assert {entries_widget.cellWidget(row, street_column).currentData(Qt.UserRole) for row in range(10)} == \
+               {street_id}
+        assert {entries_widget.item(row, street_column).text() for row in range(10)} == {source.currentText()}
+        assert {entry["street_id"] for entry in entries_widget.table.get_by_ids(target_ids)} == {street_id}
+        assert entries_widget.cellWidget(10, street_column).currentData(Qt.UserRole) != street_id
+    finally:
+        entries_widget.clearSelection()
+        # Чтения в приложении не завершают транзакцию, а открытая транзакция заблокировала бы TRUNCATE
+        entries_widget.table.connection.connection.rollback()
@@ -0,0 +1,33 @@
+"""Выборка запросов в статистике SQL"""
+import pytest
+
+from database.tracing import Tracer
+
+
+@pytest.fixture
+def tracer():
+    return Tracer()
+
+
+def test_unsampled_queries_are_not_measured(tracer, monkeypatch):
+    import database.tracing
+
+    monkeypatch.setattr(database.tracing, "query_shape", pytest.fail)
+    tracer.sample_rate = 0.0
+    tracer.record("SELECT 1", None, 0.001, 1)
+    assert tracer.summary() == []
+
+
+def test_size_is_measured_only_for_size_sample(tracer, monkeypatch):
+    import database.tracing
+
+    measured = []
+    monkeypatch.setattr(database.tracing, "_param_size", lambda params: measured.append(params) or 8)
+    tracer.size_sample_rate = 0.0
+    tracer.record("SELECT %s", [1], 0.001, 1)
+    tracer.size_sample_rate = 1.0
+    tracer.record("SELECT %s", [2], 0.001, 1)
+    [stats] = tracer.summary()
+    assert stats["latency_us"]["count"] == 2
+    assert stats["bytes"]["count"] == 1
+    assert measured == [[2]]
@@ -0,0 +1,45 @@
+"""Импорт записей из CSV"""
+import sys
+
+import pytest
+
+from database.entry import Entry
+from modules.reset import reset_database
+from modules.transfer import EXPORT_COLUMNS, import_entries
+
+
+@pytest.fixture
+def empty_database(database):
+    tables = sys.modules.get("database.tables")
+    if tables is not None:
+        tables.connection.connection.rollback()
+    reset_database(database)
+    return database
+
+
+def _write_csv(path, rows: int):
+    lines = [",".join(EXPORT_COLUMNS)]
+    lines += [f"Фамилия {i},Имя {i},Отчество,Улица,1,{i},+7912000{i:04d}" for i in range(rows)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def test_import_stops_on_database_error_and_resumes(empty_database, tmp_path, monkeypatch):
+    path = tmp_path / "entries.csv"
+    _write_csv(path, 6)
+    bulk_insert = Entry.bulk_insert
+    calls = []
+
+    def failing_bulk_insert(self, rows):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return bulk_insert(self, rows)
+
+    monkeypatch.setattr(Entry, "bulk_insert", failing_bulk_insert)
+    report = import_entries(str(path), empty_database, chunk_size=2)
+    assert (report.imported, report.resume_line, report.failure) == (2, 4, "connection lost")
+    assert len(Entry(empty_database).get_all()) == 2
+
+    report = import_entries(str(path), empty_database, chunk_size=2, start_line=report.resume_line)
+    assert (report.imported, report.failure) == (4, None)
+    assert sorted(row["apartment"] for row in Entry(empty_database).get_all()) == list(range(6))
@@ -0,0 +1,125 @@
+from typing import List, Set
+
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QPushButton,
+    QCheckBox, QLabel, QAbstractItemView, QMessageBox, QProgressDialog, QApplication
+)
+
+from database.phone import format_phone
+from database.tables import connection
+from database.tracing import span
+from modules.duplicates import find_duplicates, get_entry_labels, remove_duplicates
+from schema.duplicates import DuplicateGroup
+
+
+class DuplicatesWidget(QWidget):
+    """
+    Просмотр групп повторяющихся записей.
+
+    В каждой группе флажком отмечаются записи, которые нужно оставить (по умолчанию - с наименьшим ID),
+    остальные записи найденных групп удаляются одной операцией.
+    """
+    entries_removed = pyqtSignal(int)
+    max_groups = 1000
+    headers = ["Оставить", "Группа", "Совпадение", "ID", "Фамилия", "Имя", "Отчество", "Улица", "Дом", "Квартира",
+               "Телефон"]
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Повторяющиеся записи")
+        self.resize(1100, 600)
+        self.groups: List[DuplicateGroup] = []
+
+        self.near_checkbox = QCheckBox("Искать похожие записи")
+        self.near_checkbox.setChecked(True)
+        self.search_button = QPushButton("Найти")
+        self.search_button.clicked.connect(self.search)
+        self.remove_button = QPushButton("Оставить отмеченные, удалить остальные")
+        self.remove_button.clicked.connect(self.remove)
+        self.remove_button.setEnabled(False)
+        self.summary_label = QLabel()
+
+        self.table = QTableWidget(0, len(self.headers))
+        self.table.setHorizontalHeaderLabels(self.headers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(self.near_checkbox)
+        controls_layout.addWidget(self.search_button)
+        controls_layout.addWidget(self.remove_button)
+        controls_layout.addStretch()
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls_layout)
+        layout.addWidget(self.summary_label)
+        layout.addWidget(self.table)
+
+    def search(self):
+        dialog = QProgressDialog("Поиск повторяющихся записей", "Отмена", 0, 0, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+
+        def update(rows: int) -> bool:
+            dialog.setLabelText(f"Проверено записей: {rows}")
+            QApplication.processEvents()
+            return not dialog.wasCanceled()
+
+        try:
+            with span("duplicates.search"):
+                self.groups = find_duplicates(connection, near=self.near_checkbox.isChecked(), progress=update)
+        finally:
+            dialog.close()
+        self.fill_table()
+
+    def fill_table(self):
+        shown = self.groups[:self.max_groups]
+        labels = get_entry_labels(connection, sorted({entry_id for group in shown for entry_id in group.entry_ids}))
+        rows = [(group_number, group, entry_id) for group_number, group in enumerate(shown, 1)
+                for entry_id in group.entry_ids if entry_id in labels]
+        self.table.setUpdatesEnabled(False)
+        try:
+            self.table.setRowCount(len(rows))
+            for row, (group_number, group, entry_id) in enumerate(rows):
+                keep_item = QTableWidgetItem()
+                keep_item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+                keep_item.setCheckState(Qt.Checked if entry_id == group.entry_ids[0] else Qt.Unchecked)
+                keep_item.setData(Qt.UserRole, entry_id)
+                self.table.setItem(row, 0, keep_item)
+                surname, name, patronymic, street, building, apartment, phone = labels[entry_id]
+                values = [group_number, group.description, entry_id, surname, name, patronymic, street, building,
+                          apartment, format_phone(phone)]
+                for column, value in enumerate(values, 1):
+                    item = QTableWidgetItem()
+                    item.setData(Qt.DisplayRole, value)
+                    self.table.setItem(row, column, item)
+        finally:
+            self.table.setUpdatesEnabled(True)
+        summary = f"Найдено групп: {len(self.groups)}, записей в них: {sum(len(g.entry_ids) for g in self.groups)}"
+        if len(self.groups) > len(shown):
+            summary += f". Показаны первые {len(shown)} групп"
+        self.summary_label.setText(summary)
+        self.remove_button.setEnabled(bool(shown))
+
+    def checked_ids(self) -> Set[int]:
+        return {self.table.item(row, 0).data(Qt.UserRole) for row in range(self.table.rowCount())
+                if self.table.item(row, 0).checkState() == Qt.Checked}
+
+    def remove(self):
+        shown = self.groups[:self.max_groups]
+        keep_ids = self.checked_ids()
+        count = len({entry_id for group in shown for entry_id in group.entry_ids} - keep_ids)
+        approval = QMessageBox(QMessageBox.Warning, "Удаление повторов",
+                               f"Будет удалено записей: не больше {count}. Продолжить?",
+                               QMessageBox.Yes | QMessageBox.No, self)
+        approval.setDefaultButton(QMessageBox.No)
+        approval.button(QMessageBox.Yes).setText("Да")
+        approval.button(QMessageBox.No).setText("Нет")
+        if approval.exec() != QMessageBox.Yes:
+            return
+        removed = remove_duplicates(connection, shown, keep_ids)
+        self.entries_removed.emit(removed)
+        self.search()
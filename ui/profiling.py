@@ -0,0 +1,111 @@
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView,
+    QPushButton, QTabWidget, QFileDialog, QPlainTextEdit, QAbstractItemView
+)
+
+from database.tracing import spans, tracer
+
+
+def _create_stats_table(headers: list) -> QTableWidget:
+    table = QTableWidget(0, len(headers))
+    table.setHorizontalHeaderLabels(headers)
+    table.verticalHeader().setVisible(False)
+    table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+    table.horizontalHeader().setStretchLastSection(True)
+    table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+    return table
+
+
+def _fill_table(table: QTableWidget, rows: list) -> None:
+    table.setRowCount(len(rows))
+    for row_index, row in enumerate(rows):
+        for column_index, value in enumerate(row):
+            text = f"{value:.2f}" if isinstance(value, float) else str(value)
+            table.setItem(row_index, column_index, QTableWidgetItem(text))
+
+
+class ProfilingWidget(QWidget):
+    """Панель с длительностью этапов работы приложения и статистикой SQL запросов"""
+
+    refresh_interval_ms = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Производительность")
+        self.resize(900, 500)
+
+        self.stages_table = _create_stats_table(["Этап", "Вызовов", "Последний, мс", "p50, мс", "p95, мс",
+                                                 "Макс, мс", "Всего, мс"])
+        self.sql_table = _create_stats_table(["Вызовов", "p50, мс", "p95, мс", "Всего, мс", "Строк", "Запрос"])
+        self.profile_output = QPlainTextEdit()
+        self.profile_output.setReadOnly(True)
+
+        tabs = QTabWidget()
+        tabs.addTab(self.stages_table, "Этапы")
+        tabs.addTab(self.sql_table, "SQL")
+        tabs.addTab(self.profile_output, "cProfile")
+
+        buttons_layout = QHBoxLayout()
+        for title, handler in [("Обновить", self.refresh), ("Сбросить", self.reset),
+                               ("Экспорт JSON...", self.export_json),
+                               ("Экспорт Chrome trace...", self.export_chrome_trace)]:
+            button = QPushButton(title)
+            button.clicked.connect(handler)
+            buttons_layout.addWidget(button)
+        self.profile_button = QPushButton("Начать запись cProfile")
+        self.profile_button.setCheckable(True)
+        self.profile_button.toggled.connect(self.toggle_profile)
+        buttons_layout.addWidget(self.profile_button)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(buttons_layout)
+        layout.addWidget(tabs)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start(self.refresh_interval_ms)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        _fill_table(self.stages_table, [
+            (stage["name"], stage["count"], stage["last"] / 1000, stage["p50"] / 1000, stage["p95"] / 1000,
+             stage["max"] / 1000, stage["total"] / 1000)
+            for stage in spans.summary()
+        ])
+        _fill_table(self.sql_table, [
+            (stats["latency_us"]["count"], stats["latency_us"]["p50"] / 1000, stats["latency_us"]["p95"] / 1000,
+             stats["latency_us"]["total"] / 1000, int(stats["rows"]["total"]), stats["shape"])
+            for stats in tracer.summary()
+        ])
+
+    def reset(self):
+        spans.reset()
+        tracer.reset()
+        self.refresh()
+
+    def export_json(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт статистики", "profile.json", "JSON (*.json)")
+        if path:
+            spans.export_json(path)
+
+    def export_chrome_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Экспорт Chrome trace", "trace.json", "JSON (*.json)")
+        if path:
+            spans.export_chrome_trace(path)
+
+    def toggle_profile(self, checked: bool):
+        if checked:
+            self.profile_button.setText("Остановить запись cProfile")
+            spans.start_profile()
+            return
+        self.profile_button.setText("Начать запись cProfile")
+        path, _ = QFileDialog.getSaveFileName(self, "Сохранить cProfile", "profile.prof", "cProfile (*.prof)")
+        self.profile_output.setPlainText(spans.stop_profile(path or None))
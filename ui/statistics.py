@@ -0,0 +1,83 @@
+from PyQt5.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem, QHeaderView, QPushButton, QComboBox,
+    QSpinBox, QLabel, QAbstractItemView
+)
+
+from database.tables import connection
+from database.tracing import span
+from modules.statistics import STATISTICS, count_distribution, count_totals, top_counts
+
+
+class StatisticsWidget(QWidget):
+    """
+    Количество записей по улицам, фамилиям и домам: наибольшие значения и распределение.
+
+    Данные читаются из таблиц счётчиков, поэтому время обновления не зависит от количества записей.
+    """
+    kinds = {"streets": "Улицы", "surnames": "Фамилии", "buildings": "Дома"}
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Статистика")
+        self.resize(800, 600)
+
+        self.kind_combobox = QComboBox()
+        for kind, title in self.kinds.items():
+            self.kind_combobox.addItem(title, kind)
+        self.kind_combobox.currentIndexChanged.connect(self.refresh)
+        self.limit_spinbox = QSpinBox()
+        self.limit_spinbox.setRange(1, 10_000)
+        self.limit_spinbox.setValue(20)
+        self.limit_spinbox.setPrefix("Первые ")
+        self.limit_spinbox.editingFinished.connect(self.refresh)
+        refresh_button = QPushButton("Обновить")
+        refresh_button.clicked.connect(self.refresh)
+        self.summary_label = QLabel()
+
+        self.top_table = self._create_table(["Значение", "Записей"])
+        self.distribution_table = self._create_table(["Записей", "Количество значений"])
+
+        controls_layout = QHBoxLayout()
+        controls_layout.addWidget(self.kind_combobox)
+        controls_layout.addWidget(self.limit_spinbox)
+        controls_layout.addWidget(refresh_button)
+        controls_layout.addStretch()
+        tables_layout = QHBoxLayout()
+        tables_layout.addWidget(self.top_table, 2)
+        tables_layout.addWidget(self.distribution_table, 1)
+        layout = QVBoxLayout(self)
+        layout.addLayout(controls_layout)
+        layout.addWidget(self.summary_label)
+        layout.addLayout(tables_layout)
+
+    @staticmethod
+    def _create_table(headers: list) -> QTableWidget:
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        table.horizontalHeader().setStretchLastSection(True)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        return table
+
+    @staticmethod
+    def _fill_table(table: QTableWidget, rows: list) -> None:
+        table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for column_index, value in enumerate(row):
+                table.setItem(row_index, column_index, QTableWidgetItem(str(value)))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def refresh(self):
+        kind = self.kind_combobox.currentData()
+        with span(f"ui.statistics.{kind}"):
+            groups, entries = count_totals(connection, kind)
+            self._fill_table(self.top_table, [(row.label, row.entry_count)
+                                              for row in top_counts(connection, kind, self.limit_spinbox.value())])
+            self._fill_table(self.distribution_table, [(row.entry_count, row.groups)
+                                                       for row in count_distribution(connection, kind)])
+        self.top_table.setHorizontalHeaderLabels(["Значение", STATISTICS[kind][0]])
+        self.summary_label.setText(f"{self.kind_combobox.currentText()}: {groups}, записей: {entries}")
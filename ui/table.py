@@ -1,37 +1,39 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 from PyQt5.QtCore import Qt, pyqtSignal, QPoint
-from PyQt5.QtWidgets import QStyledItemDelegate, QMenu, QTableWidgetItem
+from PyQt5.QtWidgets import (
+    QStyledItemDelegate, QMenu, QTableWidgetItem, QAction, QMessageBox, QProgressDialog, QApplication
+)
 from loguru import logger
 
-from database.tables import entries_table, names_table, surnames_table, patronymics_table, streets_table
+from database.phone import format_phone, normalize_phone
+from database.tracing import span
+from database.tables import entries_table, names_table, surnames_table, patronymics_table, streets_table, local_cache
 from ui.table_base import CRUDTableWidget
 
 
-from modules.generate import generate_entries
+from modules.generate import fill_database
+from modules.merge import find_similar_values, merge_values
 
 
 class PhoneNumberDelegate(QStyledItemDelegate):
-    def _format_phone(self, digits: str) -> str:
-        if len(digits) == 10:
-            return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
-        elif len(digits) == 11 and digits[0] in ("7", "8"):
-            prefix = "+7" if digits[0] == "7" else "8"
-            return f"{prefix} ({digits[1:4]}) {digits[4:7]}-{digits[7:9]} {digits[9:]}"
-        return digits
-
-    def displayText(self, value: str, locale: Any) -> str:
-        try:
-            digits = ''.join(filter(str.isdigit, value))
-            return self._format_phone(digits)
-        except Exception as e:
-            logger.error(f"Ошибка при обработке номера телефона: {str(e)}")
-            return value
+    """
+    Редактор номера телефона: введённый номер проверяется и приводится к E.164 до записи в таблицу.
+
+    Отформатированный текст номера хранится в ячейке (см. EntriesTableWidget.display_value),
+    поэтому при отрисовке номер не разбирается заново. Если номер не удаётся привести к E.164,
+    показывается сообщение, а значение ячейки не меняется.
+    """
 
     def setModelData(self, editor, model, index):
-        value = editor.text()
-        digits = ''.join(filter(str.isdigit, value))
-        model.setData(index, digits)
+        try:
+            phone = normalize_phone(editor.text())
+        except ValueError as e:
+            # Исключение из виртуального метода Qt не дошло бы до обработчика ошибок приложения
+            logger.warning(f"Номер телефона не изменён: {e}")
+            QMessageBox.warning(editor.window(), "Номер телефона", str(e))
+            return
+        model.setData(index, format_phone(phone))
 
 
 class EntriesTableWidget(CRUDTableWidget):
@@ -47,26 +49,9 @@ class EntriesTableWidget(CRUDTableWidget):
         self.horizontalHeader().setContextMenuPolicy(Qt.CustomContextMenu)
 
     def generate_entries_in_database(self, count: int):
-        entries = generate_entries(count)
-        names = [{"name": entry["name"]} for entry in entries]
-        surnames = [{"surname": entry["surname"]} for entry in entries]
-        patronymics = [{"patronymic": entry["patronymic"]} for entry in entries]
-        streets = [{"street": entry["street"]} for entry in entries]
-        name_ids = [value["name_id"] for value in names_table.create(names)]
-        surname_ids = [value["surname_id"] for value in surnames_table.create(surnames)]
-        patronymic_ids = [value["patronymic_id"] for value in patronymics_table.create(patronymics)]
-        street_ids = [value["street_id"] for value in streets_table.create(streets)]
-        for i, entry in enumerate(entries):
-            entry["name_id"] = name_ids[i]
-            entry["surname_id"] = surname_ids[i]
-            entry["patronymic_id"] = patronymic_ids[i]
-            entry["street_id"] = street_ids[i]
-            entry.pop("name")
-            entry.pop("surname")
-            entry.pop("patronymic")
-            entry.pop("street")
-        entries_table.create(entries)
-        self.load_data()
+        with span("generate_entries_in_database"):
+            fill_database(count, self.table.connection)
+            self.load_data()
 
     def _init_delegates(self) -> None:
         phone_column = self.get_column_by_db_name("phone")
@@ -75,8 +60,22 @@ class EntriesTableWidget(CRUDTableWidget):
         else:
             logger.warning("Не найдена колонка для отображения телефонных номеров")
 
-    def get_all_db(self) -> List[Dict[str, Any]]:
-        return self.table.get_all()
+    def display_value(self, db_column: str, db_value: Any) -> Any:
+        if db_column == "phone":
+            return format_phone(db_value)
+        return db_value
+
+    def get_page_db(self, order_by: Optional[str] = None, descending: bool = False, limit: int = 500,
+                    after: Optional[tuple] = None, search: Optional[str] = None,
+                    fuzzy: bool = False) -> Tuple[List[Dict[str, Any]], Optional[tuple]]:
+        # До синхронизации кеша первая страница показывается из снимка, без ожидания базы данных
+        if (local_cache is not None and not local_cache.synced and after is None and not search
+                and order_by in (None, self.table.primary_key) and local_cache.load()):
+            return local_cache.read_page(self.table, limit, after, descending)
+        return self.table.get_page(order_by, descending, limit, after, search, fuzzy)
+
+    def get_by_ids_db(self, target_ids: List[Any]) -> List[Dict[str, Any]]:
+        return self.table.get_by_ids(target_ids)
 
     def create_db(self, data: Dict[str, Any]) -> Dict[str, Any]:
         return self.table.create(data)
@@ -84,6 +83,9 @@ class EntriesTableWidget(CRUDTableWidget):
     def update_db(self, data: Dict[str, Any], target_id: str) -> Dict[str, Any]:
         return self.table.update(data, target_id)
 
+    def update_many_db(self, data: Dict[str, Any], target_ids: List[Any]) -> int:
+        return self.table.update_many(data, target_ids)
+
     def delete_db(self, target_id: str) -> None:
         self.table.delete(target_id)
 
@@ -112,12 +114,22 @@ class ParentTableWidget(CRUDTableWidget):
         
         super().__init__(
             columns_info=self.table.columns_info,
-            disabled_actions=["duplicate"]
+            # Значения родительских таблиц уникальны, одно значение нельзя записать в несколько строк
+            disabled_actions=["duplicate", "fill"]
         )
+        self.merge_action = QAction("Объединить похожие значения", self)
+        self.merge_action.triggered.connect(self.merge_similar_values)
+        self.addAction(self.merge_action)
+        self.context_actions.append(self.merge_action)
         self.load_data()
 
-    def get_all_db(self) -> List[Dict[str, Any]]:
-        return self.table.get_all()
+    def get_page_db(self, order_by: Optional[str] = None, descending: bool = False, limit: int = 500,
+                    after: Optional[tuple] = None, search: Optional[str] = None,
+                    fuzzy: bool = False) -> Tuple[List[Dict[str, Any]], Optional[tuple]]:
+        return self.table.get_page(order_by, descending, limit, after, search, fuzzy)
+
+    def get_by_ids_db(self, target_ids: List[Any]) -> List[Dict[str, Any]]:
+        return self.table.get_by_ids(target_ids)
 
     def create_db(self, data: Dict[str, Any]) -> Dict[str, Any]:
         result = self.table.create(data)
@@ -138,7 +150,7 @@ class ParentTableWidget(CRUDTableWidget):
         self.data_changed.emit(self.table_name, 'delete', str(target_id), '')
 
     def get_default_item_data(self) -> Dict[str, Any]:
-        return {self.columns[1]: "Значение"}
+        return {self.columns[1]: self.table.get_unused_value(self.columns[1], "Значение")}
 
     def _emit_data_changed(self, action: str, data: List[dict], target_id: str = None):
         """Отправляет сигнал об изменении данных в родительской таблице"""
@@ -149,3 +161,38 @@ class ParentTableWidget(CRUDTableWidget):
         new_value = item.text()
         super().item_updated(item)
         self.data_changed.emit(self.table_name, 'update', db_id, new_value)
+
+    def merge_similar_values(self) -> None:
+        """
+        Объединяет значения, отличающиеся только регистром, «ё», пробелами и знаками препинания,
+        и переносит на основное значение все ссылающиеся на них записи справочника.
+        """
+        merges = find_similar_values(self.table.connection, self.table_name)
+        count = sum(len(old_ids) for old_ids in merges.values())
+        if not count:
+            QMessageBox.information(self, "Объединение значений", "Похожих значений нет")
+            return
+        approval = QMessageBox(QMessageBox.Question, "Объединение значений",
+                               f"Будет объединено значений: {count} в {len(merges)} групп. Продолжить?",
+                               QMessageBox.Yes | QMessageBox.No, self)
+        approval.setDefaultButton(QMessageBox.No)
+        approval.button(QMessageBox.Yes).setText("Да")
+        approval.button(QMessageBox.No).setText("Нет")
+        if approval.exec() != QMessageBox.Yes:
+            return
+
+        dialog = QProgressDialog("Объединение значений", None, 0, count, self)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(0)
+
+        def update(done: int) -> None:
+            dialog.setValue(done)
+            QApplication.processEvents()
+
+        try:
+            with span(f"ui.{self.table_name}.merge"):
+                merge_values(self.table.connection, self.table_name, merges, update)
+        finally:
+            dialog.close()
+        self.load_data()
+        self.data_changed.emit(self.table_name, 'merge', '', '')
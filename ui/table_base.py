@@ -1,19 +1,25 @@
-from typing import List, Dict, Any, Optional
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Any, Optional, Tuple, Set
 
 from PyQt5.QtCore import Qt, QSortFilterProxyModel
-from PyQt5.QtGui import QKeySequence
+from PyQt5.QtGui import QKeySequence, QStandardItemModel, QStandardItem
 from PyQt5.QtWidgets import (
     QTableWidget, QHeaderView, QAbstractItemView,
     QTableWidgetItem, QMenu, QAction, QComboBox, QPushButton
 )
 from loguru import logger
 
-from database.tables import tables
+from database.changes import TableChanges
+from database.tables import tables, local_cache
+from database.tracing import span
 from schema.table import ColumnsInfo, ColumnInfo
 from ui.utils import SafeTableInserter
 
 
 class CRUDTableWidget(QTableWidget):
+    page_size = 500
+    fetch_threshold = 50
+
     def __init__(self, columns_info: ColumnsInfo, disabled_actions: List[str] = None):
         super().__init__()
         self.disabled_actions = disabled_actions or []
@@ -22,10 +28,22 @@ class CRUDTableWidget(QTableWidget):
         self.columns = [column.db_column for column in columns_info.columns]
         self.columns_info = columns_info
 
+        self.sort_column = self.columns[0]
+        self.sort_descending = False
+        self.loaded_rows = 0
+        self.page_after = None
+        self.has_more_rows = False
+        self.filter_text = ""
+        self.fuzzy_filter = False
+        self.combobox_models: Dict[str, Tuple[QStandardItemModel, Dict[Any, int]]] = {}
+
         self.verticalHeader().setVisible(False)
         self.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.setSortingEnabled(True)
-        self.sortByColumn(0, Qt.AscendingOrder)
+        self.horizontalHeader().setSectionsClickable(True)
+        self.horizontalHeader().setSortIndicatorShown(True)
+        self.horizontalHeader().setSortIndicator(0, Qt.AscendingOrder)
+        self.horizontalHeader().sortIndicatorChanged.connect(self.sort_by_column)
+        self.verticalScrollBar().valueChanged.connect(self.handle_scroll)
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
 
         self.mousePressEvent = self.handle_mouse_press
@@ -45,7 +63,14 @@ class CRUDTableWidget(QTableWidget):
         self.delete_action.setShortcut(QKeySequence(Qt.Key_Delete))
         self.addAction(self.delete_action)
 
-        actions = {"create": self.create_action, "duplicate": self.duplicate_action, "delete": self.delete_action}
+        self.fill_action = QAction("Заполнить выделенные строки значением ячейки", self)
+        self.fill_action.triggered.connect(self.fill_selection)
+        self.fill_action.setShortcut(QKeySequence("CTRL+RETURN"))
+        self.addAction(self.fill_action)
+
+        self.context_actions = [self.create_action, self.duplicate_action, self.delete_action, self.fill_action]
+        actions = {"create": self.create_action, "duplicate": self.duplicate_action, "delete": self.delete_action,
+                   "fill": self.fill_action}
         for name, action in actions.items():
             if name in self.disabled_actions:
                 action.setVisible(False)
@@ -72,13 +97,33 @@ class CRUDTableWidget(QTableWidget):
         id_column = column_info.parent_table.id_column
         data_column = column_info.parent_table.data_column
 
-        options = [(row[id_column], row[data_column]) for row in table.get_all()]
+        with span("load_combobox_options"):
+            rows = local_cache.read_all(table) if local_cache is not None and local_cache.load() else table.get_all()
+            options = [(row[id_column], row[data_column]) for row in rows]
 
         combobox_data = {
             "options": options
         }
         return combobox_data
 
+    def create_combobox_model(self, options: List[Tuple[Any, str]]) -> Tuple[QStandardItemModel, Dict[Any, int]]:
+        """
+        Общая модель выпадающих списков колонки: значения сортируются и копируются один раз,
+        а не для каждой ячейки.
+
+        Returns:
+            Модель и словарь ID значения -> номер строки модели
+        """
+        model = QStandardItemModel(self)
+        items, indexes = [], {}
+        for option_id, option_value in sorted(options, key=lambda x: x[1]):
+            item = QStandardItem(str(option_value))
+            item.setData(option_id, Qt.UserRole)
+            indexes[option_id] = len(items)
+            items.append(item)
+        model.invisibleRootItem().appendRows(items)
+        return model, indexes
+
     @property
     def action_name(self):
         if len(self.get_selected_rows()) == 1:
@@ -96,6 +141,7 @@ class CRUDTableWidget(QTableWidget):
         is_enabled = bool(self.get_selected_rows())
         self.duplicate_action.setEnabled(is_enabled)
         self.delete_action.setEnabled(is_enabled)
+        self.fill_action.setEnabled(len(self.get_selected_rows()) > 1)
 
     def handle_mouse_press(self, event):
         super().mousePressEvent(event)
@@ -107,9 +153,8 @@ class CRUDTableWidget(QTableWidget):
             return
 
         menu = QMenu()
-        menu.addAction(self.create_action)
-        menu.addAction(self.duplicate_action)
-        menu.addAction(self.delete_action)
+        for action in self.context_actions:
+            menu.addAction(action)
         menu.exec_(self.mapToGlobal(event.pos()))
 
     def item_updated(self, item):
@@ -138,55 +183,57 @@ class CRUDTableWidget(QTableWidget):
 
     def create_table_row_items(self, data: Dict[str, tuple | Any]) -> List[QTableWidgetItem | QComboBox]:
         items: List[Optional[QTableWidgetItem | QComboBox]] = [None] * self.columnCount()
-        headers = [self.horizontalHeaderItem(i) for i in range(self.columnCount())]
         for db_column, db_value in data.items():
             column_info = next((column for column in self.columns_info.columns if column.db_column == db_column), None)
-            header_index, target_header = next((i, header) for i, header in enumerate(headers) if header.data(Qt.UserRole)["db_column"] == db_column)
-            header_combobox_data = target_header.data(Qt.UserRole).get("combobox_data")
-            if header_combobox_data:
-                combobox = QComboBox()
-                options = header_combobox_data["options"]
-                for option_id, option_value in sorted(options, key=lambda x: x[1]):
-                    combobox.addItem(str(option_value), option_id)
-                combobox.setCurrentIndex(combobox.findData(db_value))
+            # Заголовки создаются в порядке self.columns, данные заголовков не читаются для каждой ячейки
+            header_index = self.columns.index(db_column)
+            combobox_model = self.combobox_models.get(db_column)
+            if combobox_model:
+                with span("create_combobox"):
+                    model, indexes = combobox_model
+                    combobox = QComboBox()
+                    # Ширина не подбирается по всем значениям модели при каждой вставке в таблицу
+                    combobox.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+                    combobox.setModel(model)
+                    combobox.setCurrentIndex(indexes.get(db_value, -1))
                 items[header_index] = combobox
             else:
                 items[header_index] = QTableWidgetItem()
-                items[header_index].setData(Qt.DisplayRole, db_value)
+                items[header_index].setData(Qt.DisplayRole, self.display_value(db_column, db_value))
             if not column_info.editable:
                 items[header_index].setFlags(items[header_index].flags() & ~Qt.ItemIsEditable)
 
         return items
 
-    def set_filter(self, filter_text: str):
-        filter_text = filter_text.strip().lower()
-        
-        for row in range(self.rowCount()):
-            should_hide = True
-            if filter_text:
-                for col in range(self.columnCount()):
-                    cell_widget = self.cellWidget(row, col)
-                    if cell_widget and isinstance(cell_widget, QComboBox):
-                        cell_text = cell_widget.currentText().lower()
-                    else:
-                        item = self.item(row, col)
-                        cell_text = item.text().lower() if item else ""
-                    
-                    if filter_text in cell_text:
-                        should_hide = False
-                        break
-            else:
-                should_hide = False
-            
-            self.setRowHidden(row, should_hide)
+    def display_value(self, db_column: str, db_value: Any) -> Any:
+        """Значение ячейки для отображения, вычисляется один раз при создании ячейки"""
+        return db_value
+
+    def set_filter(self, filter_text: str, fuzzy: bool = False):
+        """
+        Фильтрация выполняется запросом к БД, страницы загружаются заново с учётом фильтра
+
+        Args:
+            filter_text: Строка фильтра
+            fuzzy: Искать похожие значения (с опечатками, по звучанию) вместо подстроки
+        """
+        self.filter_text = filter_text.strip().lower()
+        self.fuzzy_filter = fuzzy
+        with span("set_filter"):
+            self.reload_rows()
 
     def _create_combobox_handler(self, combobox: QComboBox, item: QTableWidgetItem):
         return lambda: self.item_selected(combobox, item)
 
-    def create_table_row(self, data: Dict[str, tuple | Any]) -> int:
-        self.setRowCount(self.rowCount() + 1)
-        row = self.rowCount() - 1
+    def create_table_row(self, data: Dict[str, tuple | Any], row: Optional[int] = None) -> int:
+        """Добавляет строку таблицы в позицию row, по умолчанию - в конец"""
+        if row is None:
+            row = self.rowCount()
+        self.insertRow(row)
+        self.set_table_row(row, data)
+        return row
 
+    def set_table_row(self, row: int, data: Dict[str, tuple | Any]) -> None:
         with SafeTableInserter(self):
             for col, item in enumerate(self.create_table_row_items(data)):
                 if isinstance(item, QComboBox):
@@ -196,11 +243,16 @@ class CRUDTableWidget(QTableWidget):
                 else:
                     self.setItem(row, col, item)
 
-        return row
-
     def load_headers(self):
+        for model, _ in self.combobox_models.values():
+            model.deleteLater()
+        self.combobox_models = {}
         self.setColumnCount(len(self.headers))
         self.setHorizontalHeaderLabels(self.headers)
+        if local_cache is not None and local_cache.load():
+            # Кеш синхронизируется один раз на загрузку, а не при чтении каждой колонки с выпадающим списком
+            with span("local_cache.refresh"):
+                local_cache.refresh()
         for i, column_info in enumerate(self.columns_info.columns):
             header_item = self.horizontalHeaderItem(i)
             header_data = {
@@ -209,6 +261,8 @@ class CRUDTableWidget(QTableWidget):
             }
             if column_info.parent_table:
                 header_data["combobox_data"] = self.create_column_combobox_data(column_info)
+                self.combobox_models[column_info.db_column] = self.create_combobox_model(
+                    header_data["combobox_data"]["options"])
             header_item.setData(Qt.UserRole, header_data)
         logger.success("Загрузка данных заголовков завершена")
 
@@ -226,14 +280,51 @@ class CRUDTableWidget(QTableWidget):
 
     def load_data(self):
         logger.info("Загрузка данных...")
-        self.clear()
+        with span("load_data"):
+            self.clear()
+            self.setRowCount(0)
+            with span("load_headers"):
+                self.load_headers()
+            self.reload_rows()
+
+    def reload_rows(self):
+        """Загружает строки заново с первой страницы, не перезагружая заголовки"""
         self.setRowCount(0)
-        self.load_headers()
-
-        data = self.get_all_db()
-        for i, row in enumerate(data):
-            logger.debug(f"Загрузка данных записей {i + 1}/{len(data)}")
-            self.create_table_row(row)
+        self.loaded_rows = 0
+        self.page_after = None
+        self.has_more_rows = True
+        self.fetch_more()
+
+    def fetch_more(self):
+        """Загружает следующую страницу записей в текущем порядке сортировки"""
+        if not self.has_more_rows:
+            return
+        with span("fetch_more.query"):
+            data, self.page_after = self.get_page_db(order_by=self.sort_column, descending=self.sort_descending,
+                                                     limit=self.page_size, after=self.page_after,
+                                                     search=self.filter_text, fuzzy=self.fuzzy_filter)
+        with span("create_table_row"):
+            for row in data:
+                self.create_table_row(row)
+        logger.debug(f"Загружено записей: {self.loaded_rows + len(data)}")
+        self.loaded_rows += len(data)
+        self.has_more_rows = self.page_after is not None
+
+    def paintEvent(self, event):
+        with span("paint"):
+            super().paintEvent(event)
+
+    def handle_scroll(self, value: int):
+        scroll_bar = self.verticalScrollBar()
+        if self.has_more_rows and value >= scroll_bar.maximum() - self.fetch_threshold:
+            self.fetch_more()
+
+    def sort_by_column(self, column_index: int, order: Qt.SortOrder):
+        """Сортировка выполняется запросом к БД, после чего строки загружаются заново"""
+        self.sort_column = self.columns[column_index]
+        self.sort_descending = order == Qt.DescendingOrder
+        logger.info(f"Сортировка по колонке {self.sort_column}, по убыванию: {self.sort_descending}")
+        self.reload_rows()
 
     def create_item(self):
         try:
@@ -280,7 +371,161 @@ class CRUDTableWidget(QTableWidget):
             self.setUpdatesEnabled(True)
             self.viewport().update()
 
-    def get_all_db(self):
+    def fill_selection(self) -> None:
+        """
+        Записывает значение текущей ячейки в ту же колонку всех выделенных строк.
+
+        Строки обновляются одним запросом по списку ID (см. Base.update_many), а в таблице
+        заменяется только значение этой колонки, без перечитывания строк.
+        """
+        row, column = self.currentRow(), self.currentColumn()
+        rows = [selected for selected in self.get_selected_rows() if selected != row]
+        if row < 0 or column < 0 or not rows:
+            return
+        column_info = self.get_column_info(column)
+        if not column_info.editable:
+            logger.warning(f"Колонка {column_info.db_column} не редактируется")
+            return
+        combobox = self.cellWidget(row, column)
+        if isinstance(combobox, QComboBox):
+            db_value = combobox.currentData(Qt.UserRole)
+        else:
+            db_value = self.item(row, column).text().strip()
+        target_ids = [self.item(selected, 0).data(Qt.DisplayRole) for selected in rows]
+
+        with span("fill_selection"):
+            self.update_many_db({column_info.db_column: db_value}, target_ids)
+            self.setUpdatesEnabled(False)
+            try:
+                with SafeTableInserter(self):
+                    for selected in rows:
+                        cell_combobox = self.cellWidget(selected, column)
+                        if isinstance(cell_combobox, QComboBox):
+                            cell_combobox.blockSignals(True)
+                            cell_combobox.setCurrentIndex(combobox.currentIndex())
+                            cell_combobox.blockSignals(False)
+                        self.item(selected, column).setData(Qt.DisplayRole, self.item(row, column).data(Qt.DisplayRole))
+            finally:
+                self.setUpdatesEnabled(True)
+                self.viewport().update()
+        logger.debug(f"Заполнено строк: {len(rows)}")
+
+    def _loaded_ids(self) -> List[Any]:
+        return [self.item(row, 0).data(Qt.DisplayRole) for row in range(self.rowCount())]
+
+    def apply_changes(self, changes: TableChanges) -> None:
+        """
+        Применяет изменения строк, сделанные другими клиентами.
+
+        Изменённые строки перечитываются по ID и заменяются на месте, удалённые убираются из таблицы.
+        Новые строки при сортировке по ID вставляются на своё место среди загруженных или появятся
+        при подгрузке следующих страниц. Если порядок новых строк нельзя определить без запроса
+        (сортировка по другой колонке или фильтр), страницы загружаются заново.
+        """
+        if changes.reload or (changes.ids and self.filter_text):
+            self.reload_rows()
+            return
+        if not changes.ids:
+            return
+        with span("apply_changes"):
+            rows = {row[self.columns[0]]: row for row in self.get_by_ids_db(list(changes.ids))}
+            loaded_ids = self._loaded_ids()
+            positions = {row_id: row for row, row_id in enumerate(loaded_ids)}
+            inserted = sorted(row_id for row_id in rows if row_id not in positions)
+            if inserted and self.sort_column != self.columns[0]:
+                self.reload_rows()
+                return
+
+            self.setUpdatesEnabled(False)
+            try:
+                for row_id, row in positions.items():
+                    if row_id in rows:
+                        self.set_table_row(row, rows[row_id])
+                removed = sorted((row for row_id, row in positions.items()
+                                  if row_id in changes.ids and row_id not in rows), reverse=True)
+                with SafeTableInserter(self):
+                    for row in removed:
+                        self.removeRow(row)
+                self.loaded_rows -= len(removed)
+                self._insert_rows([rows[row_id] for row_id in inserted])
+            finally:
+                self.setUpdatesEnabled(True)
+                self.viewport().update()
+        logger.debug(f"Применены изменения других клиентов: {len(changes.ids)} строк")
+
+    def _insert_rows(self, rows: List[dict]) -> None:
+        """Вставляет новые строки на их место в порядке ID среди загруженных"""
+        keys = [-row_id if self.sort_descending else row_id for row_id in self._loaded_ids()]
+        for data in rows:
+            key = -data[self.columns[0]] if self.sort_descending else data[self.columns[0]]
+            if self.has_more_rows and keys and key > keys[-1]:
+                # Строка за пределами загруженных страниц будет получена вместе со следующей страницей
+                continue
+            position = bisect_left(keys, key)
+            keys.insert(position, key)
+            self.create_table_row(data, position)
+            self.loaded_rows += 1
+
+    def apply_lookup_changes(self, table_name: str, changes: TableChanges) -> None:
+        """
+        Обновляет выпадающие списки колонок, ссылающихся на родительскую таблицу table_name.
+
+        Переименованные значения меняются в общей модели списков, новые вставляются в порядке сортировки,
+        удалённые убираются. Строки таблицы не перезагружаются.
+        """
+        columns = [column for column in self.columns_info.columns
+                   if column.parent_table and column.parent_table.table_name == table_name
+                   and column.db_column in self.combobox_models]
+        if not columns or not (changes.ids or changes.reload):
+            return
+        if changes.reload:
+            self.load_data()
+            return
+        with span("apply_lookup_changes"):
+            rows = tables[table_name].get_by_ids(list(changes.ids))
+            for column_info in columns:
+                parent = column_info.parent_table
+                values = {row[parent.id_column]: str(row[parent.data_column]) for row in rows}
+                self._patch_combobox_model(column_info.db_column, changes.ids, values)
+
+    def _patch_combobox_model(self, db_column: str, changed_ids: Set[Any], values: Dict[Any, str]) -> None:
+        model, indexes = self.combobox_models[db_column]
+        column = self.columns.index(db_column)
+        comboboxes = [self.cellWidget(row, column) for row in range(self.rowCount())]
+        # Вставка и удаление строк модели сдвигают индексы выпадающих списков,
+        # их сигналы блокируются, чтобы не записывать в базу прежние значения
+        for combobox in comboboxes:
+            combobox.blockSignals(True)
+        try:
+            renamed = {option_id for option_id in changed_ids if option_id in indexes and option_id in values}
+            for option_id in renamed:
+                model.item(indexes[option_id]).setText(values[option_id])
+            for index in sorted((indexes[option_id] for option_id in changed_ids
+                                 if option_id in indexes and option_id not in values), reverse=True):
+                model.removeRow(index)
+            texts = [model.item(index).text() for index in range(model.rowCount())]
+            for option_id in sorted(set(values) - set(indexes), key=values.get):
+                item = QStandardItem(values[option_id])
+                item.setData(option_id, Qt.UserRole)
+                position = bisect_right(texts, values[option_id])
+                texts.insert(position, values[option_id])
+                model.insertRow(position, item)
+        finally:
+            for combobox in comboboxes:
+                combobox.blockSignals(False)
+        self.combobox_models[db_column] = (
+            model, {model.item(index).data(Qt.UserRole): index for index in range(model.rowCount())})
+        with SafeTableInserter(self):
+            for row, combobox in enumerate(comboboxes):
+                if combobox.currentData(Qt.UserRole) in renamed:
+                    self.item(row, column).setText(combobox.currentText())
+
+    def get_by_ids_db(self, target_ids: List[Any]) -> List[dict]:
+        raise NotImplementedError
+
+    def get_page_db(self, order_by: Optional[str] = None, descending: bool = False, limit: int = 500,
+                    after: Optional[tuple] = None, search: Optional[str] = None,
+                    fuzzy: bool = False) -> Tuple[List[dict], Optional[tuple]]:
         raise NotImplementedError
 
     def create_db(self, data: List[dict]):
@@ -292,6 +537,9 @@ class CRUDTableWidget(QTableWidget):
     def delete_db(self, target_ids: List[str]):
         raise NotImplementedError
 
+    def update_many_db(self, data: dict, target_ids: List[Any]) -> int:
+        raise NotImplementedError
+
     def duplicate_db(self, item_id: List[str]):
         raise NotImplementedError
 